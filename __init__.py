@@ -19,8 +19,21 @@
 #   3) Explicitly states which classes and functions in PyPL2 are meant to be public 
 #      parts of the API.
 
-from .pypl2lib import PL2FileInfo, PL2AnalogChannelInfo, PL2SpikeChannelInfo, PL2DigitalChannelInfo, PyPL2FileReader
-from .pypl2api import pl2_ad, pl2_spikes, pl2_events, pl2_info
+from .pypl2lib import (PL2FileInfo, PL2AnalogChannelInfo, PL2SpikeChannelInfo, PL2DigitalChannelInfo, PL2BlockInfo,
+                       PyPL2FileReader)
+from .pypl2lib import PL2_START, PL2_STOP, PL2_PAUSE, PL2_RESUME
+from .pypl2native import PyPL2NativeFileReader
+from .pypl2api import (PL2File, PL2FilePool, ScaledArray, TimeIndex, pl2_ad, pl2_ad_multi, pl2_spikes, pl2_events,
+                       pl2_info)
+from .pypl2api import Epochs, pl2_start_stop, pl2_epochs
+from .pypl2parallel import pl2_read_parallel
+from .pypl2export import pl2_export_hdf5, pl2_export_parquet
+from .pypl2psth import psth, raster
+from .pypl2async import (AsyncPL2File, pl2_ad_async, pl2_ad_multi_async, pl2_spikes_async, pl2_events_async,
+                         pl2_info_async)
+from .pypl2batch import pl2_batch
+from .pypl2bench import write_synthetic_pl2, run_benchmarks
+from .pypl2trace import enable_tracing, disable_tracing, trace_stats, reset_trace_stats, profile, load_trace
 
 __author__ = 'Chris Heydrick (chris@plexon.com)'
 __version__ = '1.1.0'
@@ -8,8 +8,14 @@
 # You are free to modify or share this file, provided that the above
 # copyright notice is kept intact.
 
-from collections import namedtuple
+from collections import OrderedDict, namedtuple
+import contextlib
+import os
+import threading
+from numpy.lib.mixins import NDArrayOperatorsMixin
 from pypl2lib import *
+from pypl2lib import _decimation_factor
+from pypl2trace import span
 
 
 def print_error(pypl2_file_reader_instance):
@@ -18,24 +24,891 @@ def print_error(pypl2_file_reader_instance):
     print(error_message.value)
 
 
-def pl2_ad(filename, channel):
+# Named tuples returned by the functions below
+PL2Ad = namedtuple('PL2Ad', 'adfrequency n timestamps fragmentcounts ad')
+PL2Spikes = namedtuple('PL2Spikes', 'n timestamps units waveforms')
+PL2DigitalEvents = namedtuple('PL2DigitalEvents', 'n timestamps values')
+PL2StartStopEvents = namedtuple('PL2StartStopEvents', 'n timestamps values')
+PL2Info = namedtuple('PL2Info', 'spikes events ad')
+spike_info = namedtuple('spike_info', 'channel name units')
+event_info = namedtuple('event_info', 'channel name n')
+ad_info = namedtuple('ad_info', 'channel name n')
+
+
+class ScaledArray(NDArrayOperatorsMixin):
+    """
+    Raw int16 a/d values together with the coefficient that converts them to
+    units. The values are converted only when they are used: when indexing or
+    slicing, in NumPy functions and arithmetic, or with np.asarray(). Only the
+    selected values are converted when slicing, so a part of a large channel
+    can be read in units without converting the whole channel.
+
+        >>>res = pl2_ad('data/file.pl2', 0)
+        >>>res.ad[:1000]      # first 1000 values in volts
+        >>>res.ad.raw         # int16 a/d values
+        >>>res.ad.coeff       # coefficient to convert them to volts
+
+    The common ndarray methods are available too. reshape, ravel, transpose,
+    squeeze and T return ScaledArrays of the rearranged raw values, the other
+    methods, e.g. mean, std, sum, min, max or tolist, convert the values and
+    call the ndarray method. np.asarray(res.ad) converts the values for code
+    that needs an ndarray, e.g. C extensions.
+
+    Args:
+        raw - int16 array of a/d values
+        coeff - coefficient to convert the values to units, or an array of
+                coefficients that broadcasts to raw, e.g. one per row
+        dtype - floating point type of converted values, float64 by default
+    """
+
+    def __init__(self, raw, coeff, dtype=np.float64):
+        self.raw = raw
+        self.coeff = coeff
+        self.dtype = np.dtype(dtype)
+
+    @property
+    def shape(self):
+        return self.raw.shape
+
+    @property
+    def ndim(self):
+        return self.raw.ndim
+
+    @property
+    def size(self):
+        return self.raw.size
+
+    def __len__(self):
+        return len(self.raw)
+
+    def __repr__(self):
+        return f'ScaledArray(raw={self.raw!r}, coeff={self.coeff!r})'
+
+    def __getitem__(self, key):
+        coeff = np.broadcast_to(self.coeff, self.raw.shape)[key] if np.ndim(self.coeff) else self.coeff
+        return np.multiply(self.raw[key], coeff, dtype=self.dtype)
+
+    def __array__(self, dtype=None, copy=None):
+        values = np.multiply(self.raw, self.coeff, dtype=self.dtype)
+        return values if dtype is None else values.astype(dtype, copy=False)
+
+    def __array_ufunc__(self, ufunc, method, *inputs, **kwargs):
+        inputs = tuple(np.asarray(x) if isinstance(x, ScaledArray) else x for x in inputs)
+        return getattr(ufunc, method)(*inputs, **kwargs)
+
+    def astype(self, dtype):
+        return np.asarray(self, dtype=dtype)
+
+    def _rearranged(self, name, *args, **kwargs):
+        # raw values with a scalar coefficient are rearranged without
+        # converting them, per value coefficients would have to be
+        # rearranged along with them, so those values are converted
+        if np.ndim(self.coeff):
+            return getattr(np.asarray(self), name)(*args, **kwargs)
+        return ScaledArray(getattr(self.raw, name)(*args, **kwargs), self.coeff, self.dtype)
+
+    def reshape(self, *args, **kwargs):
+        return self._rearranged('reshape', *args, **kwargs)
+
+    def ravel(self, *args, **kwargs):
+        return self._rearranged('ravel', *args, **kwargs)
+
+    def transpose(self, *args):
+        return self._rearranged('transpose', *args)
+
+    def squeeze(self, *args, **kwargs):
+        return self._rearranged('squeeze', *args, **kwargs)
+
+    @property
+    def T(self):
+        return self.transpose()
+
+
+def _converting_method(name):
+    def method(self, *args, **kwargs):
+        return getattr(np.asarray(self), name)(*args, **kwargs)
+    method.__name__ = name
+    method.__doc__ = f'numpy.ndarray.{name} of the values converted to units'
+    return method
+
+
+for _name in ('all', 'any', 'argmax', 'argmin', 'argsort', 'clip', 'copy', 'cumsum', 'dot', 'flatten', 'max',
+              'mean', 'min', 'nonzero', 'prod', 'round', 'std', 'sum', 'take', 'tobytes', 'tolist', 'var'):
+    setattr(ScaledArray, _name, _converting_method(_name))
+del _name
+
+
+class TimeIndex:
+    """
+    Maps the values of a continuous channel to their times and back, from the
+    fragment start times and fragment lengths returned by pl2_ad. Gaps
+    between fragments, e.g. from paused recordings, are taken into account.
+    Lookups search the fragments with a binary search, and times are only
+    computed for the requested values, so no time array as large as the data
+    is needed.
+
+        >>>res = pl2_ad('data/file.pl2', 0)
+        >>>index = TimeIndex.from_ad(res)
+        >>>index[:1000]                       # times of the first 1000 values
+        >>>res.ad[index.slice(10.0, 20.0)]    # values from 10 s up to 20 s
+
+    Args:
+        timestamps - fragment start times in seconds
+        fragment_counts - number of values in each fragment
+        adfrequency - sampling rate in samples per second
+    """
+
+    def __init__(self, timestamps, fragment_counts, adfrequency):
+        self.timestamps = np.asarray(timestamps, dtype=np.float64).ravel()
+        self.fragment_counts = np.asarray(fragment_counts, dtype=np.int64).ravel()
+        self.adfrequency = adfrequency
+        if len(self.timestamps) != len(self.fragment_counts):
+            raise ValueError('timestamps and fragment_counts must have the same length')
+        # index of the first value of each fragment
+        self.fragment_starts = np.cumsum(self.fragment_counts) - self.fragment_counts
+        self.n = int(self.fragment_counts.sum())
+
+    @classmethod
+    def from_ad(cls, ad):
+        """
+        Creates the time index of a PL2Ad named tuple returned by pl2_ad or
+        pl2_ad_multi.
+        """
+        return cls(ad.timestamps, ad.fragmentcounts, ad.adfrequency)
+
+    def __len__(self):
+        return self.n
+
+    def __repr__(self):
+        return f'TimeIndex(n={self.n}, fragments={len(self.fragment_counts)}, adfrequency={self.adfrequency!r})'
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            key = range(self.n)[key]
+            return self.sample_to_time(np.arange(key.start, key.stop, key.step))
+        return self.sample_to_time(key)
+
+    def __array__(self, dtype=None, copy=None):
+        times = self.sample_to_time(np.arange(self.n))
+        return times if dtype is None else times.astype(dtype, copy=False)
+
+    def fragment(self, samples):
+        """
+        Returns the zero-based fragment index of the values with the given
+        indices.
+        """
+        samples = np.asarray(samples)
+        if np.any((samples < 0) | (samples >= self.n)):
+            raise IndexError(f'Value index out of range for {self.n} values')
+        return np.searchsorted(self.fragment_starts, samples, side='right') - 1
+
+    def sample_to_time(self, samples):
+        """
+        Returns the times in seconds of the values with the given zero-based
+        indices. Negative indices count from the end.
+
+        Args:
+            samples - value index or array of value indices
+
+        Returns:
+            time or float64 array of times
+        """
+        samples = np.asarray(samples, dtype=np.int64)
+        samples = np.where(samples < 0, samples + self.n, samples)
+        fragments = self.fragment(samples)
+        return self.timestamps[fragments] + (samples - self.fragment_starts[fragments]) / self.adfrequency
+
+    def time_to_sample(self, times):
+        """
+        Returns the index of the first value at or after each of the given
+        times. Times in a gap between fragments map to the first value of the
+        next fragment, times after the last value to the number of values.
+
+        Args:
+            times - time in seconds or array of times
+
+        Returns:
+            value index or int64 array of value indices
+        """
+        times = np.asarray(times, dtype=np.float64)
+        if not self.n:
+            samples = np.zeros(times.shape, dtype=np.int64)
+            return samples if samples.ndim else 0
+        fragments = np.searchsorted(self.timestamps, times, side='right') - 1
+        before_first = fragments < 0
+        fragments = np.maximum(fragments, 0)
+        # the small tolerance keeps times that are exactly on a value from
+        # being rounded up to the next one
+        offsets = np.ceil((times - self.timestamps[fragments]) * self.adfrequency - 1e-6)
+        offsets = np.clip(offsets, 0, self.fragment_counts[fragments]).astype(np.int64)
+        samples = np.where(before_first, 0, self.fragment_starts[fragments] + offsets)
+        return samples if samples.ndim else int(samples)
+
+    def slice(self, start=None, stop=None):
+        """
+        Returns the slice of the values from time start up to time stop
+        (exclusive), for indexing the values returned by pl2_ad.
+
+        Args:
+            start - optional time in seconds, defaults to the first value
+            stop - optional time in seconds, defaults to after the last value
+        """
+        return slice(0 if start is None else self.time_to_sample(start),
+                     self.n if stop is None else self.time_to_sample(stop))
+
+
+class Epochs:
+    """
+    Recorded segments of a file as sorted, non-overlapping [start, stop)
+    intervals in seconds, built from the events of the start/stop channel:
+    recording runs from a start or resume event up to the next pause or stop
+    event. Timestamps are looked up with a binary search over the intervals,
+    so masks and slices of long timestamp arrays take a single vectorized
+    call.
+
+        >>>epochs = pl2_epochs('data/file.pl2')
+        >>>spikes = pl2_spikes('data/file.pl2', 0)
+        >>>spikes.timestamps[epochs.mask(spikes.timestamps)]
+        >>>epochs.restrict(spikes)          # PL2Spikes of the recorded segments only
+        >>>epochs.restrict(pl2_ad('data/file.pl2', 0))
+
+    Args:
+        starts - interval start times in seconds
+        stops - interval stop times in seconds. Overlapping or touching
+                intervals are merged.
+    """
+
+    def __init__(self, starts, stops):
+        starts = np.asarray(starts, dtype=np.float64).ravel()
+        stops = np.asarray(stops, dtype=np.float64).ravel()
+        if len(starts) != len(stops):
+            raise ValueError('starts and stops must have the same length')
+        if np.any(stops < starts):
+            raise ValueError('stops must not be before starts')
+
+        order = np.argsort(starts, kind='stable')
+        starts, stops = starts[order], stops[order]
+        # an interval starts a new merged interval if it begins after all
+        # intervals before it ended
+        ends_before = np.maximum.accumulate(stops)
+        first = np.ones(len(starts), dtype=bool)
+        first[1:] = starts[1:] > ends_before[:-1]
+        self.starts = starts[first]
+        self.stops = np.maximum.reduceat(stops, np.flatnonzero(first)) if len(stops) else stops
+
+    @classmethod
+    def from_events(cls, timestamps, values, end=np.inf):
+        """
+        Creates the epochs of start/stop channel events.
+
+        Args:
+            timestamps - event times in seconds
+            values - event types, PL2_START, PL2_STOP, PL2_PAUSE or PL2_RESUME
+            end - stop time of a segment that is still recording after the last
+                  event, e.g. the end of the recording
+
+        Returns:
+            Epochs
+        """
+        timestamps = np.asarray(timestamps, dtype=np.float64).ravel()
+        values = np.asarray(values).ravel()
+        order = np.argsort(timestamps, kind='stable')
+        timestamps, values = timestamps[order], values[order]
+
+        # recording state after each event, and whether it changed
+        recording = np.isin(values, (PL2_START, PL2_RESUME))
+        before = np.concatenate(([False], recording[:-1]))
+        starts = timestamps[recording & ~before]
+        stops = timestamps[~recording & before]
+        if len(recording) and recording[-1]:
+            stops = np.append(stops, max(end, timestamps[-1]))
+        return cls(starts, stops)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __repr__(self):
+        return f'Epochs(n={len(self)}, duration={self.duration!r})'
+
+    def __iter__(self):
+        return zip(self.starts.tolist(), self.stops.tolist())
+
+    @property
+    def duration(self):
+        """
+        Total recorded time in seconds.
+        """
+        return float(np.sum(self.stops - self.starts))
+
+    def index(self, times):
+        """
+        Returns the zero-based index of the epoch containing each of the given
+        times, or -1 for times outside all epochs.
+        """
+        times = np.asarray(times, dtype=np.float64)
+        if not len(self):
+            return np.full(times.shape, -1, dtype=np.int64)
+        epochs = np.searchsorted(self.starts, times, side='right') - 1
+        inside = (epochs >= 0) & (times < self.stops[np.maximum(epochs, 0)])
+        return np.where(inside, epochs, -1)
+
+    def mask(self, times):
+        """
+        Returns a boolean array that is True for the times within an epoch,
+        e.g. for indexing spike or event timestamps.
+        """
+        return self.index(times) >= 0
+
+    def slices(self, times):
+        """
+        Returns one slice per epoch of the sorted times that fall into it.
+
+        Args:
+            times - sorted times in seconds, e.g. spike or event timestamps
+
+        Returns:
+            list of slices
+        """
+        first = np.searchsorted(times, self.starts, side='left')
+        last = np.searchsorted(times, self.stops, side='left')
+        return [slice(a, b) for a, b in zip(first.tolist(), last.tolist())]
+
+    def sample_slices(self, ad):
+        """
+        Returns one slice per epoch of the continuous values recorded in it.
+
+        Args:
+            ad - PL2Ad named tuple returned by pl2_ad or pl2_ad_multi, or its TimeIndex
+
+        Returns:
+            list of slices, for indexing the last axis of ad.ad
+        """
+        first, last = self._sample_bounds(ad)
+        return [slice(a, b) for a, b in zip(first.tolist(), last.tolist())]
+
+    def sample_mask(self, ad):
+        """
+        Returns a boolean array that is True for the continuous values recorded
+        within an epoch.
+
+        Args:
+            ad - PL2Ad named tuple returned by pl2_ad or pl2_ad_multi, or its TimeIndex
+        """
+        index = ad if isinstance(ad, TimeIndex) else TimeIndex.from_ad(ad)
+        first, last = self._sample_bounds(index)
+        # +1 at the first and -1 after the last value of each epoch
+        changes = np.zeros(len(index) + 1, dtype=np.int64)
+        np.add.at(changes, first, 1)
+        np.add.at(changes, last, -1)
+        return np.cumsum(changes[:-1]) > 0
+
+    def _sample_bounds(self, ad):
+        """
+        Returns the indices of the first value of each epoch and of the value
+        after its last one.
+        """
+        index = ad if isinstance(ad, TimeIndex) else TimeIndex.from_ad(ad)
+        return (np.atleast_1d(index.time_to_sample(self.starts)),
+                np.atleast_1d(index.time_to_sample(self.stops)))
+
+    def restrict(self, res):
+        """
+        Keeps only the data recorded within the epochs.
+
+        Args:
+            res - PL2Ad, PL2Spikes or PL2DigitalEvents named tuple
+
+        Returns:
+            named tuple of the same type. Continuous values get one fragment
+            per part of a fragment within an epoch.
+        """
+        if isinstance(res, PL2Spikes):
+            keep = self.mask(res.timestamps)
+            if res.waveforms is None:
+                # n stays the size the waveforms would have
+                samples_per_spike = res.n // len(res.timestamps) if len(res.timestamps) else 0
+                return PL2Spikes(int(np.count_nonzero(keep)) * samples_per_spike, res.timestamps[keep],
+                                 res.units[keep], None)
+            waveforms = _compress(res.waveforms, keep, axis=0)
+            return PL2Spikes(waveforms.size, res.timestamps[keep], res.units[keep], waveforms)
+        if isinstance(res, PL2DigitalEvents):
+            keep = self.mask(res.timestamps)
+            return PL2DigitalEvents(int(np.count_nonzero(keep)), res.timestamps[keep], res.values[keep])
+        if isinstance(res, PL2Ad):
+            return self._restrict_ad(res)
+        raise ValueError(f'Expected a PL2Ad, PL2Spikes or PL2DigitalEvents named tuple, got {type(res).__name__}')
+
+    def _restrict_ad(self, res):
+        index = TimeIndex.from_ad(res)
+        keep = self.sample_mask(index)
+
+        # the values between consecutive fragment or epoch boundaries are
+        # either all kept or all dropped
+        bounds = np.unique(np.concatenate((index.fragment_starts, *self._sample_bounds(index))))
+        bounds = bounds[bounds < index.n]
+        kept = keep[bounds]
+        # kept parts only continue the fragment of the part before if it was
+        # kept too and they are in the same fragment
+        continues = np.concatenate(([False], kept[:-1])) & ~np.isin(bounds, index.fragment_starts)
+        new_fragment = kept & ~continues
+        part_counts = np.diff(np.append(bounds, index.n))
+        fragment_ids = np.cumsum(new_fragment) - 1
+
+        fragment_starts = bounds[new_fragment]
+        fragment_counts = np.bincount(fragment_ids[kept], weights=part_counts[kept],
+                                      minlength=len(fragment_starts)).astype(np.int64)
+        timestamps = index.sample_to_time(fragment_starts) if len(fragment_starts) else np.zeros(0)
+        return PL2Ad(res.adfrequency, int(fragment_counts.sum()), timestamps, fragment_counts,
+                     _compress(res.ad, keep, axis=-1))
+
+
+def _compress(values, keep, axis):
+    """
+    Selects the values along axis where keep is True, keeping ScaledArrays
+    unconverted.
+    """
+    if isinstance(values, ScaledArray):
+        return ScaledArray(np.compress(keep, values.raw, axis=axis), values.coeff, values.dtype)
+    return np.compress(keep, values, axis=axis)
+
+
+def _scale(values, coeff, dtype):
+    """
+    Converts raw a/d values to units according to the dtype option of the
+    functions below: 'raw' defers the conversion with a ScaledArray, a
+    floating point type converts right away.
+    """
+    if isinstance(dtype, str) and dtype == 'raw':
+        return ScaledArray(values, coeff)
+    return np.multiply(values, coeff, dtype=dtype)
+
+
+class PL2File:
+    def __init__(self, filename, backend='dll', **reader_options):
+        """
+        Keeps a .pl2 file open and caches its file and channel information, so
+        that reading many channels costs a single open. Can be used as a
+        context manager:
+
+            >>>with PL2File('data/file.pl2') as f:
+            >>>    ad = [f.ad(channel) for channel in range(4)]
+
+        Args:
+            filename - full path of the file
+            backend - 'dll' (default) reads the file through PL2FileReader.dll, 'native'
+                      parses it directly with NumPy
+            reader_options - further keyword arguments for PyPL2FileReader,
+                             e.g. memory_map=True for the native backend
+        """
+
+        self.filename = filename
+        self.reader = PyPL2FileReader(backend=backend, **reader_options)
+        self.reader.pl2_open_file(filename)
+
+        self.file_info = self.reader.pl2_file_info
+        if self.file_info is None:
+            raise IOError(f"Error: Can't open {filename}")
+
+        self.analog_channel_infos = [self.reader.pl2_get_analog_channel_info(i)
+                                     for i in range(self.file_info.m_TotalNumberOfAnalogChannels)]
+        self.spike_channel_infos = [self.reader.pl2_get_spike_channel_info(i)
+                                    for i in range(self.file_info.m_TotalNumberOfSpikeChannels)]
+        self.digital_channel_infos = [self.reader.pl2_get_digital_channel_info(i)
+                                      for i in range(self.file_info.m_NumberOfDigitalChannels)]
+
+        self._analog_channel_indices = {info.m_Name: i for i, info in enumerate(self.analog_channel_infos)}
+        self._spike_channel_indices = {info.m_Name: i for i, info in enumerate(self.spike_channel_infos)}
+        self._digital_channel_indices = {info.m_Name: i for i, info in enumerate(self.digital_channel_infos)}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """
+        Closes the file. Cached file and channel information stays available.
+        """
+        if self.reader is not None:
+            self.reader.pl2_close_file()
+            self.reader = None
+
+    @staticmethod
+    def _get_channel_index(channel, channel_indices, channel_type):
+        if type(channel) in (str, bytes):
+            if hasattr(channel, 'encode'):
+                channel = channel.encode('ascii')
+            if channel not in channel_indices:
+                raise KeyError(f'No {channel_type} channel named {channel.decode("ascii")}')
+            return channel_indices[channel]
+        return channel
+
+    def ad(self, channel, start=None, stop=None, dtype='raw', decimate=None, target_rate=None):
+        """
+        Reads continuous data of a channel, see pl2_ad.
+
+        Args:
+            channel - zero-based channel index, or channel name
+            start - optional time in seconds of the first value to read
+            stop - optional time in seconds up to which (exclusive) values are read
+            dtype - 'raw' (default), np.float32 or np.float64, see pl2_ad
+            decimate - optional decimation factor, see pl2_ad
+            target_rate - optional sampling rate after decimation, see pl2_ad
+
+        Returns:
+            PL2Ad named tuple
+        """
+
+        channel = self._get_channel_index(channel, self._analog_channel_indices, 'analog')
+        achannel_info = self.analog_channel_infos[channel]
+
+        if decimate is not None or target_rate is not None:
+            return self._ad_decimated(channel, start, stop, dtype, decimate, target_rate)
+
+        with span('PL2File.ad', channel) as read:
+            if start is not None or stop is not None:
+                res = self.reader.pl2_get_analog_channel_data_subset_by_time(channel, start, stop)
+            else:
+                res = self.reader.pl2_get_analog_channel_data(channel)
+            if res is None:
+                raise IOError(f"Error: Can't read analog channel {channel} of {self.filename}")
+            fragment_timestamps, fragment_counts, values = res
+            values = to_array(values)
+            read.nbytes = values.nbytes
+
+            with span('PL2File.ad/convert', channel):
+                return PL2Ad(achannel_info.m_SamplesPerSecond,
+                             len(values),
+                             to_array_nonzero(fragment_timestamps) / self.file_info.m_TimestampFrequency,
+                             to_array_nonzero(fragment_counts),
+                             _scale(values, achannel_info.m_CoeffToConvertToUnits, dtype))
+
+    def _ad_decimated(self, channel, start, stop, dtype, decimate, target_rate):
+        achannel_info = self.analog_channel_infos[channel]
+        factor = _decimation_factor(achannel_info.m_SamplesPerSecond, decimate, target_rate)
+
+        with span('PL2File.ad/decimate', channel) as read:
+            res = self.reader.pl2_get_analog_channel_data_decimated(channel, factor, start=start, stop=stop)
+            if res is None:
+                raise IOError(f"Error: Can't read analog channel {channel} of {self.filename}")
+            fragment_timestamps, fragment_counts, values = res
+            read.nbytes = values.nbytes
+
+            return PL2Ad(achannel_info.m_SamplesPerSecond / factor,
+                         len(values),
+                         fragment_timestamps / self.file_info.m_TimestampFrequency,
+                         fragment_counts,
+                         _scale(values, achannel_info.m_CoeffToConvertToUnits, dtype))
+
+    def ad_multi(self, channels, dtype='raw'):
+        """
+        Reads continuous data of several channels into one array, see pl2_ad_multi.
+
+        Args:
+            channels - sequence of zero-based channel indices and/or channel names,
+                       or a (source_id, one_based_channel_indices_in_source) tuple
+            dtype - 'raw' (default), np.float32 or np.float64, see pl2_ad_multi
+
+        Returns:
+            PL2Ad named tuple, ad is a (channels, n) array
+        """
+
+        indices = self.reader._get_analog_channel_indices(channels)
+        if indices is None:
+            raise KeyError(f'No analog channels {channels!r} in {self.filename}')
+        raw = isinstance(dtype, str) and dtype == 'raw'
+        with span('PL2File.ad_multi', indices) as read:
+            res = self.reader.pl2_get_analog_channels_data(indices, dtype=np.int16 if raw else dtype)
+            if res is None:
+                raise IOError(f"Error: Can't read analog channels {indices} of {self.filename}")
+            fragment_timestamps, fragment_counts, values = res
+            read.nbytes = values.nbytes
+
+            with span('PL2File.ad_multi/convert', indices):
+                if raw:
+                    coeffs = np.array([[self.analog_channel_infos[i].m_CoeffToConvertToUnits] for i in indices])
+                    values = ScaledArray(values, coeffs)
+
+                return PL2Ad(self.analog_channel_infos[indices[0]].m_SamplesPerSecond,
+                             values.shape[1],
+                             to_array_nonzero(fragment_timestamps) / self.file_info.m_TimestampFrequency,
+                             to_array_nonzero(fragment_counts),
+                             values)
+
+    def spikes(self, channel, unit=[], dtype='raw', waveforms=True):
+        """
+        Reads spike data of a channel, see pl2_spikes.
+
+        Args:
+            channel - zero-based channel index, or channel name
+            unit - unit number or sequence of unit numbers to read, see pl2_spikes
+            dtype - 'raw' (default), np.float32 or np.float64, see pl2_spikes
+            waveforms - if False, only timestamps and units are read, see pl2_spikes
+
+        Returns:
+            PL2Spikes named tuple
+        """
+
+        channel = self._get_channel_index(channel, self._spike_channel_indices, 'spike')
+        schannel_info = self.spike_channel_infos[channel]
+
+        units = np.atleast_1d(unit) if np.size(unit) else None
+        with span('PL2File.spikes', channel) as read:
+            res = self.reader._get_spike_channel_data_selection(channel, units, waveforms)
+            if res is None:
+                raise IOError(f"Error: Can't read spike channel {channel} of {self.filename}")
+            spike_timestamps, units, values = res
+            read.nbytes = spike_timestamps.nbytes + units.nbytes + (values.nbytes if waveforms else 0)
+
+            with span('PL2File.spikes/convert', channel):
+                # n is waveforms.size, also when the waveforms are not read
+                if not waveforms:
+                    return PL2Spikes(len(spike_timestamps) * schannel_info.m_SamplesPerSpike,
+                                     spike_timestamps / self.file_info.m_TimestampFrequency,
+                                     units,
+                                     None)
+
+                waveforms = _scale(values, schannel_info.m_CoeffToConvertToUnits, dtype)
+
+                return PL2Spikes(waveforms.size,
+                                 spike_timestamps / self.file_info.m_TimestampFrequency,
+                                 units,
+                                 waveforms)
+
+    def events(self, channel):
+        """
+        Reads event data of a channel, see pl2_events.
+
+        Args:
+            channel - zero-based event channel index, or event channel name
+
+        Returns:
+            PL2DigitalEvents named tuple
+        """
+
+        channel = self._get_channel_index(channel, self._digital_channel_indices, 'digital')
+
+        with span('PL2File.events', channel) as read:
+            res = self.reader.pl2_get_digital_channel_data(channel)
+            if res is None:
+                raise IOError(f"Error: Can't read event channel {channel} of {self.filename}")
+            event_timestamps, event_values = res
+            read.nbytes = event_timestamps.nbytes + event_values.nbytes
+
+            with span('PL2File.events/convert', channel):
+                return PL2DigitalEvents(len(event_values),
+                                        event_timestamps / self.file_info.m_TimestampFrequency,
+                                        event_values)
+
+    def start_stop(self):
+        """
+        Reads the events of the start/stop channel, see pl2_start_stop.
+
+        Returns:
+            PL2StartStopEvents named tuple
+        """
+
+        with span('PL2File.start_stop') as read:
+            res = self.reader.pl2_get_start_stop_channel_events()
+            if res is None:
+                raise IOError(f"Error: Can't read the start/stop events of {self.filename}")
+            event_timestamps, event_values = res
+            read.nbytes = event_timestamps.nbytes + event_values.nbytes
+
+            return PL2StartStopEvents(len(event_values),
+                                      event_timestamps / self.file_info.m_TimestampFrequency,
+                                      event_values)
+
+    def epochs(self):
+        """
+        Returns the recorded segments of the file, see pl2_epochs.
+
+        Returns:
+            Epochs
+        """
+
+        frequency = self.file_info.m_TimestampFrequency
+        start = self.file_info.m_StartRecordingTime / frequency
+        end = start + self.file_info.m_DurationOfRecording / frequency
+        events = self.start_stop()
+        if not events.n:
+            return Epochs([start], [end])
+        return Epochs.from_events(events.timestamps, events.values, end=end)
+
+    def info(self):
+        """
+        Returns information about the file's channels, see pl2_info.
+
+        Returns:
+            PL2Info named tuple
+        """
+
+        # Get channel numbers, names, and unit counts for all enabled spike channels
+        spike_counts = [spike_info(schannel_info.m_Channel, schannel_info.m_Name.decode('ascii'),
+                                   tuple(schannel_info.m_UnitCounts))
+                        for schannel_info in self.spike_channel_infos if schannel_info.m_ChannelEnabled]
+
+        # Get channel numbers, names, and counts for all event channels with data
+        event_counts = [event_info(echannel_info.m_Channel, echannel_info.m_Name.decode('ascii'),
+                                   echannel_info.m_NumberOfEvents)
+                        for echannel_info in self.digital_channel_infos if echannel_info.m_NumberOfEvents]
+
+        # Get channel numbers, names, and counts for all enabled analog channels
+        ad_counts = [ad_info(achannel_info.m_Channel, achannel_info.m_Name.decode('ascii'),
+                             achannel_info.m_NumberOfValues)
+                     for achannel_info in self.analog_channel_infos if achannel_info.m_ChannelEnabled]
+
+        return PL2Info(tuple(spike_counts), tuple(event_counts), tuple(ad_counts))
+
+
+class PL2FilePool:
+    def __init__(self, max_open=64, backend='dll', **reader_options):
+        """
+        Keeps up to max_open files open as PL2File objects, keyed by path, so
+        that jobs touching many files open each of them once instead of on
+        every call. When another file is needed, the least recently used file
+        that is not in use is closed.
+
+            >>>pool = PL2FilePool(max_open=16)
+            >>>for filename in filenames:
+            >>>    with pool.open(filename) as f:
+            >>>        ad = f.ad(0)
+            >>>pool.close()
+
+        A file is in use between open() and the end of its with block. Files
+        in use are never closed by the pool, so more than max_open files can
+        be open while that many are in use.
+
+        Args:
+            max_open - maximum number of open files that are not in use
+            backend - 'dll' (default) reads the files through PL2FileReader.dll, 'native'
+                      parses them directly with NumPy
+            reader_options - further keyword arguments for PyPL2FileReader
+        """
+
+        if max_open < 1:
+            raise ValueError('max_open must be at least 1')
+        self.max_open = max_open
+        self._backend = backend
+        self._reader_options = reader_options
+        # path -> [PL2File, number of users], least recently used first
+        self._files = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return len(self._files)
+
+    def __contains__(self, filename):
+        return os.path.realpath(filename) in self._files
+
+    def _evict(self):
+        """
+        Closes least recently used files that are not in use until at most
+        max_open files are open. Called with the lock held.
+        """
+        for path in list(self._files):
+            if len(self._files) <= self.max_open:
+                break
+            f, users = self._files[path]
+            if not users:
+                del self._files[path]
+                f.close()
+
+    def acquire(self, filename):
+        """
+        Returns the open PL2File of filename, opening it if needed, and marks
+        it in use until release() is called for it.
+        """
+        path = os.path.realpath(filename)
+        with self._lock:
+            entry = self._files.get(path)
+            if entry is None:
+                entry = self._files[path] = [PL2File(path, backend=self._backend, **self._reader_options), 0]
+            elif entry[0].reader is None:
+                # closed by its user, open it again
+                entry[0] = PL2File(path, backend=self._backend, **self._reader_options)
+            self._files.move_to_end(path)
+            entry[1] += 1
+            self._evict()
+            return entry[0]
+
+    def release(self, filename):
+        """
+        Marks the PL2File of filename as no longer in use by one caller of acquire().
+        """
+        path = os.path.realpath(filename)
+        with self._lock:
+            entry = self._files.get(path)
+            if entry is None or not entry[1]:
+                raise ValueError(f'{filename} was not acquired from this pool')
+            entry[1] -= 1
+            self._evict()
+
+    @contextlib.contextmanager
+    def open(self, filename):
+        """
+        Context manager giving the open PL2File of filename, see acquire().
+        """
+        f = self.acquire(filename)
+        try:
+            yield f
+        finally:
+            self.release(filename)
+
+    def close(self):
+        """
+        Closes all files of the pool.
+        """
+        with self._lock:
+            files, self._files = self._files, OrderedDict()
+        for f, _ in files.values():
+            f.close()
+
+
+def pl2_ad(filename, channel, start=None, stop=None, backend='dll', dtype='raw', decimate=None, target_rate=None):
     """
     Reads continuous data from specific file and channel.
     
     Usage:
         >>>adfrequency, n, timestamps, fragmentcounts, ad = pl2_ad(filename, channel)
         >>>res = pl2_ad(filename, channel)
+        >>>res = pl2_ad(filename, channel, start=10.0, stop=12.0)
+        >>>res = pl2_ad(filename, channel, target_rate=1000.0)     # low-pass filtered to 1 kHz
     
     Args:
         filename - full path and filename of .pl2 file
         channel - zero-based channel index, or channel name
+        start - optional time in seconds of the first value to read
+        stop - optional time in seconds up to which (exclusive) values are read.
+               If start or stop is given, only the values in between are read.
+        backend - 'dll' (default) reads the file through PL2FileReader.dll, 'native'
+                  parses it directly with NumPy
+        dtype - 'raw' (default) returns the values as a ScaledArray, which keeps the
+                int16 a/d values and converts them to volts only when used.
+                np.float32 or np.float64 convert all values right away.
+        decimate - optional decimation factor. The values are low-pass filtered
+                   with the FIR filter of scipy.signal.decimate and one value
+                   out of every decimate values is kept. The channel is read
+                   and filtered in chunks, so the values before decimation are
+                   never all in memory. With dtype='raw', the ScaledArray holds
+                   the filtered float64 a/d values. Each fragment is filtered
+                   on its own, and its first value is kept.
+        target_rate - optional sampling rate after decimation, instead of decimate.
+                      Must be the channel's sampling rate divided by an integer.
     
     Returns (named tuple fields):
-        adfrequency - digitization frequency for the channel
+        adfrequency - digitization frequency for the channel, after decimation
         n - total number of data points
         timestamps - tuple of fragment timestamps (one timestamp per fragment, in seconds)
         fragmentcounts - tuple of fragment counts
-        ad - tuple of raw a/d values in volts
+        ad - a/d values in volts
         
         The returned data is in a named tuple object, so it can be accessed as a normal tuple: 
             >>>res = pl2_ad('data/file.pl2', 0)
@@ -44,60 +917,86 @@ def pl2_ad(filename, channel):
         or as a named tuple:
             >>>res.adfrequency
             40000
-    
-        If any error is detected, an error message is printed and the function returns 0
+
+    Raises:
+        IOError if the file can't be opened or the channel can't be read
+        KeyError if there is no channel with the given name
     """
 
-    # Create an instance of PyPL2FileReader.
-    p = PyPL2FileReader()
+    with PL2File(filename, backend=backend) as f:
+        return f.ad(channel, start=start, stop=stop, dtype=dtype, decimate=decimate, target_rate=target_rate)
 
-    # Open the file.
-    p.pl2_open_file(filename)
-    p.pl2_get_file_info()
 
-    # Check if channel is an integer or string, and call appropriate function
-    if type(channel) is int:
-        achannel_info = p.pl2_get_analog_channel_info(channel)
-    if type(channel) in (str, bytes):
-        achannel_info = p.pl2_get_analog_channel_info_by_name(channel)
+def pl2_ad_multi(filename, channels, backend='dll', dtype='raw'):
+    """
+    Reads continuous data of several channels from a file into a single
+    (channels, n) array. The array is allocated once and filled channel by
+    channel, which takes less memory and time than stacking pl2_ad results.
+    The channels must have the same number of values and fragments, as the
+    channels of one source do.
 
-    # Check if channel is an integer or string, and call appropriate function
-    if type(channel) is int:
-        fragment_timestamps, fragment_counts, values = p.pl2_get_analog_channel_data(channel)
-    if type(channel) in (str, bytes):
-        fragment_timestamps, fragment_counts, values  = p.pl2_get_analog_channel_data_by_name(channel)
+    Usage:
+        >>>res = pl2_ad_multi(filename, [0, 1, 2, 3])
+        >>>res = pl2_ad_multi(filename, ['WB01', 'WB02'])
+        >>>res = pl2_ad_multi(filename, (source_id, range(1, 33)))
+
+    Args:
+        filename - full path and filename of .pl2 file
+        channels - sequence of zero-based channel indices and/or channel names,
+                   or a (source_id, one_based_channel_indices_in_source) tuple
+        backend - 'dll' (default) reads the file through PL2FileReader.dll, 'native'
+                  parses it directly with NumPy
+        dtype - 'raw' (default) returns the values as a ScaledArray, which keeps the
+                int16 a/d values and one coefficient per channel and converts them
+                to volts only when used. np.float32 or np.float64 convert all
+                values right away.
 
-    # Close the file
-    p.pl2_close_file()
+    Returns (named tuple fields):
+        adfrequency - digitization frequency of the channels
+        n - number of data points per channel
+        timestamps - fragment timestamps (one timestamp per fragment, in seconds)
+        fragmentcounts - fragment counts
+        ad - (channels, n) array with the a/d values in volts
 
-    # Create a named tuple called PL2Ad.
-    PL2Ad = namedtuple('PL2Ad', 'adfrequency n timestamps fragmentcounts ad')
+    Raises:
+        IOError if the file can't be opened or the channels can't be read
+        KeyError if some of the channels aren't in the file
+    """
 
-    # Fill in and return named tuple.
-    return PL2Ad(achannel_info.m_SamplesPerSecond,
-                 len(values),
-                 to_array_nonzero(fragment_timestamps) / p.pl2_file_info.m_TimestampFrequency,
-                 to_array_nonzero(fragment_counts),
-                 to_array(values) * achannel_info.m_CoeffToConvertToUnits)
+    with PL2File(filename, backend=backend) as f:
+        return f.ad_multi(channels, dtype=dtype)
 
 
-def pl2_spikes(filename, channel, unit=[]):
+def pl2_spikes(filename, channel, unit=[], backend='dll', dtype='raw', waveforms=True):
     """
     Reads spike data from a specific file and channel.
     
     Usage:
         >>>n, timestamps, units, waveforms = pl2_spikes(filename, channel)
         >>>res = pl2_spikes(filename, channel)
+        >>>res = pl2_spikes(filename, channel, unit=1, waveforms=False)
     
     Args:
         filename - full path and filename of .pl2 file
         channel - zero-based channel index, or channel name
+        unit - unit number (0 = unsorted, 1 = Unit A, 2 = Unit B, etc) or sequence
+               of unit numbers. Only spikes of these units are returned, and only
+               their waveforms are copied and converted. [] (default) returns all spikes.
+        backend - 'dll' (default) reads the file through PL2FileReader.dll, 'native'
+                  parses it directly with NumPy
+        dtype - 'raw' (default) returns the values as a ScaledArray, which keeps the
+                int16 a/d values and converts them to volts only when used.
+                np.float32 or np.float64 convert all values right away.
+        waveforms - if False, only timestamps and units are returned and waveforms
+                    is None. The native backend then does not read waveforms at all,
+                    the .dll backend drops them right after the .dll call.
     
     Returns (named tuple fields):
-        n - number of spike waveforms
+        n - number of waveform a/d values (spikes times samples per spike), waveforms.size.
+            The same with waveforms=False, where waveforms is None.
         timestamps - tuple of spike waveform timestamps in seconds
         units - tuple of spike waveform unit assignments (0 = unsorted, 1 = Unit A, 2 = Unit B, etc)
-        waveforms - tuple of tuples with raw waveform a/d values in volts
+        waveforms - (spikes, samples per spike) array with the waveform a/d values in volts
         
         The returned data is in a named tuple object, so it can be accessed as a normal tuple: 
             >>>res = pl2_spikes('data/file.pl2', 0)
@@ -111,48 +1010,17 @@ def pl2_spikes(filename, channel, unit=[]):
         Result shortened for example:
             >>>res.waveforms[49]
             (0.000345643, 0.000546342, ... , -0.03320040)
-    
-        If any error is detected, an error message is printed and the function returns 0
-    """
-
-    # Create an instance of PyPL2FileReader.
-    p = PyPL2FileReader()
-
-    # Verify that the file passed exists first.
-    # Open the file.
-    p.pl2_open_file(filename)
-
-    # Create instance of PL2SpikeChannelInfo.
-    schannel_info = PL2SpikeChannelInfo()
 
-    # Check if channel is an integer or string, and call appropriate function
-    if type(channel) is int:
-        schannel_info = p.pl2_get_spike_channel_info(channel)
-    if type(channel) in (str, bytes):
-        schannel_info = p.pl2_get_spike_channel_info_by_name(channel)
-
-    if type(channel) is int:
-        res = p.pl2_get_spike_channel_data(channel)
-    if type(channel) in (str, bytes):
-        res = p.pl2_get_spike_channel_data_by_name(channel)
-
-    spike_timestamps, units, values = res
-
-    # Close the file
-    p.pl2_close_file()
-
-    waveforms = (values * schannel_info.m_CoeffToConvertToUnits)
-
-    # Create a named tuple called PL2Spikes
-    PL2Spikes = namedtuple('PL2Spikes', 'n timestamps units waveforms')
+    Raises:
+        IOError if the file can't be opened or the channel can't be read
+        KeyError if there is no channel with the given name
+    """
 
-    return PL2Spikes(waveforms.size,
-                     spike_timestamps / p.pl2_file_info.m_TimestampFrequency,
-                     units,
-                     waveforms)
+    with PL2File(filename, backend=backend) as f:
+        return f.spikes(channel, unit=unit, dtype=dtype, waveforms=waveforms)
 
 
-def pl2_events(filename, channel):
+def pl2_events(filename, channel, backend='dll'):
     """
     Reads event channel data from a specific file and event channel
     
@@ -162,6 +1030,8 @@ def pl2_events(filename, channel):
     Args:
         filename - full path of the file
         channel - 1-based event channel index, or event channel name;
+        backend - 'dll' (default) reads the file through PL2FileReader.dll, 'native'
+                  parses it directly with NumPy
         
     Returns (named tuple fields):
         n - number of events
@@ -175,35 +1045,70 @@ def pl2_events(filename, channel):
     or as a named tuple:
         >>>res.n
         784
+
+    Raises:
+        IOError if the file can't be opened or the channel can't be read
+        KeyError if there is no channel with the given name
+    """
+
+    with PL2File(filename, backend=backend) as f:
+        return f.events(channel)
+
+
+def pl2_start_stop(filename, backend='dll'):
+    """
+    Reads the events of the start/stop channel, which record when recording
+    was started, stopped, paused and resumed.
+
+    Usage:
+        >>>n, timestamps, values = pl2_start_stop(filename)
+        >>>res = pl2_start_stop(filename)
+        >>>res.timestamps[res.values == PL2_PAUSE]      # times of the pauses
+
+    Args:
+        filename - full path of the file
+        backend - 'dll' (default) reads the file through PL2FileReader.dll, 'native'
+                  parses it directly with NumPy
+
+    Returns (named tuple fields):
+        n - number of events
+        timestamps - array of timestamps (in seconds)
+        values - array of event types, PL2_START, PL2_STOP, PL2_PAUSE or PL2_RESUME
+
+    Raises:
+        IOError if the file can't be opened or the start/stop channel can't be read
     """
 
-    # Create an instance of PyPL2FileReader.
-    p = PyPL2FileReader()
+    with PL2File(filename, backend=backend) as f:
+        return f.start_stop()
 
-    # Verify that the file passed exists first.
-    # Open the file.
-    p.pl2_open_file(filename)
-    p.pl2_get_file_info()
 
-    # Set up instances of ctypes classes needed by pl2_get_digital_channel_data().
+def pl2_epochs(filename, backend='dll'):
+    """
+    Returns the segments of a file that were recorded, i.e. not paused or
+    stopped, from the events of its start/stop channel. A file without
+    start/stop events has a single epoch over the whole recording.
 
-    if type(channel) is int:
-        event_timestamps, even_values = p.pl2_get_digital_channel_data(channel)
-    if type(channel) in (str, bytes):
-        event_timestamps, event_values = p.pl2_get_digital_channel_data_by_name(channel)
+    Usage:
+        >>>epochs = pl2_epochs(filename)
+        >>>list(epochs)                                   # (start, stop) times in seconds
+        >>>epochs.restrict(pl2_spikes(filename, 0))       # spikes within the epochs
+        >>>epochs.sample_slices(pl2_ad(filename, 0))      # slices of the values of each epoch
 
-    # Close the file
-    p.pl2_close_file()
+    Args:
+        filename - full path of the file
+        backend - 'dll' (default) reads the file through PL2FileReader.dll, 'native'
+                  parses it directly with NumPy
 
-    # Create a named tuple called PL2DigitalEvents
-    PL2DigitalEvents = namedtuple('PL2DigitalEvents', 'n timestamps values')
+    Returns:
+        Epochs, see its documentation for masks, slices and restrict()
+    """
 
-    return PL2DigitalEvents(len(event_values),
-                            event_timestamps / p.pl2_file_info.m_TimestampFrequency,
-                            event_values)
+    with PL2File(filename, backend=backend) as f:
+        return f.epochs()
 
 
-def pl2_info(filename):
+def pl2_info(filename, backend='dll'):
     """
     Reads a PL2 file and returns information about the file.
     
@@ -213,6 +1118,8 @@ def pl2_info(filename):
     
     Args:
         filename - Full path of the file
+        backend - 'dll' (default) reads the file through PL2FileReader.dll, 'native'
+                  parses it directly with NumPy
     
     Returns (named tuple fields):
         spikes - tuple the length of enabled spike channels with tuples
@@ -261,53 +1168,10 @@ def pl2_info(filename):
         >>>res = pl2_info('data/file.pl2')
         >>>res.spikes[2].name
         >>>'SPK03'
-    """
-
-    # Create an instance of PyPL2FileReader.
-    p = PyPL2FileReader()
-
-    # Verify that the file passed exists first.
-    # Open the file.
-    p.pl2_open_file(filename)
-    p.pl2_get_file_info()
-
-    # Lists that will be filled with tuples
-    spike_counts = []
-    event_counts = []
-    ad_counts = []
-
-    # Named tuples that will be appended into lists
-    spike_info = namedtuple('spike_info', 'channel name units')
-    event_info = namedtuple('event_info', 'channel name n')
-    ad_info = namedtuple('ad_info', 'channel name n')
-
-    # Get channel numbers, names, and unit counts for all enabled spike channels
-    for i in range(p.pl2_file_info.m_TotalNumberOfSpikeChannels):
-        schannel_info = p.pl2_get_spike_channel_info(i)
-
-        if schannel_info.m_ChannelEnabled:
-            spike_counts.append(spike_info(schannel_info.m_Channel, schannel_info.m_Name.decode('ascii'),
-                                           tuple(schannel_info.m_UnitCounts)))
 
-    # Get channel numbers, names, and counts for all event channels with data
-    for i in range(p.pl2_file_info.m_NumberOfDigitalChannels):
-        echannel_info = p.pl2_get_digital_channel_info(i)
-
-        if echannel_info.m_NumberOfEvents:
-            event_counts.append(event_info(echannel_info.m_Channel, echannel_info.m_Name.decode('ascii'),
-                                           echannel_info.m_NumberOfEvents))
-
-    # Get channel numbers, names, and counts for all enabled spike channels
-    for i in range(p.pl2_file_info.m_TotalNumberOfAnalogChannels):
-        achannel_info = p.pl2_get_analog_channel_info(i)
-
-        if achannel_info.m_ChannelEnabled:
-            ad_counts.append(ad_info(achannel_info.m_Channel, achannel_info.m_Name.decode('ascii'),
-                                     achannel_info.m_NumberOfValues))
-
-    # Close the file
-    p.pl2_close_file()
-
-    PL2Info = namedtuple('PL2Info', 'spikes events ad')
+    Raises:
+        IOError if the file can't be opened
+    """
 
-    return PL2Info(tuple(spike_counts), tuple(event_counts), tuple(ad_counts))
+    with PL2File(filename, backend=backend) as f:
+        return f.info()
@@ -0,0 +1,219 @@
+# pypl2async.py - asyncio versions of the pypl2api functions and of
+# PL2File.
+#
+# The blocking PyPL2FileReader calls run on a dedicated thread pool, so
+# the event loop keeps running while channels are read. A reader can not be
+# shared between threads, so AsyncPL2File keeps one PL2File per worker
+# thread. Cancelling a read that has not started yet removes it from the
+# pool, a read that is already running finishes in its thread and its result
+# is dropped.
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import contextlib
+import functools
+import os
+import threading
+
+import pypl2api
+from pypl2api import PL2File
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """
+    Returns the thread pool the async functions run on by default. It is
+    created on first use with one thread per CPU.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=os.cpu_count() or 1, thread_name_prefix='pypl2')
+        return _executor
+
+
+def set_executor(executor):
+    """
+    Replaces the default thread pool of the async functions, e.g. with
+    ThreadPoolExecutor(max_workers=4) to run at most 4 reads at once. The
+    previous pool is shut down once its pending reads are done.
+
+    Args:
+        executor - concurrent.futures.Executor running the blocking reads
+    """
+    global _executor
+    with _executor_lock:
+        previous, _executor = _executor, executor
+    if previous is not None and previous is not executor:
+        previous.shutdown(wait=False)
+
+
+async def _run(executor, function, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor or get_executor(), functools.partial(function, *args, **kwargs))
+
+
+class AsyncPL2File:
+    def __init__(self, filename, backend='dll', max_concurrency=None, executor=None, **reader_options):
+        """
+        asyncio version of PL2File. Reads run on a thread pool and can be
+        awaited together:
+
+            >>>async with AsyncPL2File('data/file.pl2', max_concurrency=4) as f:
+            >>>    ads = await asyncio.gather(*(f.ad(channel) for channel in range(32)))
+
+        Every worker thread opens the file once, the first time it reads from
+        it. Cached file and channel information is available after the file
+        was opened with open() or async with.
+
+        Args:
+            filename - full path of the file
+            backend - 'dll' (default) reads the file through PL2FileReader.dll, 'native'
+                      parses it directly with NumPy
+            max_concurrency - optional maximum number of reads of this file running
+                              at once, further reads wait
+            executor - thread pool to run the reads on, defaults to get_executor()
+            reader_options - further keyword arguments for PyPL2FileReader
+        """
+
+        self.filename = filename
+        self._backend = backend
+        self._reader_options = reader_options
+        self._executor = executor
+        self._semaphore = asyncio.Semaphore(max_concurrency) if max_concurrency else None
+        self._local = threading.local()
+        self._files = []
+        self._lock = threading.Lock()
+
+        self.file_info = None
+        self.analog_channel_infos = None
+        self.spike_channel_infos = None
+        self.digital_channel_infos = None
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    def _get_file(self):
+        f = getattr(self._local, 'file', None)
+        if f is None:
+            f = PL2File(self.filename, backend=self._backend, **self._reader_options)
+            self._local.file = f
+            with self._lock:
+                self._files.append(f)
+        return f
+
+    def _call(self, method, *args, **kwargs):
+        return getattr(self._get_file(), method)(*args, **kwargs)
+
+    async def _run(self, method, *args, **kwargs):
+        # reads wait for the semaphore before they are handed to the pool,
+        # so waiting reads can be cancelled without ever running
+        async with self._semaphore or contextlib.nullcontext():
+            return await _run(self._executor, self._call, method, *args, **kwargs)
+
+    async def open(self):
+        """
+        Opens the file and caches its file and channel information.
+
+        Raises:
+            IOError if the file can't be opened
+        """
+        f = await _run(self._executor, self._get_file)
+        self.file_info = f.file_info
+        self.analog_channel_infos = f.analog_channel_infos
+        self.spike_channel_infos = f.spike_channel_infos
+        self.digital_channel_infos = f.digital_channel_infos
+
+    async def close(self):
+        """
+        Closes the file in all worker threads.
+        """
+        with self._lock:
+            files, self._files = self._files, []
+        self._local = threading.local()
+        for f in files:
+            await _run(self._executor, f.close)
+
+    async def ad(self, channel, start=None, stop=None, dtype='raw', decimate=None, target_rate=None):
+        """
+        Reads continuous data of a channel, see pypl2api.pl2_ad.
+        """
+        return await self._run('ad', channel, start=start, stop=stop, dtype=dtype, decimate=decimate,
+                               target_rate=target_rate)
+
+    async def ad_multi(self, channels, dtype='raw'):
+        """
+        Reads continuous data of several channels into one array, see pypl2api.pl2_ad_multi.
+        """
+        return await self._run('ad_multi', channels, dtype=dtype)
+
+    async def spikes(self, channel, unit=[], dtype='raw', waveforms=True):
+        """
+        Reads spike data of a channel, see pypl2api.pl2_spikes.
+        """
+        return await self._run('spikes', channel, unit=unit, dtype=dtype, waveforms=waveforms)
+
+    async def events(self, channel):
+        """
+        Reads event data of a channel, see pypl2api.pl2_events.
+        """
+        return await self._run('events', channel)
+
+    async def info(self):
+        """
+        Reads the channel overview of the file, see pypl2api.pl2_info.
+        """
+        return await self._run('info')
+
+
+async def pl2_ad_async(filename, channel, start=None, stop=None, backend='dll', dtype='raw', decimate=None,
+                       target_rate=None, executor=None):
+    """
+    asyncio version of pypl2api.pl2_ad, runs it on executor (defaults to
+    get_executor()).
+
+    Usage:
+        >>>res = await pl2_ad_async('data/file.pl2', 0)
+        >>>ads = await asyncio.gather(*(pl2_ad_async('data/file.pl2', i) for i in range(4)))
+    """
+    return await _run(executor, pypl2api.pl2_ad, filename, channel, start=start, stop=stop, backend=backend,
+                      dtype=dtype, decimate=decimate, target_rate=target_rate)
+
+
+async def pl2_ad_multi_async(filename, channels, backend='dll', dtype='raw', executor=None):
+    """
+    asyncio version of pypl2api.pl2_ad_multi, runs it on executor (defaults to
+    get_executor()).
+    """
+    return await _run(executor, pypl2api.pl2_ad_multi, filename, channels, backend=backend, dtype=dtype)
+
+
+async def pl2_spikes_async(filename, channel, unit=[], backend='dll', dtype='raw', waveforms=True, executor=None):
+    """
+    asyncio version of pypl2api.pl2_spikes, runs it on executor (defaults to
+    get_executor()).
+    """
+    return await _run(executor, pypl2api.pl2_spikes, filename, channel, unit=unit, backend=backend, dtype=dtype,
+                      waveforms=waveforms)
+
+
+async def pl2_events_async(filename, channel, backend='dll', executor=None):
+    """
+    asyncio version of pypl2api.pl2_events, runs it on executor (defaults to
+    get_executor()).
+    """
+    return await _run(executor, pypl2api.pl2_events, filename, channel, backend=backend)
+
+
+async def pl2_info_async(filename, backend='dll', executor=None):
+    """
+    asyncio version of pypl2api.pl2_info, runs it on executor (defaults to
+    get_executor()).
+    """
+    return await _run(executor, pypl2api.pl2_info, filename, backend=backend)
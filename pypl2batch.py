@@ -0,0 +1,215 @@
+# pypl2batch.py - Runs a function over all .pl2 files of directories, per
+# file or per channel, with a manifest so that reruns resume.
+#
+# Tasks run in a process pool with the 'spawn' start method, so every
+# worker has its own zugbruecke/wine session. If a worker process dies,
+# e.g. because PL2FileReader.dll crashed wine, the pool is broken and all
+# its unfinished tasks fail with BrokenProcessPool. Those tasks are run
+# again each in a process of its own, so only the task that crashed is
+# recorded as failed.
+#
+# The manifest is a JSON lines file. Every finished task appends a line
+#   {"file": ..., "key": [size, mtime_ns], "channel": ..., "status": "done" or "failed", "error": ...}
+# and per channel runs also record the channels of each file
+#   {"file": ..., "key": [size, mtime_ns], "channels": [...]}
+# Tasks recorded as done for an unchanged file are skipped on the next run.
+
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+import json
+import multiprocessing
+import os
+import pathlib
+
+from pypl2api import PL2File
+
+_KINDS = ('ad', 'spikes', 'events')
+
+# Named tuple returned by pl2_batch
+PL2BatchResult = namedtuple('PL2BatchResult', 'results failed')
+
+
+def _find_files(paths, pattern):
+    """
+    Returns the sorted real paths of the files matching pattern in the given
+    directories (searched recursively) and of the given files.
+    """
+    if isinstance(paths, (str, pathlib.Path)):
+        paths = [paths]
+    files = set()
+    for path in map(pathlib.Path, paths):
+        if path.is_dir():
+            files.update(os.path.realpath(p) for p in path.rglob(pattern) if p.is_file())
+        else:
+            files.add(os.path.realpath(path))
+    return sorted(files)
+
+
+def _file_key(filename):
+    stat = os.stat(filename)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def _read_manifest(manifest, keys):
+    """
+    Returns the channels recorded per file and the set of (file, channel)
+    tasks recorded as done, for files that did not change since.
+    """
+    channels = {}
+    done = set()
+    if not os.path.exists(manifest):
+        return channels, done
+    with open(manifest) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # a line cut short by an interrupted run
+                continue
+            if keys.get(record.get('file')) != record.get('key'):
+                continue
+            if 'channels' in record:
+                channels[record['file']] = record['channels']
+            elif record.get('status') == 'done':
+                done.add((record['file'], record.get('channel')))
+    return channels, done
+
+
+def _list_channels(filename, kind, backend, reader_options):
+    with PL2File(filename, backend=backend, **reader_options) as f:
+        return [channel.name for channel in getattr(f.info(), kind)]
+
+
+def _run_task(function, filename, channel, backend, reader_options):
+    with PL2File(filename, backend=backend, **reader_options) as f:
+        if channel is None:
+            return function(f)
+        return function(f, channel)
+
+
+def _run_isolated(function, *args):
+    executor = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn'))
+    with executor:
+        return executor.submit(function, *args).result()
+
+
+def _run_all(tasks, max_workers, on_result):
+    """
+    Runs (key, function, args) tasks in a process pool and calls
+    on_result(key, result, error) for each. Tasks lost with a broken pool are
+    run again each in a process of its own.
+    """
+    broken = []
+    executor = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn'))
+    with executor:
+        futures = {executor.submit(function, *args): (key, function, args) for key, function, args in tasks}
+        for future in as_completed(futures):
+            key, function, args = futures[future]
+            try:
+                on_result(key, future.result(), None)
+            except BrokenProcessPool:
+                broken.append((key, function, args))
+            except Exception as e:
+                on_result(key, None, f'{type(e).__name__}: {e}')
+
+    if not broken:
+        return
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(_run_isolated, function, *args): key for key, function, args in broken}
+        for future in as_completed(futures):
+            key = futures[future]
+            try:
+                on_result(key, future.result(), None)
+            except BrokenProcessPool:
+                on_result(key, None, 'worker process crashed')
+            except Exception as e:
+                on_result(key, None, f'{type(e).__name__}: {e}')
+
+
+def pl2_batch(paths, function, manifest, per_channel=None, pattern='*.pl2', max_workers=None, backend='dll',
+              **reader_options):
+    """
+    Runs function for every .pl2 file found in paths, or for every channel of
+    these files, in parallel worker processes. Finished tasks are recorded
+    in manifest, and tasks recorded as done for files that did not change
+    since are skipped, so an interrupted job continues where it stopped when
+    it is run again. Failed tasks are run again.
+
+    Usage:
+        >>>def mean_ad(f, channel):
+        >>>    return f.ad(channel).ad.raw.mean()
+        >>>res = pl2_batch('data/sessions', mean_ad, 'data/sessions/manifest.jsonl', per_channel='ad')
+        >>>res.results[('/data/sessions/a.pl2', 'WB01')]
+
+    Args:
+        paths - directory, file or sequence of directories and files. Directories
+                are searched recursively for files matching pattern.
+        function - called with the open PL2File as function(f), or with
+                   per_channel as function(f, channel_name). Runs in worker
+                   processes, so it must be a module level function, and its
+                   return value must be picklable. As with multiprocessing,
+                   scripts must call pl2_batch under if __name__ == '__main__'.
+        manifest - path of the manifest file, created if it does not exist
+        per_channel - None (default) runs function once per file, 'ad', 'spikes'
+                      or 'events' once per channel listed by pl2_info
+        pattern - file name pattern of the files searched in directories
+        max_workers - number of worker processes, defaults to the number of CPUs
+        backend - 'dll' (default) reads the files through PL2FileReader.dll, 'native'
+                  parses them directly with NumPy
+        reader_options - further keyword arguments for PyPL2FileReader, e.g.
+                         sidecar_index=True, as every task opens its file
+
+    Returns:
+        PL2BatchResult named tuple
+            results - dict mapping (file, channel) to the return value of
+                      function for the tasks run this time. channel is None
+                      without per_channel.
+            failed - dict mapping (file, channel) to the error message of the
+                     failed tasks
+    """
+
+    if per_channel is not None and per_channel not in _KINDS:
+        raise ValueError(f"Unknown per_channel '{per_channel}', expected None or one of {', '.join(_KINDS)}")
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+
+    keys = {filename: _file_key(filename) for filename in _find_files(paths, pattern)}
+    channels, done = _read_manifest(manifest, keys)
+    results = {}
+    failed = {}
+
+    with open(manifest, 'a') as manifest_file:
+        def record(**fields):
+            manifest_file.write(json.dumps(fields) + '\n')
+            manifest_file.flush()
+
+        def on_channels(filename, res, error):
+            if error is None:
+                channels[filename] = res
+                record(file=filename, key=keys[filename], channels=res)
+            else:
+                failed[(filename, None)] = error
+
+        def on_task(task, res, error):
+            filename, channel = task
+            if error is None:
+                results[task] = res
+            else:
+                failed[task] = error
+            record(file=filename, key=keys[filename], channel=channel, status='done' if error is None else 'failed',
+                   error=error)
+
+        if per_channel is None:
+            tasks = [(filename, None) for filename in keys]
+        else:
+            # the channels of files not seen before are listed by the workers too
+            _run_all([(filename, _list_channels, (filename, per_channel, backend, reader_options))
+                      for filename in keys if filename not in channels], max_workers, on_channels)
+            tasks = [(filename, channel) for filename in keys for channel in channels.get(filename, ())]
+
+        _run_all([(task, _run_task, (function, *task, backend, reader_options))
+                  for task in tasks if task not in done], max_workers, on_task)
+
+    return PL2BatchResult(results, failed)
@@ -0,0 +1,497 @@
+# pypl2bench.py - Throughput benchmarks of the pypl2 readers on synthetic
+# .pl2 recordings.
+#
+# write_synthetic_pl2 writes a recording with a configurable number of
+# wideband, spike and event channels, duration, spike and event rates and
+# pauses, in the layout read by the native backend (see pypl2native.py).
+# run_benchmarks times pl2_info, pl2_ad, pl2_ad with decimation by
+# _DECIMATE, pl2_spikes, pl2_events and the PyPL2FileReader channel data
+# methods of each backend. Every backend and
+# operation runs in a spawned process of its own, so its peak RSS is not
+# inflated by the operations before it. With the .dll backend the memory of
+# the wine process is not included. The synthetic files only fill the
+# header fields the native backend reads and are not known to be accepted
+# by PL2FileReader.dll, so the .dll backend is only benchmarked on a real
+# recording given with --file.
+# run_startup_benchmark times importing the modules and the first pl2_info
+# call of each backend, which includes starting wine for the .dll backend,
+# in fresh interpreters.
+#
+# Usage:
+#   python pypl2bench.py --analog-channels 16 --duration 60
+#   python pypl2bench.py --file data/recording.pl2 --backends native dll --output results.json
+#   python pypl2bench.py --startup --file data/recording.pl2 --backends native dll
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import json
+import multiprocessing
+import os
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from pypl2lib import (PL2FileInfo, PL2AnalogChannelInfo, PL2SpikeChannelInfo, PL2DigitalChannelInfo, PyPL2FileReader,
+                      PL2_START, PL2_STOP, PL2_PAUSE, PL2_RESUME)
+from pypl2native import (PDP_VERSION, PDP_FILE_INFO, PDP_FILE_HEADER, PDP_ANALOG_CHANNEL_HEADER,
+                         PDP_SPIKE_CHANNEL_HEADER, PDP_DIGITAL_CHANNEL_HEADER, PDP_ANALOG_SUMMARY,
+                         PDP_SPIKE_SUMMARY, PDP_DIGITAL_SUMMARY, PDP_SPIKE_DATA, PDP_ANALOG_DATA,
+                         PDP_DIGITAL_DATA, PDP_START_STOP_SUMMARY, PDP_START_STOP_DATA, _PDP_HEADER,
+                         _pdp_data_size)
+import pypl2api
+
+# sizes of the PDP data of the file header and channel header PDPs, and the
+# leading bytes of them that hold the PL2*Info structure fields
+_FILE_INFO_SIZE = 0xb0
+_FILE_HEADER_SIZE, _FILE_HEADER_FIELDS = 0x3a0, 0x320
+_ANALOG_HEADER_SIZE, _ANALOG_HEADER_FIELDS = 0x1f0, 0x78
+_SPIKE_HEADER_SIZE, _SPIKE_HEADER_FIELDS = 0xa10, 0x898
+_DIGITAL_HEADER_SIZE, _DIGITAL_HEADER_FIELDS = 0x160, 0x50
+
+# sources of the generated channels
+_ANALOG_SOURCE = 3
+_SPIKE_SOURCE = 6
+_DIGITAL_SOURCE = 9
+
+_OPERATIONS = ('pl2_info', 'pl2_ad', 'pl2_ad_decimate', 'pl2_spikes', 'pl2_events',
+               'pl2_get_analog_channel_data', 'pl2_get_spike_channel_data', 'pl2_get_digital_channel_data')
+# decimation factor of the pl2_ad_decimate operation, e.g. 40 kHz wideband to 1 kHz
+_DECIMATE = 40
+
+
+def _pdp(pdp_type, source, data=b'', channel=0, count=0, value=0):
+    data = bytes(data)
+    padded_size = _pdp_data_size((len(data) + 1) // 2)
+    return _PDP_HEADER.pack(pdp_type, source, (len(data) + 1) // 2, channel, count, value) + \
+        data.ljust(padded_size, b'\0')
+
+
+def _header_pdp(pdp_type, source, info, size, fields, channel=0):
+    return _pdp(pdp_type, source, bytes(info)[:fields].ljust(size, b'\0'), channel)
+
+
+def write_synthetic_pl2(filename, analog_channels=4, sample_rate=40000.0, duration=10.0, spike_channels=4,
+                        spike_rate=20.0, samples_per_spike=32, event_channels=2, event_rate=1.0, fragments=1,
+                        gap=1.0, block_size=4096, timestamp_frequency=40000.0, seed=0):
+    """
+    Writes a synthetic .pl2 recording with random data, that can be read
+    with the native backend.
+
+    Usage:
+        >>>write_synthetic_pl2('bench.pl2', analog_channels=32, duration=60.0, fragments=3)
+
+    Args:
+        filename - path of the file to write
+        analog_channels - number of continuous channels (WB01, WB02, ...)
+        sample_rate - samples per second of the continuous channels
+        duration - recorded seconds, without the pauses
+        spike_channels - number of spike channels (SPK01, ...)
+        spike_rate - mean spikes per second on each spike channel
+        samples_per_spike - waveform length
+        event_channels - number of event channels (EVT01, ...)
+        event_rate - mean events per second on each event channel
+        fragments - number of recorded pieces, separated by pauses. Continuous
+                    channels have one fragment per piece, and the start/stop
+                    channel has start, pause, resume and stop events at their
+                    ends.
+        gap - length of each pause in seconds
+        block_size - maximum number of values per continuous data block (at
+                     most 65535)
+        timestamp_frequency - timestamp ticks per second
+        seed - seed of the random data
+
+    Returns:
+        None
+    """
+
+    if not 0 < block_size <= 0xFFFF:
+        raise ValueError('block_size must be between 1 and 65535')
+    rng = np.random.default_rng(seed)
+    ticks_per_sample = timestamp_frequency / sample_rate
+    samples_per_fragment = int(round(duration * sample_rate / fragments))
+    # the recording starts after one block, as pl2_ad drops fragments starting at timestamp 0
+    start = block_size / sample_rate
+    fragment_ticks = [int(round((start + i * (duration / fragments + gap)) * timestamp_frequency))
+                      for i in range(fragments)]
+    last_tick = fragment_ticks[-1] + int(round(samples_per_fragment * ticks_per_sample))
+
+    def channel_info(info_type, name, source, channel):
+        info = info_type()
+        info.m_Name = name
+        info.m_Source = source
+        info.m_Channel = channel
+        return info
+
+    analog_infos = []
+    for i in range(analog_channels):
+        info = channel_info(PL2AnalogChannelInfo, b'WB%02d' % (i + 1), _ANALOG_SOURCE, i + 1)
+        info.m_ChannelEnabled = 1
+        info.m_SamplesPerSecond = sample_rate
+        info.m_CoeffToConvertToUnits = 1e-7
+        analog_infos.append(info)
+    spike_infos = []
+    for i in range(spike_channels):
+        info = channel_info(PL2SpikeChannelInfo, b'SPK%02d' % (i + 1), _SPIKE_SOURCE, i + 1)
+        info.m_ChannelEnabled = 1
+        info.m_SamplesPerSecond = sample_rate
+        info.m_SamplesPerSpike = samples_per_spike
+        info.m_CoeffToConvertToUnits = 1e-7
+        spike_infos.append(info)
+    digital_infos = [channel_info(PL2DigitalChannelInfo, b'EVT%02d' % (i + 1), _DIGITAL_SOURCE, i + 1)
+                     for i in range(event_channels)]
+
+    def random_ticks(rate):
+        # sorted random timestamps within the recorded pieces
+        n = rng.poisson(rate * duration)
+        ticks = np.sort(rng.integers(0, samples_per_fragment * fragments, n)) * ticks_per_sample
+        piece = (ticks // (samples_per_fragment * ticks_per_sample)).astype(np.int64)
+        return (ticks - piece * samples_per_fragment * ticks_per_sample).astype(np.int64) + \
+            np.asarray(fragment_ticks, dtype=np.int64)[piece]
+
+    spike_ticks = [random_ticks(spike_rate) for _ in spike_infos]
+    spike_units = [rng.integers(0, 4, len(ticks), dtype=np.uint16) for ticks in spike_ticks]
+    for info, units in zip(spike_infos, spike_units):
+        info.m_UnitCounts[:4] = np.bincount(units, minlength=4).tolist()
+    event_ticks = [random_ticks(event_rate) for _ in digital_infos]
+
+    file_info = PL2FileInfo()
+    file_info.m_TimestampFrequency = timestamp_frequency
+    file_info.m_NumberOfChannelHeaders = analog_channels + spike_channels + event_channels
+    file_info.m_TotalNumberOfAnalogChannels = analog_channels
+    file_info.m_TotalNumberOfSpikeChannels = spike_channels
+    file_info.m_NumberOfDigitalChannels = event_channels
+
+    headers = [_header_pdp(PDP_FILE_HEADER, 0, file_info, _FILE_HEADER_SIZE, _FILE_HEADER_FIELDS)]
+    headers += [_header_pdp(PDP_ANALOG_CHANNEL_HEADER, info.m_Source, info, _ANALOG_HEADER_SIZE,
+                            _ANALOG_HEADER_FIELDS, info.m_Channel) for info in analog_infos]
+    headers += [_header_pdp(PDP_SPIKE_CHANNEL_HEADER, info.m_Source, info, _SPIKE_HEADER_SIZE,
+                            _SPIKE_HEADER_FIELDS, info.m_Channel) for info in spike_infos]
+    headers += [_header_pdp(PDP_DIGITAL_CHANNEL_HEADER, info.m_Source, info, _DIGITAL_HEADER_SIZE,
+                            _DIGITAL_HEADER_FIELDS, info.m_Channel) for info in digital_infos]
+    version = _PDP_HEADER.pack(PDP_VERSION, 0, 0, 1, 0, 0)[:10] + b'PLEXON'
+    first_data_block = len(version) + _PDP_HEADER.size + _FILE_INFO_SIZE + sum(len(h) for h in headers)
+
+    # per channel lists of (file offset, timestamp, count) of the data blocks
+    analog_blocks = [[] for _ in analog_infos]
+    spike_blocks = [[] for _ in spike_infos]
+    digital_blocks = [[] for _ in digital_infos]
+
+    with open(filename, 'wb') as f:
+        f.seek(first_data_block)
+
+        def write_block(blocks, pdp, tick, count):
+            blocks.append((f.tell(), tick, count))
+            f.write(pdp)
+
+        # blocks are written in time order, one block of every channel per
+        # block_size samples
+        for fragment_tick in fragment_ticks:
+            for start in range(0, samples_per_fragment, block_size):
+                n = min(block_size, samples_per_fragment - start)
+                tick = fragment_tick + int(round(start * ticks_per_sample))
+                end_tick = fragment_tick + int(round((start + n) * ticks_per_sample))
+                for i, info in enumerate(analog_infos):
+                    values = rng.integers(-2000, 2000, n, dtype=np.int16).astype('<i2')
+                    write_block(analog_blocks[i], _pdp(PDP_ANALOG_DATA, info.m_Source, values.tobytes(),
+                                                       info.m_Channel, n, tick), tick, n)
+                for i, info in enumerate(spike_infos):
+                    in_block = (spike_ticks[i] >= tick) & (spike_ticks[i] < end_tick)
+                    ticks, units = spike_ticks[i][in_block], spike_units[i][in_block]
+                    # a block holds at most 65535 waveforms
+                    for j in range(0, len(ticks), 0xFFFF):
+                        block_ticks = ticks[j:j + 0xFFFF].astype('<u8')
+                        block_units = units[j:j + 0xFFFF].astype('<u2')
+                        k = len(block_ticks)
+                        waveforms = rng.integers(-2000, 2000, (k, samples_per_spike), dtype=np.int16).astype('<i2')
+                        write_block(spike_blocks[i], _pdp(PDP_SPIKE_DATA, info.m_Source,
+                                                          block_ticks.tobytes() + block_units.tobytes() +
+                                                          waveforms.tobytes(),
+                                                          info.m_Channel, samples_per_spike, k),
+                                    int(block_ticks[0]), k)
+                for i, info in enumerate(digital_infos):
+                    ticks = event_ticks[i][(event_ticks[i] >= tick) & (event_ticks[i] < end_tick)]
+                    for j in range(0, len(ticks), 0xFFFF):
+                        block_ticks = ticks[j:j + 0xFFFF].astype('<i8')
+                        k = len(block_ticks)
+                        values = rng.integers(0, 256, k, dtype=np.uint16).astype('<u2')
+                        write_block(digital_blocks[i], _pdp(PDP_DIGITAL_DATA, info.m_Source,
+                                                            block_ticks.tobytes() + values.tobytes(),
+                                                            info.m_Channel, k),
+                                    int(block_ticks[0]), k)
+
+        # recording starts with the first piece, pauses after every piece,
+        # resumes with the next one and stops after the last one
+        piece_ticks = np.array(fragment_ticks, dtype=np.int64)
+        start_stop_ticks = np.empty(2 * fragments, dtype='<i8')
+        start_stop_ticks[0::2] = piece_ticks
+        start_stop_ticks[1::2] = piece_ticks + int(round(samples_per_fragment * ticks_per_sample))
+        start_stop_values = np.full(2 * fragments, PL2_PAUSE, dtype='<u2')
+        start_stop_values[0::2] = PL2_RESUME
+        start_stop_values[[0, -1]] = PL2_START, PL2_STOP
+        start_stop_blocks = []
+        write_block(start_stop_blocks, _pdp(PDP_START_STOP_DATA, 0,
+                                            start_stop_ticks.tobytes() + start_stop_values.tobytes(), 0,
+                                            len(start_stop_ticks)),
+                    int(start_stop_ticks[0]), len(start_stop_ticks))
+
+        first_summary = f.tell()
+        for pdp_type, infos, channel_blocks in ((PDP_ANALOG_SUMMARY, analog_infos, analog_blocks),
+                                                (PDP_SPIKE_SUMMARY, spike_infos, spike_blocks),
+                                                (PDP_DIGITAL_SUMMARY, digital_infos, digital_blocks)):
+            for info, blocks in zip(infos, channel_blocks):
+                blocks = np.array(blocks, dtype=np.uint64).reshape(-1, 3)
+                f.write(_pdp(pdp_type, info.m_Source,
+                             blocks[:, 0].astype('<u8').tobytes() + blocks[:, 1].astype('<u8').tobytes() +
+                             blocks[:, 2].astype('<u2').tobytes(),
+                             info.m_Channel, 0, int(blocks[:, 2].sum())))
+        blocks = np.array(start_stop_blocks, dtype=np.uint64)
+        f.write(_pdp(PDP_START_STOP_SUMMARY, 0,
+                     blocks[:, 0].astype('<u8').tobytes() + blocks[:, 1].astype('<u8').tobytes() +
+                     blocks[:, 2].astype('<u2').tobytes(), 0, 0, int(blocks[:, 2].sum())))
+
+        file_info_data = bytearray(_FILE_INFO_SIZE)
+        struct.pack_into('<QQQQQ', file_info_data, 8, first_data_block, 0, first_summary, 0, last_tick)
+        f.seek(0)
+        f.write(version)
+        f.write(_pdp(PDP_FILE_INFO, 0, file_info_data))
+        for header in headers:
+            f.write(header)
+
+
+def _peak_rss():
+    """
+    Returns the peak resident set size of this process in bytes, or None
+    where the resource module is not available.
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on linux, bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def _nbytes(res):
+    if res is None:
+        return 0
+    if isinstance(res, np.ndarray):
+        return res.nbytes
+    if isinstance(res, pypl2api.ScaledArray):
+        return res.raw.nbytes
+    if isinstance(res, (tuple, list)):
+        return sum(_nbytes(x) for x in res)
+    return 0
+
+
+def _benchmark(filename, backend, operation, repeat):
+    """
+    Times operation on all channels of filename, repeat times. Runs in a
+    worker process.
+
+    Returns:
+        dict with the latencies of all calls in seconds, the number of bytes
+        returned by all calls and the peak RSS
+    """
+    reader = PyPL2FileReader(backend=backend)
+    reader.pl2_open_file(filename)
+    info = pypl2api.pl2_info(filename, backend=backend)
+
+    if operation == 'pl2_info':
+        calls = [lambda: pypl2api.pl2_info(filename, backend=backend)]
+    elif operation in ('pl2_ad', 'pl2_spikes', 'pl2_events'):
+        function = getattr(pypl2api, operation)
+        channels = {'pl2_ad': info.ad, 'pl2_spikes': info.spikes, 'pl2_events': info.events}[operation]
+        calls = [lambda name=channel.name: function(filename, name, backend=backend) for channel in channels]
+    elif operation == 'pl2_ad_decimate':
+        calls = [lambda name=channel.name: pypl2api.pl2_ad(filename, name, backend=backend, decimate=_DECIMATE)
+                 for channel in info.ad]
+    else:
+        method = getattr(reader, operation)
+        n_channels = {'pl2_get_analog_channel_data': reader.pl2_file_info.m_TotalNumberOfAnalogChannels,
+                      'pl2_get_spike_channel_data': reader.pl2_file_info.m_TotalNumberOfSpikeChannels,
+                      'pl2_get_digital_channel_data': reader.pl2_file_info.m_NumberOfDigitalChannels}[operation]
+        calls = [lambda i=i: method(i) for i in range(n_channels)]
+
+    latencies = []
+    nbytes = 0
+    for _ in range(repeat):
+        for call in calls:
+            start = time.perf_counter()
+            res = call()
+            latencies.append(time.perf_counter() - start)
+            nbytes += _nbytes(res)
+            del res
+    reader.pl2_close_file()
+
+    return {'latencies': latencies, 'bytes': nbytes, 'peak_rss': _peak_rss()}
+
+
+def run_benchmarks(filename, backends=('dll', 'native'), operations=_OPERATIONS, repeat=5):
+    """
+    Times pypl2 operations on all channels of a file for each backend.
+
+    Usage:
+        >>>write_synthetic_pl2('bench.pl2', analog_channels=16, duration=60.0)
+        >>>for row in run_benchmarks('bench.pl2', backends=['native']):
+        >>>    print(row)
+
+    Args:
+        filename - full path of the .pl2 file
+        backends - backends to benchmark
+        operations - names of the pypl2api functions and PyPL2FileReader
+                     methods to time, or pl2_ad_decimate, all by default
+        repeat - number of times every call is timed
+
+    Returns:
+        list with one dict per backend and operation with the keys backend,
+        operation, calls, mb_per_s (returned data over total time), p50_ms,
+        p90_ms, p99_ms (latency percentiles of single calls) and peak_rss_mb
+        (peak resident memory of the process running the benchmark)
+    """
+
+    rows = []
+    for backend in backends:
+        for operation in operations:
+            if operation not in _OPERATIONS:
+                raise ValueError(f"Unknown operation '{operation}', expected one of {', '.join(_OPERATIONS)}")
+            with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+                res = executor.submit(_benchmark, str(filename), backend, operation, repeat).result()
+            latencies = np.array(res['latencies'])
+            total = latencies.sum()
+            rows.append({'backend': backend,
+                         'operation': operation,
+                         'calls': len(latencies),
+                         'mb_per_s': res['bytes'] / 1e6 / total if total else None,
+                         'p50_ms': float(np.percentile(latencies, 50) * 1e3) if len(latencies) else None,
+                         'p90_ms': float(np.percentile(latencies, 90) * 1e3) if len(latencies) else None,
+                         'p99_ms': float(np.percentile(latencies, 99) * 1e3) if len(latencies) else None,
+                         'peak_rss_mb': res['peak_rss'] / 1e6 if res['peak_rss'] is not None else None})
+    return rows
+
+
+def _time_in_new_process(statement, setup=''):
+    """
+    Returns the time statement takes in a new Python interpreter, after
+    setup, in seconds.
+    """
+    code = f'import time\n{setup}\nstart = time.perf_counter()\n{statement}\nprint(time.perf_counter() - start)'
+    path = os.path.dirname(os.path.abspath(__file__))
+    if os.environ.get('PYTHONPATH'):
+        path = os.pathsep.join([path, os.environ['PYTHONPATH']])
+    res = subprocess.run([sys.executable, '-c', code], env=dict(os.environ, PYTHONPATH=path), capture_output=True,
+                         text=True)
+    if res.returncode:
+        raise RuntimeError(f'{statement} failed in a new process:\n{res.stderr}')
+    return float(res.stdout.split()[-1])
+
+
+def _latency_row(backend, operation, latencies):
+    latencies = np.array(latencies)
+    return {'backend': backend,
+            'operation': operation,
+            'calls': len(latencies),
+            'mb_per_s': None,
+            'p50_ms': float(np.percentile(latencies, 50) * 1e3),
+            'p90_ms': float(np.percentile(latencies, 90) * 1e3),
+            'p99_ms': float(np.percentile(latencies, 99) * 1e3),
+            'peak_rss_mb': None}
+
+
+def run_startup_benchmark(filename=None, backends=('dll', 'native'), modules=('pypl2lib', 'pypl2api'), repeat=5):
+    """
+    Times how long importing pypl2 modules and the first call of pl2_info
+    take, each in a new Python interpreter, as a command line tool using
+    pypl2 would see it.
+
+    Usage:
+        >>>for row in run_startup_benchmark('bench.pl2', backends=['native']):
+        >>>    print(row)
+
+    Args:
+        filename - optional .pl2 file to time the first pl2_info call on
+        backends - backends to time the first pl2_info call with
+        modules - modules to time the import of
+        repeat - number of new interpreters every import or call is timed in
+
+    Returns:
+        list of dicts with the keys of the run_benchmarks rows. operation is
+        'import <module>' or 'first pl2_info', backend is None for imports.
+    """
+
+    rows = [_latency_row(None, f'import {module}', [_time_in_new_process(f'import {module}') for _ in range(repeat)])
+            for module in modules]
+    if filename is not None:
+        for backend in backends:
+            statement = f'pypl2api.pl2_info({str(filename)!r}, backend={backend!r})'
+            rows.append(_latency_row(backend, 'first pl2_info',
+                                     [_time_in_new_process(statement, 'import pypl2api') for _ in range(repeat)]))
+    return rows
+
+
+def _format_rows(rows):
+    columns = ('backend', 'operation', 'calls', 'mb_per_s', 'p50_ms', 'p90_ms', 'p99_ms', 'peak_rss_mb')
+
+    def cell(value):
+        if value is None:
+            return '-'
+        return f'{value:.2f}' if isinstance(value, float) else str(value)
+
+    table = [columns] + [tuple(cell(row[c]) for c in columns) for row in rows]
+    widths = [max(len(line[i]) for line in table) for i in range(len(columns))]
+    return '\n'.join('  '.join(value.rjust(width) for value, width in zip(line, widths)) for line in table)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmarks pypl2 on a synthetic or given .pl2 file.')
+    parser.add_argument('--file', help='benchmark this .pl2 file instead of a synthetic one')
+    parser.add_argument('--backends', nargs='+', choices=['dll', 'native'],
+                        help='defaults to both backends with --file and to native otherwise')
+    parser.add_argument('--operations', nargs='+', default=list(_OPERATIONS), choices=_OPERATIONS)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', help='also write the results to this JSON file')
+    parser.add_argument('--startup', action='store_true',
+                        help='time imports and the first pl2_info call instead of reading channels')
+    parser.add_argument('--analog-channels', type=int, default=4)
+    parser.add_argument('--sample-rate', type=float, default=40000.0)
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--spike-channels', type=int, default=4)
+    parser.add_argument('--spike-rate', type=float, default=20.0)
+    parser.add_argument('--samples-per-spike', type=int, default=32)
+    parser.add_argument('--event-channels', type=int, default=2)
+    parser.add_argument('--event-rate', type=float, default=1.0)
+    parser.add_argument('--fragments', type=int, default=1)
+    parser.add_argument('--gap', type=float, default=1.0)
+    args = parser.parse_args(argv)
+    if args.backends is None:
+        args.backends = ['dll', 'native'] if args.file else ['native']
+    elif 'dll' in args.backends and args.file is None:
+        parser.error('the dll backend can only be benchmarked on a real recording given with --file, '
+                     'PL2FileReader.dll is not known to accept the synthetic files')
+
+    with tempfile.TemporaryDirectory() as directory:
+        filename = args.file
+        if filename is None:
+            filename = os.path.join(directory, 'synthetic.pl2')
+            write_synthetic_pl2(filename, analog_channels=args.analog_channels, sample_rate=args.sample_rate,
+                                duration=args.duration, spike_channels=args.spike_channels,
+                                spike_rate=args.spike_rate, samples_per_spike=args.samples_per_spike,
+                                event_channels=args.event_channels, event_rate=args.event_rate,
+                                fragments=args.fragments, gap=args.gap)
+        if args.startup:
+            rows = run_startup_benchmark(filename, backends=args.backends, repeat=args.repeat)
+        else:
+            rows = run_benchmarks(filename, backends=args.backends, operations=args.operations, repeat=args.repeat)
+
+    print(_format_rows(rows))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
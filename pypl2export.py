@@ -0,0 +1,356 @@
+# pypl2export.py - Exports .pl2 files to chunked array containers and
+# columnar tables.
+#
+# Analog channels are streamed in chunks of values with
+# pl2_get_analog_channel_data_subset, and with the native backend spike
+# channels in chunks of spikes, so memory use is bounded by the chunk size
+# (times the number of workers) instead of by the channel length.
+# h5py and pyarrow are only needed when exporting, they are imported on
+# first use.
+
+from concurrent.futures import ThreadPoolExecutor
+import os
+import threading
+
+import numpy as np
+
+from pypl2api import PL2File
+from pypl2lib import PyPL2FileReader, merge_fragments
+
+
+def _import_h5py():
+    try:
+        import h5py
+    except ImportError:
+        raise ImportError('pl2_export_hdf5 requires h5py, install it with: pip install h5py') from None
+    return h5py
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError('pl2_export_parquet requires pyarrow, install it with: pip install pyarrow') from None
+    return pyarrow
+
+
+class _Readers:
+    """
+    One open PyPL2FileReader per worker thread, as readers can't be shared
+    between threads.
+    """
+
+    def __init__(self, filename, backend, reader_options):
+        self._filename = filename
+        self._backend = backend
+        self._reader_options = reader_options
+        self._local = threading.local()
+        self._readers = []
+        self._lock = threading.Lock()
+
+    def get(self):
+        reader = getattr(self._local, 'reader', None)
+        if reader is None:
+            reader = PyPL2FileReader(backend=self._backend, **self._reader_options)
+            reader.pl2_open_file(self._filename)
+            if reader.pl2_file_info is None:
+                raise IOError(f"Error: Can't open {self._filename}")
+            self._local.reader = reader
+            with self._lock:
+                self._readers.append(reader)
+        return reader
+
+    def close(self):
+        for reader in self._readers:
+            reader.pl2_close_file()
+        self._readers = []
+
+
+def _channel_attrs(channel_info, **extra):
+    attrs = {'name': channel_info.m_Name.decode('ascii'),
+             'source': channel_info.m_Source,
+             'channel': channel_info.m_Channel}
+    attrs.update(extra)
+    return attrs
+
+
+def _chunks(n, chunk_size):
+    # h5py does not accept empty chunk shapes, empty datasets are stored contiguously
+    return (min(n, chunk_size),) if n else None
+
+
+def _export_analog_channel(readers, index, group, chunk_size, timestamp_frequency):
+    reader = readers.get()
+    achannel_info = reader.pl2_get_analog_channel_info(index)
+    values = group['values']
+
+    chunk_fragment_timestamps = []
+    chunk_fragment_counts = []
+    for start in range(0, achannel_info.m_NumberOfValues, chunk_size):
+        res = reader.pl2_get_analog_channel_data_subset(index, start, chunk_size)
+        if res is None:
+            raise IOError(f'Error: Can\'t read analog channel {achannel_info.m_Name.decode("ascii")}')
+        fragment_timestamps, fragment_counts, chunk = res
+        values[start:start + len(chunk)] = chunk
+        chunk_fragment_timestamps.append(np.asarray(fragment_timestamps, dtype=np.int64))
+        chunk_fragment_counts.append(np.asarray(fragment_counts, dtype=np.uint64))
+
+    # fragments that continue from one chunk into the next are merged again
+    fragment_timestamps, fragment_counts = merge_fragments(
+        np.concatenate([np.zeros(0, dtype=np.int64)] + chunk_fragment_timestamps),
+        np.concatenate([np.zeros(0, dtype=np.uint64)] + chunk_fragment_counts),
+        timestamp_frequency / achannel_info.m_SamplesPerSecond)
+    group['fragment_timestamps'][:len(fragment_timestamps)] = fragment_timestamps
+    group['fragment_counts'][:len(fragment_counts)] = fragment_counts
+    group.attrs['number_of_fragments'] = len(fragment_timestamps)
+
+
+def _export_spike_channel(readers, index, group, chunk_size):
+    reader = readers.get()
+    schannel_info = reader.pl2_get_spike_channel_info(index)
+    # like analog chunks, a chunk holds about chunk_size waveform values
+    chunks = reader._get_spike_channel_data_chunks(index, max(1, chunk_size // max(schannel_info.m_SamplesPerSpike, 1)))
+    if chunks is None:
+        raise IOError(f'Error: Can\'t read spike channel {schannel_info.m_Name.decode("ascii")}')
+
+    start = 0
+    for spike_timestamps, units, waveforms in chunks:
+        group['timestamps'][start:start + len(spike_timestamps)] = spike_timestamps
+        group['units'][start:start + len(units)] = units
+        group['waveforms'][start:start + len(waveforms)] = waveforms
+        start += len(spike_timestamps)
+
+
+def _export_digital_channel(readers, index, group):
+    reader = readers.get()
+    res = reader.pl2_get_digital_channel_data(index)
+    if res is None:
+        echannel_info = reader.pl2_get_digital_channel_info(index)
+        raise IOError(f'Error: Can\'t read event channel {echannel_info.m_Name.decode("ascii")}')
+    event_timestamps, event_values = res
+    group['timestamps'][:] = event_timestamps
+    group['values'][:] = event_values
+
+
+def pl2_export_hdf5(filename, output_filename, chunk_size=2 ** 20, compression='gzip', max_workers=None,
+                    backend='dll', **reader_options):
+    """
+    Exports the enabled analog and spike channels and the event channels with
+    events of a .pl2 file to a chunked, compressed HDF5 file. Analog and
+    spike channels are read and written chunk by chunk, and channels are
+    exported in parallel.
+
+    Usage:
+        >>>pl2_export_hdf5('data/file.pl2', 'data/file.h5')
+
+    The HDF5 file holds raw a/d values and timestamps in ticks, like
+    PyPL2FileReader returns them:
+        /analog/<name>/values, fragment_timestamps, fragment_counts
+        /spikes/<name>/timestamps, units, waveforms
+        /events/<name>/timestamps, values
+    Fragment arrays are zero padded to PL2AnalogChannelInfo.m_MaximumNumberOfFragments,
+    the number_of_fragments attribute gives the number of fragments. The
+    channel groups have name, source and channel attributes, analog and spike
+    channels also samples_per_second and coeff_to_convert_to_units. The file
+    has timestamp_frequency, start_recording_time and duration_of_recording
+    attributes.
+
+    Args:
+        filename - full path of the .pl2 file
+        output_filename - path of the HDF5 file to create
+        chunk_size - number of analog values, or of spike waveform values, read and
+                     written at once, also the chunk length of the HDF5 datasets
+        compression - HDF5 compression filter, e.g. 'gzip' (default), 'lzf' or None
+        max_workers - number of channels exported in parallel, defaults to the
+                      number of CPUs
+        backend - 'dll' (default) reads the file through PL2FileReader.dll, 'native'
+                  parses it directly with NumPy
+        reader_options - further keyword arguments for PyPL2FileReader
+
+    Returns:
+        None
+    """
+
+    h5py = _import_h5py()
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+
+    readers = _Readers(filename, backend, reader_options)
+    try:
+        reader = readers.get()
+        file_info = reader.pl2_file_info
+        timestamp_frequency = file_info.m_TimestampFrequency
+
+        with h5py.File(output_filename, 'w') as output:
+            output.attrs['timestamp_frequency'] = timestamp_frequency
+            output.attrs['start_recording_time'] = file_info.m_StartRecordingTime
+            output.attrs['duration_of_recording'] = file_info.m_DurationOfRecording
+
+            # datasets are created up front, the workers only fill them
+            tasks = []
+            analog = output.create_group('analog')
+            for i in range(file_info.m_TotalNumberOfAnalogChannels):
+                achannel_info = reader.pl2_get_analog_channel_info(i)
+                if not achannel_info.m_ChannelEnabled:
+                    continue
+                n = achannel_info.m_NumberOfValues
+                group = analog.create_group(achannel_info.m_Name.decode('ascii'))
+                group.attrs.update(_channel_attrs(
+                    achannel_info, samples_per_second=achannel_info.m_SamplesPerSecond,
+                    coeff_to_convert_to_units=achannel_info.m_CoeffToConvertToUnits))
+                group.create_dataset('values', shape=(n,), dtype=np.int16, chunks=_chunks(n, chunk_size),
+                                     compression=compression if n else None)
+                group.create_dataset('fragment_timestamps', shape=(achannel_info.m_MaximumNumberOfFragments,),
+                                     dtype=np.int64)
+                group.create_dataset('fragment_counts', shape=(achannel_info.m_MaximumNumberOfFragments,),
+                                     dtype=np.uint64)
+                tasks.append((_export_analog_channel, i, group, chunk_size, timestamp_frequency))
+
+            spikes = output.create_group('spikes')
+            for i in range(file_info.m_TotalNumberOfSpikeChannels):
+                schannel_info = reader.pl2_get_spike_channel_info(i)
+                if not schannel_info.m_ChannelEnabled:
+                    continue
+                n = schannel_info.m_NumberOfSpikes
+                samples = schannel_info.m_SamplesPerSpike
+                group = spikes.create_group(schannel_info.m_Name.decode('ascii'))
+                group.attrs.update(_channel_attrs(
+                    schannel_info, samples_per_second=schannel_info.m_SamplesPerSecond,
+                    coeff_to_convert_to_units=schannel_info.m_CoeffToConvertToUnits))
+                group.create_dataset('timestamps', shape=(n,), dtype=np.uint64, chunks=_chunks(n, chunk_size),
+                                     compression=compression if n else None)
+                group.create_dataset('units', shape=(n,), dtype=np.uint16, chunks=_chunks(n, chunk_size),
+                                     compression=compression if n else None)
+                group.create_dataset('waveforms', shape=(n, samples), dtype=np.int16,
+                                     chunks=(max(1, min(n, chunk_size // max(samples, 1))), samples)
+                                     if n and samples else None,
+                                     compression=compression if n and samples else None)
+                tasks.append((_export_spike_channel, i, group, chunk_size))
+
+            events = output.create_group('events')
+            for i in range(file_info.m_NumberOfDigitalChannels):
+                echannel_info = reader.pl2_get_digital_channel_info(i)
+                if not echannel_info.m_NumberOfEvents:
+                    continue
+                n = echannel_info.m_NumberOfEvents
+                group = events.create_group(echannel_info.m_Name.decode('ascii'))
+                group.attrs.update(_channel_attrs(echannel_info))
+                group.create_dataset('timestamps', shape=(n,), dtype=np.int64, chunks=_chunks(n, chunk_size),
+                                     compression=compression)
+                group.create_dataset('values', shape=(n,), dtype=np.uint16, chunks=_chunks(n, chunk_size),
+                                     compression=compression)
+                tasks.append((_export_digital_channel, i, group))
+
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                futures = [executor.submit(function, readers, *args) for function, *args in tasks]
+                for future in futures:
+                    # re-raises errors of the workers
+                    future.result()
+    finally:
+        readers.close()
+
+
+def pl2_export_parquet(filename, spikes_filename, events_filename=None, waveforms=False, backend='dll',
+                       **reader_options):
+    """
+    Exports the spikes of all enabled spike channels, and optionally the
+    events of all event channels with events, of a .pl2 file to Parquet
+    tables. Channels are read one after the other and each is written as a
+    row group of its own, so only one channel is kept in memory.
+
+    Usage:
+        >>>pl2_export_parquet('data/file.pl2', 'data/spikes.parquet', 'data/events.parquet')
+
+    The spikes table has the columns
+        channel - spike channel name
+        unit - unit assignment (0 = unsorted, 1 = Unit A, 2 = Unit B, etc)
+        timestamp_ticks - spike timestamp in ticks
+        timestamp_s - spike timestamp in seconds
+        waveform - only with waveforms=True, raw int16 a/d values of the
+                   waveform as a fixed size list
+    and the events table the columns channel, value, timestamp_ticks and
+    timestamp_s. The channel column is dictionary encoded. The tables'
+    metadata holds the timestamp frequency and, for waveforms, the
+    coefficients to convert the a/d values of each channel to volts.
+
+    Args:
+        filename - full path of the .pl2 file
+        spikes_filename - path of the spikes Parquet file to create
+        events_filename - path of the events Parquet file to create, None to
+                          not export events
+        waveforms - if True, the spikes table has a waveform column. All spike
+                    channels must then have the same number of samples per spike.
+        backend - 'dll' (default) reads the file through PL2FileReader.dll, 'native'
+                  parses it directly with NumPy
+        reader_options - further keyword arguments for PyPL2FileReader
+
+    Returns:
+        None
+    """
+
+    pa = _import_pyarrow()
+
+    with PL2File(filename, backend=backend, **reader_options) as f:
+        timestamp_frequency = f.file_info.m_TimestampFrequency
+        channel_type = pa.dictionary(pa.int32(), pa.string())
+
+        schannel_indices = [i for i, info in enumerate(f.spike_channel_infos) if info.m_ChannelEnabled]
+        fields = [pa.field('channel', channel_type),
+                  pa.field('unit', pa.uint16()),
+                  pa.field('timestamp_ticks', pa.uint64()),
+                  pa.field('timestamp_s', pa.float64())]
+        metadata = {'timestamp_frequency': repr(timestamp_frequency)}
+        if waveforms:
+            samples_per_spike = {f.spike_channel_infos[i].m_SamplesPerSpike for i in schannel_indices}
+            if len(samples_per_spike) > 1:
+                raise ValueError('The spike channels have different numbers of samples per spike, '
+                                 'export them without waveforms')
+            samples_per_spike = samples_per_spike.pop() if samples_per_spike else 0
+            fields.append(pa.field('waveform', pa.list_(pa.int16(), samples_per_spike)))
+            metadata['coeff_to_convert_to_units'] = repr(
+                {f.spike_channel_infos[i].m_Name.decode('ascii'): f.spike_channel_infos[i].m_CoeffToConvertToUnits
+                 for i in schannel_indices})
+        schema = pa.schema(fields, metadata=metadata)
+
+        with pa.parquet.ParquetWriter(spikes_filename, schema) as writer:
+            for i in schannel_indices:
+                res = f.reader.pl2_get_spike_channel_data(i)
+                if res is None:
+                    raise IOError(f"Error: Can't read spike channel {i} of {filename}")
+                spike_timestamps, units, values = res
+                n = len(spike_timestamps)
+                columns = [pa.DictionaryArray.from_arrays(np.zeros(n, dtype=np.int32),
+                                                          [f.spike_channel_infos[i].m_Name.decode('ascii')]),
+                           pa.array(units, type=pa.uint16()),
+                           pa.array(spike_timestamps, type=pa.uint64()),
+                           pa.array(spike_timestamps / timestamp_frequency, type=pa.float64())]
+                if waveforms:
+                    columns.append(pa.FixedSizeListArray.from_arrays(
+                        pa.array(np.ascontiguousarray(values, dtype=np.int16).ravel()), samples_per_spike))
+                writer.write_table(pa.Table.from_arrays(columns, schema=schema))
+
+        if events_filename is None:
+            return
+
+        schema = pa.schema([pa.field('channel', channel_type),
+                            pa.field('value', pa.uint16()),
+                            pa.field('timestamp_ticks', pa.int64()),
+                            pa.field('timestamp_s', pa.float64())],
+                           metadata={'timestamp_frequency': repr(timestamp_frequency)})
+
+        with pa.parquet.ParquetWriter(events_filename, schema) as writer:
+            for i, echannel_info in enumerate(f.digital_channel_infos):
+                if not echannel_info.m_NumberOfEvents:
+                    continue
+                res = f.reader.pl2_get_digital_channel_data(i)
+                if res is None:
+                    raise IOError(f"Error: Can't read event channel {i} of {filename}")
+                event_timestamps, event_values = res
+                n = len(event_timestamps)
+                columns = [pa.DictionaryArray.from_arrays(np.zeros(n, dtype=np.int32),
+                                                          [echannel_info.m_Name.decode('ascii')]),
+                           pa.array(event_values, type=pa.uint16()),
+                           pa.array(event_timestamps, type=pa.int64()),
+                           pa.array(event_timestamps / timestamp_frequency, type=pa.float64())]
+                writer.write_table(pa.Table.from_arrays(columns, schema=schema))
@@ -9,21 +9,80 @@
 # copyright notice is kept intact.
 
 from sys import platform
+from collections import namedtuple
+import ctypes
+import os
 import pathlib
+import tempfile
+import threading
 import warnings
+import weakref
 
+# on other systems the .dll runs in wine through zugbruecke
 if any(platform.startswith(name) for name in ('linux', 'darwin', 'freebsd')):
-    from zugbruecke import CtypesSession
-
-    ctypes = CtypesSession(log_level=100)
-
+    _USE_ZUGBRUECKE = True
 elif platform.startswith('win'):
-    import ctypes
+    _USE_ZUGBRUECKE = False
 else:
     raise SystemError('unsupported platform')
 
 import numpy as np
 
+from pypl2rpc import _wine_path, get_rpc_session
+from pypl2trace import TracedDLL, span
+
+# zugbruecke session and .dlls loaded through it, see _get_session()
+_session = None
+_session_dlls = {}
+_pl2_dlls = {}
+_session_lock = threading.RLock()
+
+
+def _get_session():
+    """
+    Returns the zugbruecke session running the .dlls in wine. Starting it
+    starts wine, which takes seconds, so it is only started when the first
+    .dll is loaded, and then shared by the whole process.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            from zugbruecke import CtypesSession
+            _session = CtypesSession(log_level=100)
+        return _session
+
+
+def _load_session_dll(name, dll_type='CDLL'):
+    """
+    Loads a .dll in the zugbruecke session, once per process.
+    """
+    with _session_lock:
+        key = (name, dll_type)
+        if key not in _session_dlls:
+            _session_dlls[key] = getattr(_get_session(), dll_type)(name)
+        return _session_dlls[key]
+
+
+def _load_pl2_dll(pl2_dll_file_path):
+    """
+    Loads PL2FileReader.dll and sets the prototypes of its functions. Through
+    zugbruecke every load is a round trip to wine, so all readers share one
+    loaded .dll per path. With windows ctypes every reader loads its own.
+    """
+    try:
+        if _USE_ZUGBRUECKE:
+            with _session_lock:
+                key = str(pl2_dll_file_path)
+                if key not in _pl2_dlls:
+                    _pl2_dlls[key] = _define_prototypes(TracedDLL(_load_session_dll(key)))
+                return _pl2_dlls[key]
+        return _define_prototypes(TracedDLL(ctypes.CDLL(str(pl2_dll_file_path))))
+    except IOError:
+        raise IOError(f"Error: Can't load PL2FileReader.dll at: {pl2_dll_file_path}"
+                      "PL2FileReader.dll is bundled with the C++ PL2 Offline Files SDK"
+                      "located on the Plexon Inc website: www.plexon.com"
+                      "Contact Plexon Support for more information: support@plexon.com")
+
 
 class tm(ctypes.Structure):
     _fields_ = [("tm_sec", ctypes.c_int),
@@ -112,6 +171,135 @@ class PL2DigitalChannelInfo(ctypes.Structure):
                 ("m_NumberOfEvents", ctypes.c_ulonglong)]
 
 
+class PL2BlockInfo(ctypes.Structure):
+    _fields_ = [("m_Type", ctypes.c_int),
+                ("m_Source", ctypes.c_uint),
+                ("m_Channel", ctypes.c_uint),
+                ("m_NumberOfItems", ctypes.c_uint)]
+
+
+# Values of PL2BlockInfo.m_Type
+PL2_BLOCK_TYPE_SPIKE = 1
+PL2_BLOCK_TYPE_ANALOG = 2
+PL2_BLOCK_TYPE_DIGITAL_EVENT = 3
+PL2_BLOCK_TYPE_STARTSTOP_EVENT = 4
+
+# Values of the start/stop channel events
+PL2_STOP = 0
+PL2_START = 1
+PL2_PAUSE = 2
+PL2_RESUME = 3
+
+# Data blocks yielded by PyPL2FileReader.iter_data_blocks()
+PL2SpikeBlock = namedtuple('PL2SpikeBlock', 'source channel timestamps units waveforms')
+PL2AnalogBlock = namedtuple('PL2AnalogBlock', 'source channel timestamp values')
+PL2DigitalBlock = namedtuple('PL2DigitalBlock', 'source channel timestamps values')
+PL2StartStopBlock = namedtuple('PL2StartStopBlock', 'timestamps values')
+
+
+# Prototypes of the PL2FileReader.dll functions as (restype, argtypes,
+# memsync), set once when the .dll is loaded. memsync tells zugbruecke which
+# pointer arguments are strings or arrays and how long they are, so that it
+# copies them between linux and wine.
+_c_int = ctypes.c_int
+_p_char = ctypes.POINTER(ctypes.c_char)
+_p_ulonglong = ctypes.POINTER(ctypes.c_ulonglong)
+_p_longlong = ctypes.POINTER(ctypes.c_longlong)
+_p_ushort = ctypes.POINTER(ctypes.c_ushort)
+_p_short = ctypes.POINTER(ctypes.c_short)
+_NAME = {'p': [1], 'n': True}  # null-terminated channel name
+
+_PROTOTYPES = {
+    'PL2_OpenFile': (ctypes.c_int, (_p_char, ctypes.POINTER(ctypes.c_int)), [{'p': [0], 'n': True}]),
+    'PL2_CloseFile': (ctypes.c_int, (_c_int,), []),
+    'PL2_CloseAllFiles': (ctypes.c_int, (), []),
+    'PL2_GetLastError': (ctypes.c_int, (_p_char, _c_int), [{'p': [0], 'l': [1], 't': ctypes.c_char}]),
+    'PL2_GetFileInfo': (ctypes.c_int, (_c_int, ctypes.POINTER(PL2FileInfo)), []),
+    'PL2_GetAnalogChannelInfo': (ctypes.c_int, (_c_int, _c_int, ctypes.POINTER(PL2AnalogChannelInfo)), []),
+    'PL2_GetAnalogChannelInfoByName': (ctypes.c_int, (_c_int, _p_char, ctypes.POINTER(PL2AnalogChannelInfo)),
+                                       [_NAME]),
+    'PL2_GetAnalogChannelInfoBySource': (ctypes.c_int,
+                                         (_c_int, _c_int, _c_int, ctypes.POINTER(PL2AnalogChannelInfo)), []),
+    'PL2_GetAnalogChannelDataSubset': (
+        ctypes.c_int,
+        (_c_int, _c_int, ctypes.c_ulonglong, ctypes.c_uint, _p_ulonglong, _p_ulonglong, _p_longlong, _p_ulonglong,
+         _p_short),
+        [{'p': [6], 'l': [4], 't': ctypes.c_longlong}, {'p': [7], 'l': [4], 't': ctypes.c_ulonglong},
+         {'p': [8], 'l': [5], 't': ctypes.c_short}]),
+    'PL2_GetAnalogChannelDataByName': (
+        ctypes.c_int,
+        (_c_int, _p_char, _p_ulonglong, _p_ulonglong, _p_longlong, _p_ulonglong, _p_short),
+        [_NAME, {'p': [4], 'l': [2], 't': ctypes.c_longlong}, {'p': [5], 'l': [2], 't': ctypes.c_ulonglong},
+         {'p': [6], 'l': [3], 't': ctypes.c_short}]),
+    'PL2_GetAnalogChannelDataBySource': (
+        ctypes.c_int,
+        (_c_int, _c_int, _c_int, _p_ulonglong, _p_ulonglong, _p_longlong, _p_ulonglong, _p_short),
+        [{'p': [5], 'l': [3], 't': ctypes.c_longlong}, {'p': [6], 'l': [3], 't': ctypes.c_ulonglong},
+         {'p': [7], 'l': [4], 't': ctypes.c_short}]),
+    'PL2_GetSpikeChannelInfo': (ctypes.c_int, (_c_int, _c_int, ctypes.POINTER(PL2SpikeChannelInfo)), []),
+    'PL2_GetSpikeChannelInfoByName': (ctypes.c_int, (_c_int, _p_char, ctypes.POINTER(PL2SpikeChannelInfo)),
+                                      [_NAME]),
+    'PL2_GetSpikeChannelInfoBySource': (ctypes.c_int,
+                                        (_c_int, _c_int, _c_int, ctypes.POINTER(PL2SpikeChannelInfo)), []),
+    'PL2_GetDigitalChannelInfo': (ctypes.c_int, (_c_int, _c_int, ctypes.POINTER(PL2DigitalChannelInfo)), []),
+    'PL2_GetDigitalChannelInfoByName': (ctypes.c_int, (_c_int, _p_char, ctypes.POINTER(PL2DigitalChannelInfo)),
+                                        [_NAME]),
+    'PL2_GetDigitalChannelInfoBySource': (ctypes.c_int,
+                                          (_c_int, _c_int, _c_int, ctypes.POINTER(PL2DigitalChannelInfo)), []),
+    'PL2_GetDigitalChannelDataByName': (
+        ctypes.c_int,
+        (_c_int, _p_char, _p_ulonglong, _p_longlong, _p_ushort),
+        [_NAME, {'p': [3], 'l': [2], 't': ctypes.c_longlong}, {'p': [4], 'l': [2], 't': ctypes.c_ushort}]),
+    'PL2_GetDigitalChannelDataBySource': (
+        ctypes.c_int,
+        (_c_int, _c_int, _c_int, _p_ulonglong, _p_longlong, _p_ushort),
+        [{'p': [4], 'l': [3], 't': ctypes.c_longlong}, {'p': [5], 'l': [3], 't': ctypes.c_ushort}]),
+    'PL2_GetStartStopChannelInfo': (ctypes.c_int, (_c_int, _p_ulonglong), []),
+    'PL2_GetStartStopChannelData': (
+        ctypes.c_int,
+        (_c_int, _p_ulonglong, _p_longlong, _p_ushort),
+        [{'p': [2], 'l': [1], 't': ctypes.c_longlong}, {'p': [3], 'l': [1], 't': ctypes.c_ushort}]),
+    'PL2_ReadFirstDataBlock': (ctypes.c_int, (_c_int,), []),
+    'PL2_ReadNextDataBlock': (ctypes.c_int, (_c_int,), []),
+    'PL2_GetDataBlockInfo': (ctypes.c_int, (_c_int, ctypes.POINTER(PL2BlockInfo)), []),
+    'PL2_GetAnalogDataBlockTimestamp': (ctypes.c_longlong, (_c_int,), []),
+}
+# the data block functions return a pointer into the .dll's memory
+_PROTOTYPES.update({name: (ctypes.c_void_p, (_c_int,), []) for name in (
+    'PL2_GetSpikeDataBlockTimestamps', 'PL2_GetSpikeDataBlockUnits', 'PL2_GetSpikeDataBlockWaveforms',
+    'PL2_GetAnalogDataBlockValues', 'PL2_GetDigitalDataBlockTimestamps', 'PL2_GetDigitalDataBlockValues',
+    'PL2_GetStartStopDataBlockTimestamps', 'PL2_GetStartStopDataBlockValues')})
+
+# Functions whose prototype depends on the call: the shared memory readers
+# pass their output arrays as addresses, and the waveform array length of
+# the spike functions depends on the channel. Their prototype is set for
+# every call by PyPL2FileReader._call_with_prototype() under a lock of the
+# function, as readers in other threads may share the .dll.
+_VARIABLE_PROTOTYPES = ('PL2_GetAnalogChannelData', 'PL2_GetSpikeChannelData', 'PL2_GetSpikeChannelDataByName',
+                        'PL2_GetSpikeChannelDataBySource', 'PL2_GetDigitalChannelData')
+
+# locks of the _VARIABLE_PROTOTYPES functions per loaded .dll
+_prototype_locks = weakref.WeakKeyDictionary()
+
+
+def _define_prototypes(dll):
+    """
+    Sets the prototypes of _PROTOTYPES on a loaded .dll.
+    """
+    for name, (restype, argtypes, memsync) in _PROTOTYPES.items():
+        try:
+            function = getattr(dll, name)
+        except AttributeError:
+            # not in older .dll versions, calling it fails like before
+            continue
+        function.restype = restype
+        function.argtypes = argtypes
+        if _USE_ZUGBRUECKE:
+            function.memsync = memsync
+    _prototype_locks[dll] = {name: threading.Lock() for name in _VARIABLE_PROTOTYPES}
+    return dll
+
+
 def to_array(c_array):
     return np.ctypeslib.as_array(c_array)
 
@@ -121,8 +309,370 @@ def to_array_nonzero(c_array):
     return a[np.where(a)]
 
 
+def _channel_name_key(channel_name):
+    if hasattr(channel_name, 'encode'):
+        channel_name = channel_name.encode('ascii')
+    return channel_name
+
+
+def _channel_indices(channel_infos):
+    """
+    Maps the names and (source, channel) pairs of channel infos to their
+    zero-based channel indices. Like the .dll, the first channel wins if a
+    name is used more than once.
+    """
+    indices_by_name = {}
+    indices_by_source = {}
+    for i, channel_info in enumerate(channel_infos):
+        indices_by_name.setdefault(channel_info.m_Name, i)
+        indices_by_source.setdefault((channel_info.m_Source, channel_info.m_Channel), i)
+    return indices_by_name, indices_by_source
+
+
+# increment when the content of sidecar index files changes
+_SIDECAR_INDEX_VERSION = 1
+
+
+def _sidecar_index_path(pl2_file):
+    return pathlib.Path(f'{pl2_file}.idx')
+
+
+def _sidecar_index_key(pl2_file):
+    """
+    Identifies the version of a file a sidecar index was made for.
+    """
+    stat = os.stat(pl2_file)
+    return np.array([_SIDECAR_INDEX_VERSION, stat.st_size, stat.st_mtime_ns], dtype=np.int64)
+
+
+def merge_fragments(block_timestamps, block_counts, ticks_per_sample):
+    """
+    Merges consecutive analog data blocks without a gap in between into
+    fragments, the same way PL2FileReader.dll does. Also merges the
+    fragments of consecutive pl2_get_analog_channel_data_subset reads.
+
+    Args:
+        block_timestamps - timestamp of the first value of each block
+        block_counts - number of values of each block
+        ticks_per_sample - timestamp ticks from one value to the next
+
+    Returns:
+        fragment_timestamps - timestamp of the first value of each fragment
+        fragment_counts - number of values of each fragment
+    """
+    if not len(block_timestamps):
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.uint64)
+
+    expected = np.floor(block_counts * ticks_per_sample + block_timestamps + 0.5).astype(np.int64)
+    starts = np.flatnonzero(np.r_[True, block_timestamps[1:] != expected[:-1]])
+
+    return block_timestamps[starts], np.add.reduceat(block_counts, starts).astype(np.uint64)
+
+
+def _ticks_to_value_index(ticks, fragment_timestamps, fragment_counts, ticks_per_sample):
+    """
+    Returns the index of the first value recorded at or after ticks. Times
+    between fragments map to the first value of the following fragment.
+    """
+    fragment_starts = np.concatenate(([0], np.cumsum(fragment_counts, dtype=np.int64)))
+    fragment = np.searchsorted(fragment_timestamps, ticks, side='right') - 1
+    if fragment < 0:
+        return 0
+
+    # small tolerance so values recorded exactly at ticks are included
+    offset = int(np.ceil((ticks - fragment_timestamps[fragment]) / ticks_per_sample - 1e-9))
+    return int(fragment_starts[fragment] + min(max(offset, 0), int(fragment_counts[fragment])))
+
+
+# number of values read at a time by decimated reads
+DECIMATION_CHUNK_SIZE = 1 << 18
+
+
+def _decimation_factor(samples_per_second, decimate=None, target_rate=None):
+    """
+    Returns the integer decimation factor given either directly or as the
+    sampling rate after decimation.
+    """
+    if decimate is not None and target_rate is not None:
+        raise ValueError('Only one of decimate and target_rate can be given')
+    if target_rate is not None:
+        if target_rate <= 0:
+            raise ValueError('target_rate must be positive')
+        decimate = int(round(samples_per_second / target_rate))
+        if decimate < 1 or not np.isclose(samples_per_second / decimate, target_rate):
+            raise ValueError(f'target_rate {target_rate} is not the sampling rate {samples_per_second} '
+                             f'divided by an integer')
+    if decimate is None or int(decimate) != decimate or decimate < 1:
+        raise ValueError('decimate must be a positive integer')
+    return int(decimate)
+
+
+def _lowpass_taps(factor):
+    """
+    Anti-aliasing FIR filter for decimating by factor, as used by
+    scipy.signal.decimate: 20 * factor + 1 taps of a Hamming windowed sinc
+    with its cutoff at the Nyquist frequency after decimation.
+    """
+    n = 20 * factor + 1
+    taps = np.sinc((np.arange(n) - (n - 1) / 2) / factor) * np.hamming(n)
+    return taps / taps.sum()
+
+
+class _Decimator:
+    """
+    Low-pass filters and downsamples the values of one fragment that are
+    passed in chunks. The values the filter still needs are kept from one
+    chunk to the next, so the result does not depend on the chunk sizes.
+    Output value k is centered on input value k * factor, so it is not
+    delayed, and the fragment is extended with its first and last value to
+    filter its ends.
+    """
+
+    def __init__(self, factor, taps):
+        self.factor = factor
+        self.taps = taps
+        self._half = (len(taps) - 1) // 2
+        self._buffer = None
+        self._last = None
+        self._n_in = 0
+        self._n_out = 0
+
+    def _filter(self, buffer, n):
+        """
+        Returns n output values from buffer, which starts at the first
+        value of the window of the first output value.
+        """
+        if n <= 0:
+            return np.zeros(0)
+        buffer = buffer[:(n - 1) * self.factor + len(self.taps)]
+        # polyphase: only the kept output values are computed
+        return sum(np.correlate(buffer[phase::self.factor], self.taps[phase::self.factor], 'valid')
+                   for phase in range(self.factor))
+
+    def process(self, values):
+        """
+        Returns the output values that the values passed so far complete.
+        """
+        if not len(values):
+            return np.zeros(0)
+        values = np.asarray(values, dtype=np.float64)
+        if self._buffer is None:
+            self._buffer = np.full(self._half, values[0])
+        self._last = values[-1]
+        self._n_in += len(values)
+
+        buffer = np.concatenate((self._buffer, values))
+        n = max(0, (len(buffer) - len(self.taps)) // self.factor + 1)
+        out = self._filter(buffer, n)
+        self._buffer = buffer[n * self.factor:]
+        self._n_out += n
+        return out
+
+    def finish(self):
+        """
+        Returns the remaining output values, one per factor input values in
+        total.
+        """
+        if self._buffer is None:
+            return np.zeros(0)
+        buffer = np.concatenate((self._buffer, np.full(self._half, self._last)))
+        return self._filter(buffer, -(-self._n_in // self.factor) - self._n_out)
+
+
+# Windows API constants for _WineSharedMemory
+_GENERIC_READ = 0x80000000
+_GENERIC_WRITE = 0x40000000
+_FILE_SHARE_READ = 0x1
+_FILE_SHARE_WRITE = 0x2
+_OPEN_EXISTING = 3
+_PAGE_READWRITE = 0x4
+_FILE_MAP_ALL_ACCESS = 0xF001F
+_INVALID_HANDLE_VALUES = (None, 0, 2 ** 32 - 1, 2 ** 64 - 1)
+
+_kernel32 = None
+
+
+def _get_kernel32():
+    """
+    Returns kernel32.dll loaded in the zugbruecke session, with the
+    prototypes of the functions used by _WineSharedMemory set once.
+    """
+    global _kernel32
+    with _session_lock:
+        if _kernel32 is None:
+            kernel32 = _load_session_dll('kernel32.dll', 'WinDLL')
+            kernel32.CreateFileA.argtypes = (ctypes.c_char_p, ctypes.c_uint, ctypes.c_uint, ctypes.c_void_p,
+                                             ctypes.c_uint, ctypes.c_uint, ctypes.c_void_p)
+            kernel32.CreateFileA.restype = ctypes.c_void_p
+            kernel32.CreateFileMappingA.argtypes = (ctypes.c_void_p, ctypes.c_void_p, ctypes.c_uint,
+                                                    ctypes.c_uint, ctypes.c_uint, ctypes.c_char_p)
+            kernel32.CreateFileMappingA.restype = ctypes.c_void_p
+            kernel32.MapViewOfFile.argtypes = (ctypes.c_void_p, ctypes.c_uint, ctypes.c_uint,
+                                               ctypes.c_uint, ctypes.c_size_t)
+            kernel32.MapViewOfFile.restype = ctypes.c_void_p
+            kernel32.UnmapViewOfFile.argtypes = (ctypes.c_void_p,)
+            kernel32.CloseHandle.argtypes = (ctypes.c_void_p,)
+            kernel32.RtlMoveMemory.argtypes = (ctypes.c_void_p, ctypes.c_void_p, ctypes.c_size_t)
+            kernel32.RtlMoveMemory.restype = None
+            _kernel32 = kernel32
+        return _kernel32
+
+
+class _WineSharedMemory:
+    """
+    Array in a /dev/shm file that is mapped on the linux side with NumPy
+    and, through kernel32 calls made over zugbruecke, in the wine process
+    that runs PL2FileReader.dll. The .dll writes its output to address and
+    the data shows up in array without being serialized by zugbruecke.
+    """
+
+    def __init__(self, shape, dtype):
+        dtype = np.dtype(dtype)
+        size = max(int(np.prod(shape, dtype=np.int64)) * dtype.itemsize, 1)
+
+        self._kernel32 = _get_kernel32()
+        self._file = None
+        self._mapping = None
+        self.address = None
+
+        fd, path = tempfile.mkstemp(prefix='pypl2-', dir='/dev/shm')
+        try:
+            os.ftruncate(fd, size)
+            mapped = np.memmap(path, dtype=np.uint8, mode='r+', shape=(size,))
+            self.array = mapped[:size - size % dtype.itemsize].view(dtype).reshape(shape).view(np.ndarray)
+
+            wine_path = _wine_path(path)
+            file = self._kernel32.CreateFileA(wine_path.encode('ascii'), _GENERIC_READ | _GENERIC_WRITE,
+                                              _FILE_SHARE_READ | _FILE_SHARE_WRITE, None, _OPEN_EXISTING, 0, None)
+            if file in _INVALID_HANDLE_VALUES:
+                raise IOError(f"Error: Can't open shared memory file {wine_path} in wine")
+            self._file = file
+            self._mapping = self._kernel32.CreateFileMappingA(self._file, None, _PAGE_READWRITE, 0, 0, None)
+            if not self._mapping:
+                raise IOError(f"Error: Can't create a mapping of shared memory file {wine_path} in wine")
+            self.address = self._kernel32.MapViewOfFile(self._mapping, _FILE_MAP_ALL_ACCESS, 0, 0, 0)
+            if not self.address:
+                raise IOError(f"Error: Can't map shared memory file {wine_path} in wine")
+        except BaseException:
+            # don't leak the handles opened so far in the wine process
+            self.close()
+            raise
+        finally:
+            os.close(fd)
+            # the mappings on both sides keep the memory alive
+            os.unlink(path)
+
+    def copy_from(self, address, nbytes):
+        """
+        Copies nbytes from address in the wine process into the memory.
+        """
+        self._kernel32.RtlMoveMemory(self.address, address, nbytes)
+
+    def close(self):
+        """
+        Unmaps the memory on the wine side. array stays valid. Does nothing
+        if it is already unmapped.
+        """
+        if self.address:
+            self._kernel32.UnmapViewOfFile(self.address)
+        if self._mapping:
+            self._kernel32.CloseHandle(self._mapping)
+        if self._file is not None:
+            self._kernel32.CloseHandle(self._file)
+        self._file = self._mapping = self.address = None
+
+
+class _WineCopyBuffer:
+    """
+    Shared memory that arrays at addresses in the wine process are copied
+    into with RtlMoveMemory. The mapping is reused for every copy and only
+    replaced by a larger one when an array doesn't fit.
+    """
+
+    def __init__(self):
+        self._memory = None
+
+    def copy(self, address, c_type, n_items):
+        """
+        Returns a copy of the n_items values of c_type at address.
+        """
+        dtype = np.dtype(c_type)
+        nbytes = n_items * dtype.itemsize
+        if self._memory is None or self._memory.array.nbytes < nbytes:
+            size = max(nbytes, 2 * self._memory.array.nbytes if self._memory is not None else 0)
+            self.close()
+            self._memory = _WineSharedMemory(size, np.uint8)
+        if nbytes:
+            self._memory.copy_from(address, nbytes)
+        return self._memory.array[:nbytes].view(dtype).copy()
+
+    def close(self):
+        if self._memory is not None:
+            self._memory.close()
+            self._memory = None
+
+
+class PL2CallBatch:
+    """
+    Channel info and channel data reads of a PyPL2FileReader that are run
+    together by run(), see PyPL2FileReader.pl2_call_batch().
+    """
+
+    def __init__(self, reader):
+        self._reader = reader
+        self._calls = []
+
+    def __len__(self):
+        return len(self._calls)
+
+    def _add(self, method, *args):
+        self._calls.append((method, args))
+        return len(self._calls) - 1
+
+    def pl2_get_file_info(self):
+        return self._add('pl2_get_file_info')
+
+    def pl2_get_analog_channel_info(self, zero_based_channel_index):
+        return self._add('pl2_get_analog_channel_info', zero_based_channel_index)
+
+    def pl2_get_spike_channel_info(self, zero_based_channel_index):
+        return self._add('pl2_get_spike_channel_info', zero_based_channel_index)
+
+    def pl2_get_digital_channel_info(self, zero_based_channel_index):
+        return self._add('pl2_get_digital_channel_info', zero_based_channel_index)
+
+    def pl2_get_analog_channel_data(self, zero_based_channel_index):
+        return self._add('pl2_get_analog_channel_data', zero_based_channel_index)
+
+    def pl2_get_spike_channel_data(self, zero_based_channel_index):
+        return self._add('pl2_get_spike_channel_data', zero_based_channel_index)
+
+    def pl2_get_digital_channel_data(self, zero_based_channel_index):
+        return self._add('pl2_get_digital_channel_data', zero_based_channel_index)
+
+    def run(self):
+        """
+        Runs the added reads and clears the batch.
+
+        Returns:
+            list with the results of the reads, in the order they were added.
+            The results are those of the PyPL2FileReader methods of the same name.
+        """
+        calls, self._calls = self._calls, []
+        return self._reader._run_call_batch(calls)
+
+
 class PyPL2FileReader:
-    def __init__(self, pl2_dll_file_path=None):
+    def __new__(cls, pl2_dll_file_path=None, backend='dll', **kwargs):
+        if cls is PyPL2FileReader:
+            if backend == 'native':
+                from pypl2native import PyPL2NativeFileReader
+                cls = PyPL2NativeFileReader
+            elif backend != 'dll':
+                raise ValueError(f"Unknown backend '{backend}', expected 'dll' or 'native'")
+        return super().__new__(cls)
+
+    def __init__(self, pl2_dll_file_path=None, backend='dll', shared_memory=False, sidecar_index=False, rpc=False):
         """
         PyPL2FileReader class implements functions in the C++ PL2 File Reader
         API provided by Plexon, Inc.
@@ -133,12 +683,53 @@ class PyPL2FileReader:
                 'bin' directory, which is a subdirectory of this package.
                 Any file path passed is converted to an absolute path and checked
                 to see if the .dll exists there.
+            backend - 'dll' (default) calls PL2FileReader.dll, 'native' parses
+                the file in Python/NumPy without the .dll (see pypl2native.py).
+                Further keyword arguments, e.g. memory_map, are passed on to
+                the native reader.
+            shared_memory - on non-windows systems, let the .dll write channel
+                data into shared memory mapped by both wine and NumPy instead
+                of having zugbruecke serialize the output buffers. Applies to
+                pl2_get_analog_channel_data, pl2_get_analog_channels_data,
+                pl2_get_spike_channel_data and pl2_get_digital_channel_data.
+                zugbruecke keeps the argument definitions of a .dll function
+                once it was called, so all readers of a process should use
+                the same setting.
+            sidecar_index - if True, the file and channel infos read when a
+                file is opened are saved next to it (file.pl2.idx) and loaded
+                from there when the unchanged file is opened again, skipping
+                the .dll calls that read them.
+            rpc - on non-windows systems, open files in a helper process
+                that runs PL2FileReader.dll in wine with a Windows Python
+                (see pypl2rpc.py) instead of through zugbruecke. The reads of
+                a pl2_call_batch() are then made there in a single round trip,
+                and so are the channel info reads when a file is opened,
+                instead of one zugbruecke round trip per call. Channel info
+                and channel data reads by index are made there too, the file
+                is only opened through zugbruecke for other reads.
+
+        The .dll is loaded, and under zugbruecke wine is started, when the
+        first .dll function is called. The .dll calls are recorded while
+        tracing is enabled, see pypl2trace.py.
         
         Returns:
             None
         """
         self._file_handle = ctypes.c_int(0)
         self.pl2_file_info = None
+        self._analog_channel_fragments = {}
+        # native reader of the open file for _get_analog_channel_fragments
+        self._pl2_file = None
+        self._fragment_reader = None
+        # shared memory the data block arrays are copied through under zugbruecke
+        self._data_block_buffer = None
+        self._reset_channel_infos()
+        self._sidecar_index = sidecar_index
+        # windows ctypes already lets the .dll write into our arrays
+        self._shared_memory = shared_memory and not platform.startswith('win')
+        # and makes no round trips
+        self._rpc = rpc and _USE_ZUGBRUECKE
+        self._rpc_file_handle = 0
         if pl2_dll_file_path is None:
             if platform == 'win64':
                 pl2_dll_file_path = pathlib.Path(__file__).parent / 'bin' / 'PL2FileReader64.dll'
@@ -146,14 +737,35 @@ class PyPL2FileReader:
                 # use default '32bit' dll version
                 pl2_dll_file_path = pathlib.Path(__file__).parent / 'bin' / 'PL2FileReader.dll'
         self.pl2_dll_file_path = pathlib.Path(pl2_dll_file_path).absolute()
+        self._pl2_dll = None
 
-        try:
-            self.pl2_dll = ctypes.CDLL(str(self.pl2_dll_file_path))
-        except IOError:
-            raise IOError(f"Error: Can't load PL2FileReader.dll at: {self.pl2_dll_file_path}"
-                          "PL2FileReader.dll is bundled with the C++ PL2 Offline Files SDK"
-                          "located on the Plexon Inc website: www.plexon.com"
-                          "Contact Plexon Support for more information: support@plexon.com")
+    @property
+    def pl2_dll(self):
+        """
+        PL2FileReader.dll, loaded when it is first called.
+        """
+        if self._pl2_dll is None:
+            self._pl2_dll = _load_pl2_dll(self.pl2_dll_file_path)
+        return self._pl2_dll
+
+    @property
+    def _handle(self):
+        """
+        Handle of the open file in the .dll. With rpc=True files are opened
+        in the helper process, and in the zugbruecke .dll only when a read
+        the helper doesn't make needs it.
+        """
+        if not self._file_handle.value and self._rpc_file_handle:
+            self.pl2_dll.PL2_OpenFile(self._pl2_file.encode('ascii'), ctypes.byref(self._file_handle))
+            if not self._file_handle.value:
+                self._print_error()
+        return self._file_handle
+
+    def _rpc_read(self, method, *args):
+        """
+        Makes a single read of a PL2CallBatch in the helper process.
+        """
+        return self._run_call_batch([(method, args)])[0]
 
     def pl2_open_file(self, pl2_file):
         """
@@ -168,43 +780,58 @@ class PyPL2FileReader:
         """
         if isinstance(pl2_file, pathlib.Path):
             pl2_file = str(pl2_file)
-        self.pl2_dll.PL2_OpenFile.argtypes = (
-            ctypes.POINTER(ctypes.c_char),
-            ctypes.POINTER(ctypes.c_int),
-        )
-        self.pl2_dll.PL2_OpenFile.memsync = [
-            {
-                'p': [0],  # ctypes.POINTER argument
-                'n': True,  # null-terminated string flag
-            }
-        ]
-
-        self.pl2_dll.PL2_OpenFile(
-            pl2_file.encode('ascii'),
-            ctypes.byref(self._file_handle),
-        )
+        # a reader holds one file, the handle of a previous one is released
+        self.pl2_close_file()
+        self.pl2_file_info = None
 
-        # load file info
-        self.pl2_get_file_info()
+        self._analog_channel_fragments = {}
+        self._pl2_file = pl2_file
+        self._reset_channel_infos()
+        if self._rpc:
+            # the file is opened in the zugbruecke .dll too when a read needs it, see _handle
+            if not self._rpc_open_file(pl2_file):
+                return None
+        else:
+            self.pl2_dll.PL2_OpenFile(
+                pl2_file.encode('ascii'),
+                ctypes.byref(self._file_handle),
+            )
+            if not self._file_handle.value:
+                self._print_error()
+                return None
+
+        # load file and channel infos, from the sidecar index if there is one
+        if not (self._sidecar_index and self._open_sidecar_index(pl2_file)):
+            if self.pl2_get_file_info() is not None:
+                if self._read_channel_infos() and self._sidecar_index:
+                    self._save_sidecar_index(pl2_file)
         # check if spiking data can be loaded using zugbruecke
         self._check_spike_channel_data_consistency()
 
     def pl2_close_file(self):
         """
-        Closes handle to PL2 file.
+        Closes handle to PL2 file. Does nothing if no file is open.
 
         Returns:
             None
         """
 
-        self.pl2_dll.PL2_CloseFile.argtypes = (
-            ctypes.POINTER(ctypes.c_int),
-        )
-        self.pl2_dll.PL2_CloseFile(ctypes.c_int(1))
+        if self._file_handle.value:
+            self.pl2_dll.PL2_CloseFile(self._file_handle)
+            self._file_handle = ctypes.c_int(0)
+        if self._rpc_file_handle:
+            get_rpc_session(self.pl2_dll_file_path).run([('PL2_CloseFile', [('int', self._rpc_file_handle)])])
+            self._rpc_file_handle = 0
+        if self._fragment_reader is not None:
+            self._fragment_reader.pl2_close_file()
+            self._fragment_reader = None
+        self._close_data_block_buffer()
+        self._reset_channel_infos()
 
     def pl2_close_all_files(self):
         """
-        Closes all files that have been opened by the .dll
+        Closes all files that have been opened by the .dll, including those
+        of other PyPL2FileReader instances of the process
         
         Args:
             None
@@ -213,8 +840,16 @@ class PyPL2FileReader:
             None
         """
 
-        self.pl2_dll.PL2_CloseAllFiles.argtypes = ()
-        self.pl2_dll.PL2_CloseAllFiles()
+        # with rpc=True files are only opened in the zugbruecke .dll once a
+        # read needs it, so wine isn't started just to close no files
+        if not self._rpc or self._pl2_dll is not None:
+            self.pl2_dll.PL2_CloseAllFiles()
+        self._file_handle = ctypes.c_int(0)
+        if self._rpc:
+            get_rpc_session(self.pl2_dll_file_path).run([('PL2_CloseAllFiles', [])])
+            self._rpc_file_handle = 0
+        self._close_data_block_buffer()
+        self._reset_channel_infos()
 
     def pl2_get_last_error(self):
         """
@@ -224,18 +859,6 @@ class PyPL2FileReader:
             str - error message
         """
 
-        self.pl2_dll.PL2_GetLastError.argtypes = (
-            ctypes.POINTER(ctypes.c_char),
-            ctypes.c_int,
-        )
-        self.pl2_dll.PL2_GetLastError.memsync = [
-            {
-                'p': [0],
-                'l': [1],
-                't': ctypes.c_char
-            }
-        ]
-
         buffer = (ctypes.c_char * 256)()
         self.pl2_dll.PL2_GetLastError(buffer, ctypes.c_int(256))
 
@@ -265,6 +888,139 @@ class PyPL2FileReader:
                               'from the file.')
                 return
 
+    def _reset_channel_infos(self):
+        self._analog_channel_infos = None
+        self._spike_channel_infos = None
+        self._digital_channel_infos = None
+        self._analog_channel_indices_by_name = {}
+        self._analog_channel_indices_by_source = {}
+        self._spike_channel_indices_by_name = {}
+        self._spike_channel_indices_by_source = {}
+        self._digital_channel_indices_by_name = {}
+        self._digital_channel_indices_by_source = {}
+        self._data_block_info = None
+
+    def _read_channel_infos(self):
+        """
+        Reads all channel infos once when a file is opened. Info lookups by
+        index, name or source are then answered from these, and name or source
+        based data reads use the index based .dll functions instead of having
+        the .dll search for the channel. If a channel info can't be read,
+        nothing is kept and lookups go to the .dll. Returns whether all
+        channel infos were read.
+        """
+
+        n_analog = self.pl2_file_info.m_TotalNumberOfAnalogChannels
+        n_spike = self.pl2_file_info.m_TotalNumberOfSpikeChannels
+        batch = self.pl2_call_batch()
+        for i in range(n_analog):
+            batch.pl2_get_analog_channel_info(i)
+        for i in range(n_spike):
+            batch.pl2_get_spike_channel_info(i)
+        for i in range(self.pl2_file_info.m_NumberOfDigitalChannels):
+            batch.pl2_get_digital_channel_info(i)
+        infos = batch.run()
+        if any(info is None for info in infos):
+            return False
+        self._analog_channel_infos = infos[:n_analog]
+        self._spike_channel_infos = infos[n_analog:n_analog + n_spike]
+        self._digital_channel_infos = infos[n_analog + n_spike:]
+
+        self._analog_channel_indices_by_name, self._analog_channel_indices_by_source = _channel_indices(
+            self._analog_channel_infos)
+        self._spike_channel_indices_by_name, self._spike_channel_indices_by_source = _channel_indices(
+            self._spike_channel_infos)
+        self._digital_channel_indices_by_name, self._digital_channel_indices_by_source = _channel_indices(
+            self._digital_channel_infos)
+        return True
+
+    def _index_arrays(self):
+        """
+        Arrays saved in the sidecar index: the file info and channel info
+        structs as bytes.
+        """
+        def struct_rows(structs, struct_type):
+            return np.frombuffer(b''.join(bytes(info) for info in structs),
+                                 dtype=np.uint8).reshape(-1, ctypes.sizeof(struct_type))
+
+        return {
+            'file_info': np.frombuffer(bytes(self.pl2_file_info), dtype=np.uint8),
+            'analog_channel_infos': struct_rows(self._analog_channel_infos, PL2AnalogChannelInfo),
+            'spike_channel_infos': struct_rows(self._spike_channel_infos, PL2SpikeChannelInfo),
+            'digital_channel_infos': struct_rows(self._digital_channel_infos, PL2DigitalChannelInfo),
+        }
+
+    def _restore_index(self, index):
+        """
+        Restores what _index_arrays saved.
+        """
+        self.pl2_file_info = PL2FileInfo.from_buffer_copy(index['file_info'])
+        self._analog_channel_infos = [PL2AnalogChannelInfo.from_buffer_copy(row)
+                                      for row in index['analog_channel_infos']]
+        self._spike_channel_infos = [PL2SpikeChannelInfo.from_buffer_copy(row)
+                                     for row in index['spike_channel_infos']]
+        self._digital_channel_infos = [PL2DigitalChannelInfo.from_buffer_copy(row)
+                                       for row in index['digital_channel_infos']]
+
+        self._analog_channel_indices_by_name, self._analog_channel_indices_by_source = _channel_indices(
+            self._analog_channel_infos)
+        self._spike_channel_indices_by_name, self._spike_channel_indices_by_source = _channel_indices(
+            self._spike_channel_infos)
+        self._digital_channel_indices_by_name, self._digital_channel_indices_by_source = _channel_indices(
+            self._digital_channel_infos)
+
+    def _load_sidecar_index(self, pl2_file):
+        """
+        Loads the sidecar index of pl2_file. Returns None if there is none,
+        or if it was made for another version of the file.
+        """
+        try:
+            key = _sidecar_index_key(pl2_file)
+            with np.load(_sidecar_index_path(pl2_file), allow_pickle=False) as npz:
+                index = dict(npz)
+        except (OSError, ValueError):
+            return None
+
+        if not np.array_equal(index.get('key'), key):
+            return None
+
+        return index
+
+    def _open_sidecar_index(self, pl2_file):
+        """
+        Restores file and channel infos from the sidecar index of pl2_file.
+        Returns False if there is no usable index.
+        """
+        index = self._load_sidecar_index(pl2_file)
+        if index is None:
+            return False
+
+        try:
+            self._restore_index(index)
+        except (KeyError, ValueError):
+            # incomplete or damaged index, it is rewritten after reading the file
+            self._reset_channel_infos()
+            return False
+
+        return True
+
+    def _save_sidecar_index(self, pl2_file):
+        """
+        Saves the sidecar index of pl2_file. The index is only a cache, so
+        failures (e.g. a read-only directory) are ignored.
+        """
+        path = _sidecar_index_path(pl2_file)
+        temporary_path = path.with_name(f'{path.name}.{os.getpid()}.tmp')
+        try:
+            with open(temporary_path, 'wb') as f:
+                np.savez(f, key=_sidecar_index_key(pl2_file), **self._index_arrays())
+            os.replace(temporary_path, path)
+        except OSError:
+            try:
+                os.remove(temporary_path)
+            except OSError:
+                pass
+
     def pl2_get_file_info(self):
         """
         Retrieve information about pl2 file.
@@ -273,14 +1029,12 @@ class PyPL2FileReader:
             pl2_file_info - PL2FileInfo class instance
         """
 
-        self.pl2_file_info = PL2FileInfo()
+        if self._rpc_file_handle:
+            return self._rpc_read('pl2_get_file_info')
 
-        self.pl2_dll.PL2_GetFileInfo.argtypes = (
-            ctypes.c_int,
-            ctypes.POINTER(PL2FileInfo),
-        )
+        self.pl2_file_info = PL2FileInfo()
 
-        result = self.pl2_dll.PL2_GetFileInfo(self._file_handle, ctypes.byref(self.pl2_file_info))
+        result = self.pl2_dll.PL2_GetFileInfo(self._handle, ctypes.byref(self.pl2_file_info))
 
         # If res is 0, print error message
         if result == 0:
@@ -300,14 +1054,13 @@ class PyPL2FileReader:
             pl2_analog_channel_info - PL2AnalogChannelInfo class instance
         """
 
-        self.pl2_dll.PL2_GetAnalogChannelInfo.argtypes = (
-            ctypes.c_int,
-            ctypes.c_int,
-            ctypes.POINTER(PL2AnalogChannelInfo),
-        )
+        if self._analog_channel_infos is not None and 0 <= zero_based_channel_index < len(self._analog_channel_infos):
+            return PL2AnalogChannelInfo.from_buffer_copy(self._analog_channel_infos[zero_based_channel_index])
+        if self._rpc_file_handle:
+            return self._rpc_read('pl2_get_analog_channel_info', zero_based_channel_index)
 
         pl2_analog_channel_info = PL2AnalogChannelInfo()
-        result = self.pl2_dll.PL2_GetAnalogChannelInfo(self._file_handle,
+        result = self.pl2_dll.PL2_GetAnalogChannelInfo(self._handle,
                                                        ctypes.c_int(zero_based_channel_index),
                                                        ctypes.byref(pl2_analog_channel_info))
 
@@ -328,25 +1081,16 @@ class PyPL2FileReader:
             pl2_analog_channel_info - PL2AnalogChannelInfo class instance
         """
 
-        self.pl2_dll.PL2_GetAnalogChannelInfoByName.argtypes = (
-            ctypes.c_int,
-            ctypes.POINTER(ctypes.c_char),
-            ctypes.POINTER(PL2AnalogChannelInfo),
-        )
-
-        self.pl2_dll.PL2_GetAnalogChannelInfoByName.memsync = [
-            {
-                'p': [1],
-                'n': True,  # null-terminated string flag
-            }
-        ]
+        index = self._analog_channel_indices_by_name.get(_channel_name_key(channel_name))
+        if index is not None:
+            return self.pl2_get_analog_channel_info(index)
 
         if hasattr(channel_name, 'encode'):
             channel_name = channel_name.encode('ascii')
 
         pl2_analog_channel_info = PL2AnalogChannelInfo()
 
-        result = self.pl2_dll.PL2_GetAnalogChannelInfoByName(self._file_handle,
+        result = self.pl2_dll.PL2_GetAnalogChannelInfoByName(self._handle,
                                                              channel_name,
                                                              ctypes.byref(pl2_analog_channel_info))
 
@@ -367,16 +1111,13 @@ class PyPL2FileReader:
             pl2_analog_channel_info - PL2AnalogChannelInfo class instance
         """
 
-        self.pl2_dll.PL2_GetAnalogChannelInfoBySource.argtypes = (
-            ctypes.c_int,
-            ctypes.c_int,
-            ctypes.c_int,
-            ctypes.POINTER(PL2AnalogChannelInfo),
-        )
+        index = self._analog_channel_indices_by_source.get((source_id, one_based_channel_index_in_source))
+        if index is not None:
+            return self.pl2_get_analog_channel_info(index)
 
         pl2_analog_channel_info = PL2AnalogChannelInfo()
         result = self.pl2_dll.PL2_GetAnalogChannelInfoBySource(
-            self._file_handle,
+            self._handle,
             ctypes.c_int(source_id),
             ctypes.c_int(one_based_channel_index_in_source),
             ctypes.byref(pl2_analog_channel_info))
@@ -400,25 +1141,58 @@ class PyPL2FileReader:
             values - array the size of PL2AnalogChannelInfo.m_NumberOfValues
         """
 
+        if self._rpc_file_handle and not self._shared_memory:
+            return self._rpc_read('pl2_get_analog_channel_data', zero_based_channel_index)
+
+        achannel_info = self.pl2_get_analog_channel_info(zero_based_channel_index)
+
+        if self._shared_memory:
+            buffer = _WineSharedMemory(achannel_info.m_NumberOfValues, np.int16)
+            try:
+                res = self._read_analog_channel_data_into(zero_based_channel_index, buffer.array, buffer.address)
+            finally:
+                buffer.close()
+            values = buffer.array
+        else:
+            values = np.zeros(achannel_info.m_NumberOfValues, dtype=np.int16)
+            res = self._read_analog_channel_data_into(zero_based_channel_index, values)
+        if res is None:
+            return None
+
+        fragment_timestamps, fragment_counts = res
+        return fragment_timestamps, fragment_counts, values
+
+    def _read_analog_channel_data_into(self, zero_based_channel_index, values, address=None):
+        """
+        Reads the values of an analog channel into values, an int16 array
+        with PL2AnalogChannelInfo.m_NumberOfValues elements, and returns the
+        fragment_timestamps and fragment_counts arrays. If values is shared
+        memory, address is its address in the wine process.
+        """
+
         achannel_info = self.pl2_get_analog_channel_info(zero_based_channel_index)
 
         num_fragments_returned = ctypes.c_ulonglong(achannel_info.m_MaximumNumberOfFragments)
         num_data_points_returned = ctypes.c_ulonglong(achannel_info.m_NumberOfValues)
         fragment_timestamps = (ctypes.c_longlong * achannel_info.m_MaximumNumberOfFragments)()
         fragment_counts = (ctypes.c_ulonglong * achannel_info.m_MaximumNumberOfFragments)()
-        values = (ctypes.c_short * achannel_info.m_NumberOfValues)()
+        if address is None:
+            # the .dll writes straight into the caller's array
+            c_values = (ctypes.c_short * achannel_info.m_NumberOfValues).from_buffer(values)
+        else:
+            c_values = ctypes.c_void_p(address)
 
-        self.pl2_dll.PL2_GetAnalogChannelData.argtypes = (
+        argtypes = (
             ctypes.c_int,
             ctypes.c_int,
             ctypes.POINTER(ctypes.c_ulonglong),
             ctypes.POINTER(ctypes.c_ulonglong),
             ctypes.POINTER(ctypes.c_longlong),
             ctypes.POINTER(ctypes.c_ulonglong),
-            ctypes.POINTER(ctypes.c_short),
+            ctypes.POINTER(ctypes.c_short) if address is None else ctypes.c_void_p,
         )
 
-        self.pl2_dll.PL2_GetAnalogChannelData.memsync = [
+        memsync = [
             {
                 'p': [4],
                 'l': [2],
@@ -429,29 +1203,355 @@ class PyPL2FileReader:
                 'l': [2],
                 't': ctypes.c_ulonglong
             },
-            {
+        ]
+        if address is None:
+            memsync.append({
                 'p': [6],
                 'l': [3],
                 't': ctypes.c_short
-            }
-        ]
+            })
 
-        result = self.pl2_dll.PL2_GetAnalogChannelData(self._file_handle,
-                                                       ctypes.c_int(zero_based_channel_index),
-                                                       num_fragments_returned,
-                                                       num_data_points_returned,
-                                                       fragment_timestamps,
-                                                       fragment_counts,
-                                                       values)
+        result = self._call_with_prototype('PL2_GetAnalogChannelData', argtypes, memsync,
+                                           self._handle,
+                                           ctypes.c_int(zero_based_channel_index),
+                                           num_fragments_returned,
+                                           num_data_points_returned,
+                                           fragment_timestamps,
+                                           fragment_counts,
+                                           c_values)
 
         if not result:
             self._print_error()
             return None
 
-        return to_array(fragment_timestamps), to_array(fragment_counts), to_array(values)
+        return to_array(fragment_timestamps), to_array(fragment_counts)
 
-    def pl2_get_analog_channel_data_subset(self):
-        pass
+    def _get_analog_channel_indices(self, channels):
+        """
+        Translates a selection of analog channels into zero-based channel
+        indices. channels is either a sequence of zero-based channel indices
+        and/or channel names, or a (source_id, one_based_channel_indices_in_source)
+        tuple, e.g. (source_id, range(1, 33)).
+        """
+
+        if (isinstance(channels, tuple) and len(channels) == 2
+                and not isinstance(channels[1], (int, np.integer, str, bytes))):
+            source_id, one_based_channel_indices = channels
+            channels = [(source_id, channel) for channel in one_based_channel_indices]
+
+        # names and sources are looked up directly, as several channels may
+        # have the same name. Failed lookups go through the info functions,
+        # which report the error.
+        indices = []
+        for channel in channels:
+            if isinstance(channel, tuple):
+                index = self._analog_channel_indices_by_source.get(channel)
+                if index is None:
+                    self.pl2_get_analog_channel_info_by_source(*channel)
+            elif isinstance(channel, (str, bytes)):
+                index = self._analog_channel_indices_by_name.get(_channel_name_key(channel))
+                if index is None:
+                    self.pl2_get_analog_channel_info_by_name(channel)
+            else:
+                index = int(channel) if self.pl2_get_analog_channel_info(channel) is not None else None
+            if index is None:
+                return None
+            indices.append(index)
+
+        return indices
+
+    def pl2_get_analog_channels_data(self, channels, dtype=np.int16):
+        """
+        Retrieve the data of several analog channels as a single
+        (channels, values) array. The array is allocated once and filled
+        channel by channel. All channels must have the same number of values
+        and the same fragments, as channels of one source do.
+
+        Args:
+            channels - sequence of zero-based channel indices and/or channel
+                names, or a (source_id, one_based_channel_indices_in_source)
+                tuple such as (source_id, range(1, 33))
+            dtype - np.int16 (default) returns the raw a/d values, a floating
+                point type such as np.float32 returns values converted to
+                units with PL2AnalogChannelInfo.m_CoeffToConvertToUnits
+
+        Returns:
+            fragment_timestamps - array the size of PL2AnalogChannelInfo.m_MaximumNumberOfFragments
+            fragment_counts - array the size of PL2AnalogChannelInfo.m_MaximumNumberOfFragments
+            values - (channels, PL2AnalogChannelInfo.m_NumberOfValues) array
+        """
+
+        indices = self._get_analog_channel_indices(channels)
+        if indices is None:
+            return None
+
+        achannel_infos = [self.pl2_get_analog_channel_info(i) for i in indices]
+        num_values = {achannel_info.m_NumberOfValues for achannel_info in achannel_infos}
+        if len(num_values) > 1:
+            raise ValueError('The selected analog channels have different numbers of values')
+        num_values = num_values.pop() if num_values else 0
+
+        dtype = np.dtype(dtype)
+        scaled = dtype != np.int16
+        if scaled and dtype.kind != 'f':
+            raise ValueError(f'Unsupported dtype {dtype}, expected int16 or a floating point type')
+
+        buffer = None
+        if self._shared_memory:
+            # the .dll fills the rows of the int16 array (or the reused int16
+            # row for scaled values) in shared memory
+            buffer = _WineSharedMemory(num_values if scaled else (len(indices), num_values), np.int16)
+        if scaled:
+            values = np.empty((len(indices), num_values), dtype=dtype)
+            raw_values = buffer.array if buffer is not None else np.empty(num_values, dtype=np.int16)
+        else:
+            values = buffer.array if buffer is not None else np.empty((len(indices), num_values), dtype=dtype)
+            raw_values = None
+        try:
+            fragment_timestamps = fragment_counts = np.zeros(0)
+            for row, (index, achannel_info) in enumerate(zip(indices, achannel_infos)):
+                address = None
+                if buffer is not None:
+                    address = buffer.address + (0 if scaled else row * num_values * 2)
+                res = self._read_analog_channel_data_into(index, raw_values if scaled else values[row], address)
+                if res is None:
+                    return None
+
+                if row == 0:
+                    fragment_timestamps, fragment_counts = res
+                elif not (np.array_equal(res[0], fragment_timestamps)
+                          and np.array_equal(res[1], fragment_counts)):
+                    raise ValueError('The selected analog channels have different fragments')
+
+                if scaled:
+                    np.multiply(raw_values, achannel_info.m_CoeffToConvertToUnits, out=values[row])
+        finally:
+            if buffer is not None:
+                buffer.close()
+
+        return fragment_timestamps, fragment_counts, values
+
+    def pl2_get_analog_channel_data_subset(self, zero_based_channel_index, zero_based_start_value_index,
+                                           num_subset_values):
+        """
+        Retrieve a range of analog channel values. Only the requested values
+        are read and transferred.
+
+        Args:
+            zero_based_channel_index - zero based channel index
+            zero_based_start_value_index - zero based index of the first value
+            num_subset_values - number of values to read. The range is clipped
+                at the end of the channel.
+
+        Returns:
+            fragment_timestamps - array with the timestamp of the first returned value of each fragment
+            fragment_counts - array with the number of returned values of each fragment
+            values - array of at most num_subset_values values
+        """
+
+        achannel_info = self.pl2_get_analog_channel_info(zero_based_channel_index)
+        if achannel_info is None:
+            return None
+
+        num_subset_values = max(0, min(num_subset_values,
+                                       achannel_info.m_NumberOfValues - zero_based_start_value_index))
+        if not num_subset_values:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.uint64), np.zeros(0, dtype=np.int16)
+
+        num_fragments_returned = ctypes.c_ulonglong(achannel_info.m_MaximumNumberOfFragments)
+        num_data_points_returned = ctypes.c_ulonglong(num_subset_values)
+        fragment_timestamps = (ctypes.c_longlong * achannel_info.m_MaximumNumberOfFragments)()
+        fragment_counts = (ctypes.c_ulonglong * achannel_info.m_MaximumNumberOfFragments)()
+        values = (ctypes.c_short * num_subset_values)()
+
+        result = self.pl2_dll.PL2_GetAnalogChannelDataSubset(self._handle,
+                                                             ctypes.c_int(zero_based_channel_index),
+                                                             ctypes.c_ulonglong(zero_based_start_value_index),
+                                                             ctypes.c_uint(num_subset_values),
+                                                             num_fragments_returned,
+                                                             num_data_points_returned,
+                                                             fragment_timestamps,
+                                                             fragment_counts,
+                                                             values)
+
+        if not result:
+            self._print_error()
+            return None
+
+        num_fragments = num_fragments_returned.value
+        return (to_array(fragment_timestamps)[:num_fragments],
+                to_array(fragment_counts)[:num_fragments],
+                to_array(values)[:num_data_points_returned.value])
+
+    def pl2_get_analog_channel_data_subset_by_time(self, zero_based_channel_index, start=None, stop=None):
+        """
+        Retrieve the analog channel values recorded between two points in time.
+
+        Args:
+            zero_based_channel_index - zero based channel index
+            start - time in seconds of the first value, None to start at the first value
+            stop - time in seconds up to which (exclusive) values are read,
+                None to read up to the last value
+
+        Returns:
+            fragment_timestamps - array with the timestamp of the first returned value of each fragment
+            fragment_counts - array with the number of returned values of each fragment
+            values - array of the values between start and stop
+        """
+
+        value_range = self._get_analog_value_range(zero_based_channel_index, start, stop)
+        if value_range is None:
+            return None
+        start_index, stop_index = value_range
+
+        return self.pl2_get_analog_channel_data_subset(zero_based_channel_index, start_index,
+                                                       stop_index - start_index)
+
+    def _get_analog_value_range(self, zero_based_channel_index, start=None, stop=None):
+        """
+        Indices of the first value at or after time start and of the first
+        value at or after time stop, see pl2_get_analog_channel_data_subset_by_time.
+        """
+
+        achannel_info = self.pl2_get_analog_channel_info(zero_based_channel_index)
+        if achannel_info is None:
+            return None
+
+        start_index = 0
+        stop_index = achannel_info.m_NumberOfValues
+        if start is None and stop is None:
+            return start_index, stop_index
+
+        fragments = self._get_analog_channel_fragments(zero_based_channel_index)
+        if fragments is None:
+            return None
+
+        timestamp_frequency = self.pl2_file_info.m_TimestampFrequency
+        ticks_per_sample = timestamp_frequency / achannel_info.m_SamplesPerSecond
+        if start is not None:
+            start_index = _ticks_to_value_index(start * timestamp_frequency, *fragments, ticks_per_sample)
+        if stop is not None:
+            stop_index = _ticks_to_value_index(stop * timestamp_frequency, *fragments, ticks_per_sample)
+        return start_index, stop_index
+
+    def pl2_get_analog_channel_data_decimated(self, zero_based_channel_index, decimate=None, target_rate=None,
+                                              start=None, stop=None):
+        """
+        Retrieve analog channel values low-pass filtered and downsampled. The
+        values are read DECIMATION_CHUNK_SIZE at a time and filtered as they
+        are read, with the filter state carried from chunk to chunk, so only
+        the decimated values are kept. Each fragment is filtered on its own.
+
+        Args:
+            zero_based_channel_index - zero based channel index
+            decimate - decimation factor, one value is kept out of every decimate values
+            target_rate - sampling rate after decimation, instead of decimate. Must
+                be the channel's sampling rate divided by an integer.
+            start - optional time in seconds of the first value
+            stop - optional time in seconds up to which (exclusive) values are read
+
+        Returns:
+            fragment_timestamps - array with the timestamp of the first value of each fragment
+            fragment_counts - array with the number of decimated values of each fragment
+            values - float64 array of the filtered values, in a/d units like
+                     the int16 values of the channel
+            None on failure
+        """
+
+        achannel_info = self.pl2_get_analog_channel_info(zero_based_channel_index)
+        if achannel_info is None:
+            return None
+        factor = _decimation_factor(achannel_info.m_SamplesPerSecond, decimate, target_rate)
+        value_range = self._get_analog_value_range(zero_based_channel_index, start, stop)
+        if value_range is None:
+            return None
+        position, stop_index = value_range
+
+        taps = _lowpass_taps(factor)
+        ticks_per_sample = self.pl2_file_info.m_TimestampFrequency / achannel_info.m_SamplesPerSecond
+        fragment_timestamps = []
+        fragment_counts = []
+        values = []
+        decimator = None
+        next_tick = None
+        while position < stop_index:
+            res = self.pl2_get_analog_channel_data_subset(zero_based_channel_index, position,
+                                                          min(DECIMATION_CHUNK_SIZE, stop_index - position))
+            if res is None:
+                return None
+            chunk_timestamps, chunk_counts, chunk_values = res
+            if not len(chunk_values):
+                break
+
+            offset = 0
+            for tick, count in zip(chunk_timestamps.tolist(), chunk_counts.tolist()):
+                if not count:
+                    continue
+                # the first fragment of a chunk may continue the last one of the chunk before
+                if decimator is None or abs(tick - next_tick) >= ticks_per_sample / 2:
+                    if decimator is not None:
+                        values.append(decimator.finish())
+                        fragment_counts[-1] += len(values[-1])
+                    decimator = _Decimator(factor, taps)
+                    fragment_timestamps.append(tick)
+                    fragment_counts.append(0)
+                values.append(decimator.process(chunk_values[offset:offset + count]))
+                fragment_counts[-1] += len(values[-1])
+                offset += count
+                next_tick = tick + count * ticks_per_sample
+            position += len(chunk_values)
+
+        if decimator is not None:
+            values.append(decimator.finish())
+            fragment_counts[-1] += len(values[-1])
+
+        return (np.array(fragment_timestamps, dtype=np.int64), np.array(fragment_counts, dtype=np.uint64),
+                np.concatenate([np.zeros(0)] + values))
+
+    def _get_analog_channel_fragments(self, zero_based_channel_index):
+        """
+        Timestamps and counts of the fragments of an analog channel. The .dll
+        only reports them together with the channel's values, so they are
+        taken from the channel's summary and block headers by the native
+        reader, which reads no values. They are read with the values only if
+        the native reader can't parse the file. Either way they are kept.
+        """
+
+        if zero_based_channel_index not in self._analog_channel_fragments:
+            fragments = self._get_native_analog_channel_fragments(zero_based_channel_index)
+            if fragments is None:
+                res = self.pl2_get_analog_channel_data(zero_based_channel_index)
+                if res is None:
+                    return None
+                fragment_timestamps, fragment_counts, _ = res
+                num_fragments = np.count_nonzero(fragment_counts)
+                fragments = (np.array(fragment_timestamps[:num_fragments]),
+                             np.array(fragment_counts[:num_fragments]))
+            self._analog_channel_fragments[zero_based_channel_index] = fragments
+
+        return self._analog_channel_fragments[zero_based_channel_index]
+
+    def _get_native_analog_channel_fragments(self, zero_based_channel_index):
+        """
+        _get_analog_channel_fragments of the native reader for the open file,
+        None if it can't read them or they don't match the .dll's channel.
+        """
+
+        if self._fragment_reader is None:
+            fragment_reader = PyPL2FileReader(backend='native')
+            fragment_reader.pl2_open_file(self._pl2_file)
+            if not fragment_reader._file_handle:
+                return None
+            self._fragment_reader = fragment_reader
+
+        achannel_info = self.pl2_get_analog_channel_info(zero_based_channel_index)
+        if zero_based_channel_index >= len(self._fragment_reader._analog_channel_infos):
+            return None
+        fragments = self._fragment_reader._get_analog_channel_fragments(zero_based_channel_index)
+        if fragments is None or int(np.sum(fragments[1])) != achannel_info.m_NumberOfValues:
+            return None
+
+        return fragments
 
     def pl2_get_analog_channel_data_by_name(self, channel_name):
         """
@@ -465,6 +1565,10 @@ class PyPL2FileReader:
             fragment_counts - array the size of PL2AnalogChannelInfo.m_MaximumNumberOfFragments
             values - array the size of PL2AnalogChannelInfo.m_NumberOfValues
         """
+
+        index = self._analog_channel_indices_by_name.get(_channel_name_key(channel_name))
+        if index is not None:
+            return self.pl2_get_analog_channel_data(index)
         
         if hasattr(channel_name, 'encode'):
             channel_name = channel_name.encode('ascii')
@@ -477,40 +1581,8 @@ class PyPL2FileReader:
         fragment_counts = (ctypes.c_ulonglong * achannel_info.m_MaximumNumberOfFragments)()
         values = (ctypes.c_short * achannel_info.m_NumberOfValues)()
 
-        self.pl2_dll.PL2_GetAnalogChannelDataByName.argtypes = (
-            ctypes.c_int,
-            ctypes.POINTER(ctypes.c_char),
-            ctypes.POINTER(ctypes.c_ulonglong),
-            ctypes.POINTER(ctypes.c_ulonglong),
-            ctypes.POINTER(ctypes.c_longlong),
-            ctypes.POINTER(ctypes.c_ulonglong),
-            ctypes.POINTER(ctypes.c_short),
-        )
-
-        self.pl2_dll.PL2_GetAnalogChannelDataByName.memsync = [
-            {
-                'p': [1],
-                'n': True,  # null-terminated string flag
-            },
-            {
-                'p': [4],
-                'l': [2],
-                't': ctypes.c_longlong
-            },
-            {
-                'p': [5],
-                'l': [2],
-                't': ctypes.c_ulonglong
-            },
-            {
-                'p': [6],
-                'l': [3],
-                't': ctypes.c_short
-            }
-        ]
-
         result = self.pl2_dll.PL2_GetAnalogChannelDataByName(
-            self._file_handle,
+            self._handle,
             channel_name,
             num_fragments_returned,
             num_data_points_returned,
@@ -538,6 +1610,10 @@ class PyPL2FileReader:
             values - array the size of PL2AnalogChannelInfo.m_NumberOfValues
         """
 
+        index = self._analog_channel_indices_by_source.get((source_id, one_based_channel_index_in_source))
+        if index is not None:
+            return self.pl2_get_analog_channel_data(index)
+
         achannel_info = self.pl2_get_analog_channel_info_by_source(source_id, one_based_channel_index_in_source)
 
         num_fragments_returned = ctypes.c_ulonglong(achannel_info.m_MaximumNumberOfFragments)
@@ -546,36 +1622,7 @@ class PyPL2FileReader:
         fragment_counts = (ctypes.c_ulonglong * achannel_info.m_MaximumNumberOfFragments)()
         values = (ctypes.c_short * achannel_info.m_NumberOfValues)()
 
-        self.pl2_dll.PL2_GetAnalogChannelDataBySource.argtypes = (
-            ctypes.c_int,
-            ctypes.c_int,
-            ctypes.c_int,
-            ctypes.POINTER(ctypes.c_ulonglong),
-            ctypes.POINTER(ctypes.c_ulonglong),
-            ctypes.POINTER(ctypes.c_longlong),
-            ctypes.POINTER(ctypes.c_ulonglong),
-            ctypes.POINTER(ctypes.c_short),
-        )
-
-        self.pl2_dll.PL2_GetAnalogChannelDataBySource.memsync = [
-            {
-                'p': [5],
-                'l': [3],
-                't': ctypes.c_longlong
-            },
-            {
-                'p': [6],
-                'l': [3],
-                't': ctypes.c_ulonglong
-            },
-            {
-                'p': [7],
-                'l': [4],
-                't': ctypes.c_short
-            }
-        ]
-
-        result = self.pl2_dll.PL2_GetAnalogChannelDataBySource(self._file_handle,
+        result = self.pl2_dll.PL2_GetAnalogChannelDataBySource(self._handle,
                                                                ctypes.c_int(source_id),
                                                                ctypes.c_int(one_based_channel_index_in_source),
                                                                num_fragments_returned,
@@ -601,15 +1648,14 @@ class PyPL2FileReader:
             pl2_spike_channel_info - PL2SpikeChannelInfo class instance
         """
 
-        pl2_spike_channel_info = PL2SpikeChannelInfo()
+        if self._spike_channel_infos is not None and 0 <= zero_based_channel_index < len(self._spike_channel_infos):
+            return PL2SpikeChannelInfo.from_buffer_copy(self._spike_channel_infos[zero_based_channel_index])
+        if self._rpc_file_handle:
+            return self._rpc_read('pl2_get_spike_channel_info', zero_based_channel_index)
 
-        self.pl2_dll.PL2_GetSpikeChannelInfo.argtypes = (
-            ctypes.c_int,
-            ctypes.c_int,
-            ctypes.POINTER(PL2SpikeChannelInfo),
-        )
+        pl2_spike_channel_info = PL2SpikeChannelInfo()
 
-        result = self.pl2_dll.PL2_GetSpikeChannelInfo(self._file_handle,
+        result = self.pl2_dll.PL2_GetSpikeChannelInfo(self._handle,
                                                       ctypes.c_int(zero_based_channel_index),
                                                       ctypes.byref(pl2_spike_channel_info))
 
@@ -630,25 +1676,16 @@ class PyPL2FileReader:
             pl2_spike_channel_info - PL2SpikeChannelInfo class instance
         """
 
-        self.pl2_dll.PL2_GetSpikeChannelInfoByName.argtypes = (
-            ctypes.c_int,
-            ctypes.c_char * len(channel_name),
-            ctypes.POINTER(PL2SpikeChannelInfo),
-        )
+        index = self._spike_channel_indices_by_name.get(_channel_name_key(channel_name))
+        if index is not None:
+            return self.pl2_get_spike_channel_info(index)
 
         if hasattr(channel_name, 'encode'):
             channel_name = channel_name.encode('ascii')
 
-        self.pl2_dll.PL2_GetSpikeChannelInfoByName.memsync = [
-            {
-                'p': [1],
-                'n': True,  # null-terminated string flag
-            }
-        ]
-
         pl2_spike_channel_info = PL2SpikeChannelInfo()
 
-        result = self.pl2_dll.PL2_GetSpikeChannelInfoByName(self._file_handle,
+        result = self.pl2_dll.PL2_GetSpikeChannelInfoByName(self._handle,
                                                             channel_name,
                                                             ctypes.byref(pl2_spike_channel_info))
 
@@ -670,16 +1707,14 @@ class PyPL2FileReader:
             pl2_spike_channel_info - PL2SpikeChannelInfo class instance
         """
 
+        index = self._spike_channel_indices_by_source.get((source_id, one_based_channel_index_in_source))
+        if index is not None:
+            return self.pl2_get_spike_channel_info(index)
+
         pl2_spike_channel_info = PL2SpikeChannelInfo()
 
-        self.pl2_dll.PL2_GetSpikeChannelInfoBySource.argtypes = (
-            ctypes.c_int,
-            ctypes.c_int,
-            ctypes.c_int,
-            ctypes.POINTER(PL2SpikeChannelInfo),
-        )
         result = self.pl2_dll.PL2_GetSpikeChannelInfoBySource(
-            self._file_handle,
+            self._handle,
             ctypes.c_int(source_id),
             ctypes.c_int(one_based_channel_index_in_source),
             ctypes.byref(pl2_spike_channel_info))
@@ -703,13 +1738,19 @@ class PyPL2FileReader:
             values - array the size of (PL2SpikeChannelInfo.m_NumberOfSpikes * PL2SpikeChannelInfo.m_SamplesPerSpike)
         """
 
+        if self._rpc_file_handle and not self._shared_memory:
+            return self._rpc_read('pl2_get_spike_channel_data', zero_based_channel_index)
+
         # extracting m_SamplesPerSpike to prepare data reading
         # This solution only works if all channels have the same number of samples per spike
         # as ctypes / zugbruecke is caching the memsync attribute once defined once
         schannel_info = self.pl2_get_spike_channel_info(zero_based_channel_index)
         samples_per_spike = schannel_info.m_SamplesPerSpike
 
-        self.pl2_dll.PL2_GetSpikeChannelData.argtypes = (
+        if self._shared_memory:
+            return self._get_spike_channel_data_shared(zero_based_channel_index, schannel_info)
+
+        argtypes = (
             ctypes.c_int,
             ctypes.c_int,
             ctypes.POINTER(ctypes.c_ulonglong),
@@ -718,7 +1759,7 @@ class PyPL2FileReader:
             ctypes.POINTER(ctypes.c_short)
         )
 
-        self.pl2_dll.PL2_GetSpikeChannelData.memsync = [
+        memsync = [
             {
                 'p': [3],
                 'l': [2],
@@ -744,20 +1785,106 @@ class PyPL2FileReader:
         values = (ctypes.c_short * (
                 schannel_info.m_NumberOfSpikes * schannel_info.m_SamplesPerSpike))()
 
-        result = self.pl2_dll.PL2_GetSpikeChannelData(self._file_handle,
-                                                      ctypes.c_int(zero_based_channel_index),
-                                                      num_spikes_returned,
-                                                      spike_timestamps,
-                                                      units,
-                                                      values)
+        result = self._call_with_prototype('PL2_GetSpikeChannelData', argtypes, memsync,
+                                           self._handle,
+                                           ctypes.c_int(zero_based_channel_index),
+                                           num_spikes_returned,
+                                           spike_timestamps,
+                                           units,
+                                           values)
+
+        if not result:
+            self._print_error()
+            return None
+
+        spike_array_shape = (schannel_info.m_NumberOfSpikes, schannel_info.m_SamplesPerSpike)
+
+        return to_array(spike_timestamps), to_array(units), to_array(values).reshape(spike_array_shape)
+
+    def _get_spike_channel_data_shared(self, zero_based_channel_index, schannel_info):
+        """
+        pl2_get_spike_channel_data with the output arrays in shared memory.
+        """
+
+        argtypes = (
+            ctypes.c_int,
+            ctypes.c_int,
+            ctypes.POINTER(ctypes.c_ulonglong),
+            ctypes.c_void_p,
+            ctypes.c_void_p,
+            ctypes.c_void_p,
+        )
+        memsync = []
+
+        num_spikes_returned = ctypes.c_ulonglong(schannel_info.m_NumberOfSpikes)
+        buffers = [_WineSharedMemory(schannel_info.m_NumberOfSpikes, np.uint64),
+                   _WineSharedMemory(schannel_info.m_NumberOfSpikes, np.uint16),
+                   _WineSharedMemory((schannel_info.m_NumberOfSpikes, schannel_info.m_SamplesPerSpike), np.int16)]
+        try:
+            result = self._call_with_prototype('PL2_GetSpikeChannelData', argtypes, memsync,
+                                               self._handle,
+                                               ctypes.c_int(zero_based_channel_index),
+                                               num_spikes_returned,
+                                               *(ctypes.c_void_p(b.address) for b in buffers))
+        finally:
+            for buffer in buffers:
+                buffer.close()
 
         if not result:
             self._print_error()
             return None
 
-        spike_array_shape = (schannel_info.m_NumberOfSpikes, schannel_info.m_SamplesPerSpike)
+        return tuple(buffer.array for buffer in buffers)
 
-        return to_array(spike_timestamps), to_array(units), to_array(values).reshape(spike_array_shape)
+    def _get_spike_channel_data_selection(self, zero_based_channel_index, units=None, waveforms=True):
+        """
+        pl2_get_spike_channel_data restricted to the spikes of the given units,
+        optionally without waveforms. The .dll always returns all spikes with
+        their waveforms, the selection is applied before anything else is done
+        with them.
+
+        Args:
+            zero_based_channel_index - zero based channel index
+            units - optional sequence of unit numbers (0 = unsorted, 1 = Unit A, etc)
+            waveforms - if False, values is None
+
+        Returns:
+            spike_timestamps, units, values - as pl2_get_spike_channel_data, with
+                only the spikes of the selected units
+        """
+
+        res = self.pl2_get_spike_channel_data(zero_based_channel_index)
+        if res is None:
+            return None
+
+        spike_timestamps, spike_units, values = res
+        if not waveforms:
+            values = None
+        if units is not None:
+            selected = np.isin(spike_units, units)
+            spike_timestamps, spike_units = spike_timestamps[selected], spike_units[selected]
+            if values is not None:
+                values = values[selected]
+
+        return spike_timestamps, spike_units, values
+
+    def _get_spike_channel_data_chunks(self, zero_based_channel_index, chunk_size):
+        """
+        pl2_get_spike_channel_data in consecutive chunks of at most chunk_size
+        spikes. The .dll only reads whole channels, so the channel is read
+        once and split.
+
+        Returns:
+            iterable of (spike_timestamps, units, values) tuples, None on failure
+        """
+
+        res = self.pl2_get_spike_channel_data(zero_based_channel_index)
+        if res is None:
+            return None
+
+        spike_timestamps, units, values = res
+        return [(spike_timestamps[start:start + chunk_size], units[start:start + chunk_size],
+                 values[start:start + chunk_size]) for start in range(0, len(spike_timestamps), chunk_size)]
 
     def pl2_get_spike_channel_data_by_name(self, channel_name):
         """
@@ -772,10 +1899,14 @@ class PyPL2FileReader:
             values - array the size of (PL2SpikeChannelInfo.m_NumberOfSpikes * PL2SpikeChannelInfo.m_SamplesPerSpike)
         """
 
+        index = self._spike_channel_indices_by_name.get(_channel_name_key(channel_name))
+        if index is not None:
+            return self.pl2_get_spike_channel_data(index)
+
         if hasattr(channel_name, 'encode'):
             channel_name = channel_name.encode('ascii')
 
-        self.pl2_dll.PL2_GetSpikeChannelDataByName.argtypes = (
+        argtypes = (
             ctypes.c_int,
             ctypes.c_char,
             ctypes.POINTER(ctypes.c_ulonglong),
@@ -790,7 +1921,7 @@ class PyPL2FileReader:
         schannel_info = self.pl2_get_spike_channel_info_by_name(channel_name)
         samples_per_spike = schannel_info.m_SamplesPerSpike
 
-        self.pl2_dll.PL2_GetSpikeChannelDataByName.memsync = [
+        memsync = [
             {
                 'p': [1],
                 'n': True,  # null-terminated string flag
@@ -820,12 +1951,13 @@ class PyPL2FileReader:
         values = (ctypes.c_short * (
                 schannel_info.m_NumberOfSpikes * schannel_info.m_SamplesPerSpike))()
 
-        result = self.pl2_dll.PL2_GetSpikeChannelDataByName(self._file_handle,
-                                                            channel_name,
-                                                            num_spikes_returned,
-                                                            spike_timestamps,
-                                                            units,
-                                                            values)
+        result = self._call_with_prototype('PL2_GetSpikeChannelDataByName', argtypes, memsync,
+                                           self._handle,
+                                           channel_name,
+                                           num_spikes_returned,
+                                           spike_timestamps,
+                                           units,
+                                           values)
 
         if not result:
             self._print_error()
@@ -850,7 +1982,11 @@ class PyPL2FileReader:
             values - array the size of (PL2SpikeChannelInfo.m_NumberOfSpikes * PL2SpikeChannelInfo.m_SamplesPerSpike)
         """
 
-        self.pl2_dll.PL2_GetSpikeChannelDataBySource.argtypes = (
+        index = self._spike_channel_indices_by_source.get((source_id, one_based_channel_index_in_source))
+        if index is not None:
+            return self.pl2_get_spike_channel_data(index)
+
+        argtypes = (
             ctypes.c_int,
             ctypes.c_int,
             ctypes.c_int,
@@ -866,7 +2002,7 @@ class PyPL2FileReader:
         schannel_info = self.pl2_get_spike_channel_info_by_source(source_id, one_based_channel_index_in_source)
         samples_per_spike = schannel_info.m_SamplesPerSpike
 
-        self.pl2_dll.PL2_GetSpikeChannelDataBySource.memsync = [
+        memsync = [
             {
                 'p': [4],
                 'l': [3],
@@ -892,13 +2028,14 @@ class PyPL2FileReader:
         values = (ctypes.c_short * (
                 schannel_info.m_NumberOfSpikes * schannel_info.m_SamplesPerSpike))()
 
-        result = self.pl2_dll.PL2_GetSpikeChannelDataBySource(self._file_handle,
-                                                              ctypes.c_int(source_id),
-                                                              ctypes.c_int(one_based_channel_index_in_source),
-                                                              num_spikes_returned,
-                                                              spike_timestamps,
-                                                              units,
-                                                              values)
+        result = self._call_with_prototype('PL2_GetSpikeChannelDataBySource', argtypes, memsync,
+                                           self._handle,
+                                           ctypes.c_int(source_id),
+                                           ctypes.c_int(one_based_channel_index_in_source),
+                                           num_spikes_returned,
+                                           spike_timestamps,
+                                           units,
+                                           values)
 
         if not result:
             self._print_error()
@@ -920,16 +2057,15 @@ class PyPL2FileReader:
             pl2_digital_channel_info - PL2DigitalChannelInfo class instance
         """
 
-        self.pl2_dll.PL2_GetDigitalChannelInfo.argtypes = (
-            ctypes.c_int,
-            ctypes.c_int,
-            ctypes.POINTER(PL2DigitalChannelInfo),
-        )
+        if self._digital_channel_infos is not None and 0 <= zero_based_channel_index < len(self._digital_channel_infos):
+            return PL2DigitalChannelInfo.from_buffer_copy(self._digital_channel_infos[zero_based_channel_index])
+        if self._rpc_file_handle:
+            return self._rpc_read('pl2_get_digital_channel_info', zero_based_channel_index)
 
         pl2_digital_channel_info = PL2DigitalChannelInfo()
 
         result = self.pl2_dll.PL2_GetDigitalChannelInfo(
-            self._file_handle,
+            self._handle,
             ctypes.c_int(zero_based_channel_index),
             ctypes.byref(pl2_digital_channel_info)
         )
@@ -951,26 +2087,17 @@ class PyPL2FileReader:
             pl2_digital_channel_info - PL2DigitalChannelInfo class instance
         """
 
+        index = self._digital_channel_indices_by_name.get(_channel_name_key(channel_name))
+        if index is not None:
+            return self.pl2_get_digital_channel_info(index)
+
         if hasattr(channel_name, 'encode'):
             channel_name = channel_name.encode('ascii')
 
-        self.pl2_dll.PL2_GetDigitalChannelInfoByName.argtypes = (
-            ctypes.c_int,
-            ctypes.POINTER(ctypes.c_char),
-            ctypes.POINTER(PL2DigitalChannelInfo),
-        )
-
-        self.pl2_dll.PL2_GetDigitalChannelInfoByName.memsync = [
-            {
-                'p': [1],  # ctypes.POINTER argument
-                'n': True,  # null-terminated string flag
-            }
-        ]
-
         pl2_digital_channel_info = PL2DigitalChannelInfo()
 
         result = self.pl2_dll.PL2_GetDigitalChannelInfoByName(
-            self._file_handle,
+            self._handle,
             channel_name,
             ctypes.byref(pl2_digital_channel_info)
         )
@@ -993,17 +2120,14 @@ class PyPL2FileReader:
             pl2_digital_channel_info - PL2DigitalChannelInfo class instance
         """
 
-        self.pl2_dll.PL2_GetDigitalChannelInfoBySource.argtypes = (
-            ctypes.c_int,
-            ctypes.c_int,
-            ctypes.c_int,
-            ctypes.POINTER(PL2DigitalChannelInfo),
-        )
+        index = self._digital_channel_indices_by_source.get((source_id, one_based_channel_index_in_source))
+        if index is not None:
+            return self.pl2_get_digital_channel_info(index)
 
         pl2_digital_channel_info = PL2DigitalChannelInfo()
 
         result = self.pl2_dll.PL2_GetDigitalChannelInfoBySource(
-            self._file_handle,
+            self._handle,
             ctypes.c_int(source_id),
             ctypes.c_int(one_based_channel_index_in_source),
             ctypes.byref(pl2_digital_channel_info)
@@ -1027,15 +2151,20 @@ class PyPL2FileReader:
             event_values - array the size of PL2DigitalChannelInfo.m_NumberOfEvents
         """
 
-        self.pl2_dll.PL2_GetDigitalChannelData.argtypes = (
+        if self._rpc_file_handle and not self._shared_memory:
+            return self._rpc_read('pl2_get_digital_channel_data', zero_based_channel_index)
+        if self._shared_memory:
+            return self._get_digital_channel_data_shared(zero_based_channel_index)
+
+        argtypes = (
             ctypes.c_int,
             ctypes.c_int,
             ctypes.POINTER(ctypes.c_ulonglong),
             ctypes.POINTER(ctypes.c_longlong),
-            ctypes.POINTER(ctypes.c_short),
+            ctypes.POINTER(ctypes.c_ushort),
         )
 
-        self.pl2_dll.PL2_GetDigitalChannelData.memsync = [
+        memsync = [
             {
                 'p': [3],
                 'l': [2],
@@ -1055,8 +2184,9 @@ class PyPL2FileReader:
         event_timestamps = (ctypes.c_longlong * echannel_info.m_NumberOfEvents)()
         event_values = (ctypes.c_ushort * echannel_info.m_NumberOfEvents)()
 
-        result = self.pl2_dll.PL2_GetDigitalChannelData(
-            self._file_handle,
+        result = self._call_with_prototype(
+            'PL2_GetDigitalChannelData', argtypes, memsync,
+            self._handle,
             ctypes.c_int(zero_based_channel_index),
             num_events_returned,
             event_timestamps,
@@ -1068,6 +2198,41 @@ class PyPL2FileReader:
         
         return to_array(event_timestamps), to_array(event_values)
 
+    def _get_digital_channel_data_shared(self, zero_based_channel_index):
+        """
+        pl2_get_digital_channel_data with the output arrays in shared memory.
+        """
+
+        argtypes = (
+            ctypes.c_int,
+            ctypes.c_int,
+            ctypes.POINTER(ctypes.c_ulonglong),
+            ctypes.c_void_p,
+            ctypes.c_void_p,
+        )
+        memsync = []
+
+        echannel_info = self.pl2_get_digital_channel_info(zero_based_channel_index)
+
+        num_events_returned = ctypes.c_ulonglong(echannel_info.m_NumberOfEvents)
+        buffers = [_WineSharedMemory(echannel_info.m_NumberOfEvents, np.int64),
+                   _WineSharedMemory(echannel_info.m_NumberOfEvents, np.uint16)]
+        try:
+            result = self._call_with_prototype('PL2_GetDigitalChannelData', argtypes, memsync,
+                                               self._handle,
+                                               ctypes.c_int(zero_based_channel_index),
+                                               num_events_returned,
+                                               *(ctypes.c_void_p(b.address) for b in buffers))
+        finally:
+            for buffer in buffers:
+                buffer.close()
+
+        if not result:
+            self._print_error()
+            return None
+
+        return tuple(buffer.array for buffer in buffers)
+
     def pl2_get_digital_channel_data_by_name(self, channel_name):
         """
         Retrieve digital even channel data
@@ -1080,34 +2245,13 @@ class PyPL2FileReader:
             event_values - array the size of PL2DigitalChannelInfo.m_NumberOfEvents
         """
 
+        index = self._digital_channel_indices_by_name.get(_channel_name_key(channel_name))
+        if index is not None:
+            return self.pl2_get_digital_channel_data(index)
+
         if hasattr(channel_name, 'encode'):
             channel_name = channel_name.encode('ascii')
 
-        self.pl2_dll.PL2_GetDigitalChannelDataByName.argtypes = (
-            ctypes.c_int,  # file handle
-            ctypes.POINTER(ctypes.c_char),  # channel name
-            ctypes.POINTER(ctypes.c_ulonglong),  # equivalent to m_NumberOfEvents
-            ctypes.POINTER(ctypes.c_longlong),  # array of timestamps of length m_NumberOfEvents
-            ctypes.POINTER(ctypes.c_ushort),  # array of values m_NumberOfEvents
-        )
-
-        self.pl2_dll.PL2_GetDigitalChannelDataByName.memsync = [
-            {
-                'p': [1],  # ctypes.POINTER argument
-                'n': True,  # null-terminated string flag
-            },
-            {
-                'p': [3],
-                'l': [2],
-                't': ctypes.c_longlong
-            },
-            {
-                'p': [4],
-                'l': [2],
-                't': ctypes.c_ushort
-            }
-        ]
-        
         echannel_info = self.pl2_get_digital_channel_info_by_name(channel_name)
 
         # These will be filled in by the dll method.
@@ -1115,7 +2259,7 @@ class PyPL2FileReader:
         event_timestamps = (ctypes.c_longlong * echannel_info.m_NumberOfEvents)()
         event_values = (ctypes.c_ushort * echannel_info.m_NumberOfEvents)()
         
-        result = self.pl2_dll.PL2_GetDigitalChannelDataByName(self._file_handle,
+        result = self.pl2_dll.PL2_GetDigitalChannelDataByName(self._handle,
                                                               channel_name,
                                                               num_events_returned,
                                                               event_timestamps,
@@ -1140,27 +2284,9 @@ class PyPL2FileReader:
             event_values - array the size of PL2DigitalChannelInfo.m_NumberOfEvents
         """
 
-        self.pl2_dll.PL2_GetDigitalChannelDataBySource.argtypes = (
-            ctypes.c_int,
-            ctypes.c_int,
-            ctypes.c_int,
-            ctypes.POINTER(ctypes.c_ulonglong),
-            ctypes.POINTER(ctypes.c_longlong),
-            ctypes.POINTER(ctypes.c_ushort),
-        )
-
-        self.pl2_dll.PL2_GetDigitalChannelDataBySource.memsync = [
-            {
-                'p': [4],
-                'l': [3],
-                't': ctypes.c_longlong
-            },
-            {
-                'p': [5],
-                'l': [3],
-                't': ctypes.c_ushort
-            }
-        ]
+        index = self._digital_channel_indices_by_source.get((source_id, one_based_channel_index_in_source))
+        if index is not None:
+            return self.pl2_get_digital_channel_data(index)
 
         echannel_info = self.pl2_get_digital_channel_info_by_source(source_id,
                                                                     one_based_channel_index_in_source)
@@ -1171,7 +2297,7 @@ class PyPL2FileReader:
         event_values = (ctypes.c_ushort * echannel_info.m_NumberOfEvents)()
 
         result = self.pl2_dll.PL2_GetDigitalChannelDataBySource(
-            self._file_handle,
+            self._handle,
             ctypes.c_int(source_id),
             ctypes.c_int(one_based_channel_index_in_source),
             num_events_returned,
@@ -1198,13 +2324,8 @@ class PyPL2FileReader:
             The class instances passed to the function are filled with values
         """
 
-        self.pl2_dll.PL2_GetStartStopChannelInfo.argtypes = (
-            ctypes.c_int,
-            ctypes.POINTER(ctypes.c_ulonglong)
-        )
-
         result = self.pl2_dll.PL2_GetStartStopChannelInfo(
-            self._file_handle,
+            self._handle,
             number_of_start_stop_events
         )
 
@@ -1212,7 +2333,7 @@ class PyPL2FileReader:
 
     def pl2_get_start_stop_channel_data(self, num_events_returned, event_timestamps, event_values):
         """
-        Retrieve digital channel data
+        Retrieve start/stop channel data
         
         Args:
             _file_handle - file handle
@@ -1226,67 +2347,447 @@ class PyPL2FileReader:
             The class instances passed to the function are filled with values
         """
 
-        self.pl2_dll.PL2_GetStartStopChannelInfo.argtypes = (
-            ctypes.c_int,
-            ctypes.POINTER(ctypes.c_ulonglong),
-            ctypes.POINTER(ctypes.c_longlong),
-            ctypes.POINTER(ctypes.c_ushort)
-        )
-
-        self.pl2_dll.PL2_GetStartStopChannelInfo.memsync = [
-            {
-                'p': [2],
-                'l': [1],
-                't': ctypes.c_longlong
-            },
-            {
-                'p': [3],
-                'l': [1],
-                't': ctypes.c_ushort
-            },
-        ]
-
-        result = self.pl2_dll.PL2_GetStartStopChannelData(self._file_handle,
+        result = self.pl2_dll.PL2_GetStartStopChannelData(self._handle,
                                                           num_events_returned,
                                                           event_timestamps,
                                                           event_values)
 
         return result
 
+    def pl2_get_start_stop_channel_events(self):
+        """
+        Retrieve the events of the start/stop channel
+
+        Returns:
+            event_timestamps - int64 array of the event timestamps in ticks
+            event_values - uint16 array of the event types, PL2_START, PL2_STOP,
+                           PL2_PAUSE or PL2_RESUME
+            None on failure
+        """
+
+        number_of_events = ctypes.c_ulonglong(0)
+        if not self.pl2_get_start_stop_channel_info(number_of_events):
+            self._print_error()
+            return None
+
+        num_events_returned = ctypes.c_ulonglong(number_of_events.value)
+        event_timestamps = (ctypes.c_longlong * number_of_events.value)()
+        event_values = (ctypes.c_ushort * number_of_events.value)()
+        if not self.pl2_get_start_stop_channel_data(num_events_returned, event_timestamps, event_values):
+            self._print_error()
+            return None
+
+        n = num_events_returned.value
+        return to_array(event_timestamps)[:n], to_array(event_values)[:n]
+
     def _print_error(self):
         error_message = self.pl2_get_last_error()
         print(f'pypl2lib error: {error_message}')
 
-    # PL2 data block functions purposefully not implemented.
+    def _call_with_prototype(self, function_name, argtypes, memsync, *args):
+        """
+        Calls one of the _VARIABLE_PROTOTYPES functions with the given
+        prototype. The lock keeps readers sharing the .dll from changing the
+        prototype between setting it and the call.
+        """
+        function = getattr(self.pl2_dll, function_name)
+        with _prototype_locks[self.pl2_dll][function_name]:
+            function.argtypes = argtypes
+            if _USE_ZUGBRUECKE:
+                function.memsync = memsync
+            return function(*args)
+
+    def pl2_call_batch(self):
+        """
+        Returns a batch of channel info and channel data reads that are run
+        together. With rpc=True they are made by the helper process in a
+        single round trip, otherwise one after the other.
+
+            >>>batch = reader.pl2_call_batch()
+            >>>for i in range(32):
+            >>>    batch.pl2_get_spike_channel_info(i)
+            >>>spike_channel_infos = batch.run()
+
+        Returns:
+            PL2CallBatch instance
+        """
+        return PL2CallBatch(self)
+
+    def _run_call_batch(self, calls):
+        if not self._rpc_file_handle:
+            return [getattr(self, method)(*args) for method, args in calls]
+
+        results = [None] * len(calls)
+        rpc_calls = []
+        converters = []
+        for i, (method, args) in enumerate(calls):
+            rpc_call = self._rpc_call(method, *args)
+            if rpc_call is None:
+                # answered from the cached channel infos
+                results[i] = getattr(self, method)(*args)
+            elif rpc_call[0] is None:
+                # the channel info read already failed
+                continue
+            else:
+                rpc_calls.append(rpc_call[0])
+                converters.append((i, rpc_call[1]))
+
+        if rpc_calls:
+            with span('PL2CallBatch.run', kind='rpc') as traced:
+                rpc_results = get_rpc_session(self.pl2_dll_file_path).run(rpc_calls)
+                traced.nbytes = sum(len(output) for _, outputs, _ in rpc_results for output in outputs
+                                    if isinstance(output, bytearray))
+            for (i, convert), (result, outputs, error) in zip(converters, rpc_results):
+                if not result:
+                    print(f'pypl2lib error: {error}')
+                    continue
+                results[i] = convert(outputs)
+
+        return results
+
+    def _rpc_open_file(self, pl2_file):
+        """
+        Opens pl2_file in the helper process. Prints the .dll error and
+        returns False if the file can't be opened.
+        """
+        (result, outputs, error), = get_rpc_session(self.pl2_dll_file_path).run(
+            [('PL2_OpenFile', [('bytes', pl2_file.encode('ascii')), ('ref_int', 0)])])
+        if not outputs[0]:
+            print(f'pypl2lib error: {error}')
+            return False
+        self._rpc_file_handle = outputs[0]
+        return True
+
+    def _rpc_call(self, method, zero_based_channel_index=None):
+        """
+        Returns the helper process call of a PL2CallBatch read and the function
+        converting its outputs to the result of the reader method, or None if
+        the result is cached. The call is None if the channel info of a data
+        read can't be read.
+        """
+        handle = ('int', self._rpc_file_handle)
+
+        def info_call(function_name, infos, info_type):
+            if infos is not None and 0 <= zero_based_channel_index < len(infos):
+                return None
+            return ((function_name, [handle, ('int', zero_based_channel_index), ('buffer', ctypes.sizeof(info_type))]),
+                    lambda outputs: info_type.from_buffer_copy(outputs[0]))
+
+        if method == 'pl2_get_file_info':
+            def file_info(outputs):
+                self.pl2_file_info = PL2FileInfo.from_buffer_copy(outputs[0])
+                return self.pl2_file_info
+            return ('PL2_GetFileInfo', [handle, ('buffer', ctypes.sizeof(PL2FileInfo))]), file_info
+        if method == 'pl2_get_analog_channel_info':
+            return info_call('PL2_GetAnalogChannelInfo', self._analog_channel_infos, PL2AnalogChannelInfo)
+        if method == 'pl2_get_spike_channel_info':
+            return info_call('PL2_GetSpikeChannelInfo', self._spike_channel_infos, PL2SpikeChannelInfo)
+        if method == 'pl2_get_digital_channel_info':
+            return info_call('PL2_GetDigitalChannelInfo', self._digital_channel_infos, PL2DigitalChannelInfo)
+
+        index = ('int', zero_based_channel_index)
+        if method in ('pl2_get_analog_channel_data', 'pl2_get_spike_channel_data', 'pl2_get_digital_channel_data'):
+            info = getattr(self, method.replace('_data', '_info'))(zero_based_channel_index)
+            if info is None:
+                return None, None
+        if method == 'pl2_get_analog_channel_data':
+            n_fragments, n_values = info.m_MaximumNumberOfFragments, info.m_NumberOfValues
+            return (('PL2_GetAnalogChannelData', [handle, index, ('ref_ulonglong', n_fragments),
+                                                  ('ref_ulonglong', n_values), ('buffer', 8 * n_fragments),
+                                                  ('buffer', 8 * n_fragments), ('buffer', 2 * n_values)]),
+                    lambda outputs: (np.frombuffer(outputs[2], dtype=np.int64),
+                                     np.frombuffer(outputs[3], dtype=np.uint64),
+                                     np.frombuffer(outputs[4], dtype=np.int16)))
+        if method == 'pl2_get_spike_channel_data':
+            n_spikes, samples_per_spike = info.m_NumberOfSpikes, info.m_SamplesPerSpike
+            return (('PL2_GetSpikeChannelData', [handle, index, ('ref_ulonglong', n_spikes), ('buffer', 8 * n_spikes),
+                                                 ('buffer', 2 * n_spikes),
+                                                 ('buffer', 2 * n_spikes * samples_per_spike)]),
+                    lambda outputs: (np.frombuffer(outputs[1], dtype=np.uint64),
+                                     np.frombuffer(outputs[2], dtype=np.uint16),
+                                     np.frombuffer(outputs[3], dtype=np.int16).reshape(n_spikes, samples_per_spike)))
+        if method == 'pl2_get_digital_channel_data':
+            n_events = info.m_NumberOfEvents
+            return (('PL2_GetDigitalChannelData', [handle, index, ('ref_ulonglong', n_events),
+                                                   ('buffer', 8 * n_events), ('buffer', 2 * n_events)]),
+                    lambda outputs: (np.frombuffer(outputs[1], dtype=np.int64),
+                                     np.frombuffer(outputs[2], dtype=np.uint16)))
+        raise ValueError(f"Unknown batch method '{method}'")
+
+    # PL2 data block functions. The .dll keeps the current data block in its
+    # own memory and returns pointers into it. Through zugbruecke these point
+    # into the wine process, so the data is copied into shared memory there.
+    def _get_data_block_array(self, function_name, c_type, n_items):
+        address = getattr(self.pl2_dll, function_name)(self._handle)
+        if not address:
+            self._print_error()
+            return None
+
+        if not _USE_ZUGBRUECKE:
+            return np.ctypeslib.as_array((c_type * n_items).from_address(address)).copy()
+
+        # one mapping is reused for all blocks, so copying an array takes
+        # a single RtlMoveMemory round trip
+        if self._data_block_buffer is None:
+            self._data_block_buffer = _WineCopyBuffer()
+        return self._data_block_buffer.copy(address, c_type, n_items)
+
+    def _close_data_block_buffer(self):
+        if self._data_block_buffer is not None:
+            self._data_block_buffer.close()
+            self._data_block_buffer = None
+
     def pl2_read_first_data_block(self):
-        pass
+        """
+        Moves to the first data block of the file.
+
+        Returns:
+            1 - Success
+            0 - Failure or no data blocks in the file
+        """
+
+        self._data_block_info = None
+        return self.pl2_dll.PL2_ReadFirstDataBlock(self._handle)
 
     def pl2_read_next_data_block(self):
-        pass
+        """
+        Moves to the next data block of the file.
+
+        Returns:
+            1 - Success
+            0 - Failure or end of file reached
+        """
+
+        self._data_block_info = None
+        return self.pl2_dll.PL2_ReadNextDataBlock(self._handle)
 
     def pl2_get_data_block_info(self):
-        pass
+        """
+        Retrieve type, source, channel and number of items of the current data block.
+        The info is read once per data block, the getters of the block's
+        arrays use it too.
+
+        Returns:
+            pl2_block_info - PL2BlockInfo class instance
+        """
+
+        if self._data_block_info is not None:
+            return self._data_block_info
+
+        pl2_block_info = PL2BlockInfo()
+        result = self.pl2_dll.PL2_GetDataBlockInfo(self._handle, ctypes.byref(pl2_block_info))
+
+        if not result:
+            return None
+
+        self._data_block_info = pl2_block_info
+        return pl2_block_info
 
     def pl2_get_data_block_timestamps(self):
-        pass
+        """
+        Retrieve timestamps of the current spike, digital event or start/stop data block
+
+        Returns:
+            timestamps - array the size of PL2BlockInfo.m_NumberOfItems
+        """
+
+        block_info = self.pl2_get_data_block_info()
+        if block_info is None:
+            return None
+
+        if block_info.m_Type == PL2_BLOCK_TYPE_SPIKE:
+            return self.pl2_get_spike_data_block_timestamps()
+        if block_info.m_Type == PL2_BLOCK_TYPE_DIGITAL_EVENT:
+            return self.pl2_get_digital_data_block_timestamps()
+        if block_info.m_Type == PL2_BLOCK_TYPE_STARTSTOP_EVENT:
+            return self.pl2_get_start_stop_data_block_timestamps()
+
+        return None
+
+    def pl2_get_spike_data_block_timestamps(self):
+        """
+        Retrieve timestamps of the current spike data block
+
+        Returns:
+            spike_timestamps - array the size of PL2BlockInfo.m_NumberOfItems
+        """
+
+        block_info = self.pl2_get_data_block_info()
+        if block_info is None:
+            return None
+
+        return self._get_data_block_array('PL2_GetSpikeDataBlockTimestamps', ctypes.c_ulonglong,
+                                          block_info.m_NumberOfItems)
 
     def pl2_get_spike_data_block_units(self):
-        pass
+        """
+        Retrieve unit assignments of the current spike data block
+
+        Returns:
+            units - array the size of PL2BlockInfo.m_NumberOfItems
+        """
+
+        block_info = self.pl2_get_data_block_info()
+        if block_info is None:
+            return None
+
+        return self._get_data_block_array('PL2_GetSpikeDataBlockUnits', ctypes.c_ushort,
+                                          block_info.m_NumberOfItems)
 
     def pl2_get_spike_data_block_waveforms(self):
-        pass
+        """
+        Retrieve waveforms of the current spike data block
+
+        Returns:
+            values - array of shape (PL2BlockInfo.m_NumberOfItems, PL2SpikeChannelInfo.m_SamplesPerSpike)
+        """
+
+        block_info = self.pl2_get_data_block_info()
+        if block_info is None:
+            return None
+
+        schannel_info = self.pl2_get_spike_channel_info_by_source(block_info.m_Source, block_info.m_Channel)
+        if schannel_info is None:
+            return None
+
+        values = self._get_data_block_array('PL2_GetSpikeDataBlockWaveforms', ctypes.c_short,
+                                            block_info.m_NumberOfItems * schannel_info.m_SamplesPerSpike)
+        if values is None:
+            return None
+
+        return values.reshape(block_info.m_NumberOfItems, schannel_info.m_SamplesPerSpike)
 
     def pl2_get_analog_data_block_timestamp(self):
-        pass
+        """
+        Retrieve timestamp of the first value of the current analog data block
+
+        Returns:
+            timestamp - int
+        """
+
+        return self.pl2_dll.PL2_GetAnalogDataBlockTimestamp(self._handle)
 
     def pl2_get_analog_data_block_values(self):
-        pass
+        """
+        Retrieve values of the current analog data block
+
+        Returns:
+            values - array the size of PL2BlockInfo.m_NumberOfItems
+        """
+
+        block_info = self.pl2_get_data_block_info()
+        if block_info is None:
+            return None
+
+        return self._get_data_block_array('PL2_GetAnalogDataBlockValues', ctypes.c_short,
+                                          block_info.m_NumberOfItems)
 
     def pl2_get_digital_data_block_timestamps(self):
-        pass
+        """
+        Retrieve timestamps of the current digital event data block
+
+        Returns:
+            event_timestamps - array the size of PL2BlockInfo.m_NumberOfItems
+        """
+
+        block_info = self.pl2_get_data_block_info()
+        if block_info is None:
+            return None
+
+        return self._get_data_block_array('PL2_GetDigitalDataBlockTimestamps', ctypes.c_longlong,
+                                          block_info.m_NumberOfItems)
+
+    def pl2_get_digital_data_block_values(self):
+        """
+        Retrieve values of the current digital event data block
+
+        Returns:
+            event_values - array the size of PL2BlockInfo.m_NumberOfItems
+        """
+
+        block_info = self.pl2_get_data_block_info()
+        if block_info is None:
+            return None
+
+        return self._get_data_block_array('PL2_GetDigitalDataBlockValues', ctypes.c_ushort,
+                                          block_info.m_NumberOfItems)
 
     def pl2_get_start_stop_data_block_timestamps(self):
-        pass
+        """
+        Retrieve timestamps of the current start/stop data block
+
+        Returns:
+            event_timestamps - array the size of PL2BlockInfo.m_NumberOfItems
+        """
+
+        block_info = self.pl2_get_data_block_info()
+        if block_info is None:
+            return None
+
+        return self._get_data_block_array('PL2_GetStartStopDataBlockTimestamps', ctypes.c_longlong,
+                                          block_info.m_NumberOfItems)
 
     def pl2_get_start_stop_data_block_values(self):
-        pass
+        """
+        Retrieve values of the current start/stop data block
+
+        Returns:
+            event_values - array the size of PL2BlockInfo.m_NumberOfItems
+        """
+
+        block_info = self.pl2_get_data_block_info()
+        if block_info is None:
+            return None
+
+        return self._get_data_block_array('PL2_GetStartStopDataBlockValues', ctypes.c_ushort,
+                                          block_info.m_NumberOfItems)
+
+    def iter_data_blocks(self, block_types=None):
+        """
+        Iterates over all data blocks of the file in file order, so a whole
+        recording can be processed in one sequential pass while only a
+        single data block is held in memory.
+
+        Args:
+            block_types - optional collection of PL2_BLOCK_TYPE_* values. Data
+                of other blocks is not read.
+
+        Yields:
+            PL2SpikeBlock, PL2AnalogBlock, PL2DigitalBlock or PL2StartStopBlock
+            named tuples with the data of one block
+        """
+
+        try:
+            yield from self._iter_data_blocks(block_types)
+        finally:
+            # don't keep the shared memory of the largest block
+            self._close_data_block_buffer()
+
+    def _iter_data_blocks(self, block_types):
+        result = self.pl2_read_first_data_block()
+        while result:
+            block_info = self.pl2_get_data_block_info()
+
+            # blocks of unknown type have no block info and are skipped
+            if block_info is not None and (block_types is None or block_info.m_Type in block_types):
+                if block_info.m_Type == PL2_BLOCK_TYPE_SPIKE:
+                    yield PL2SpikeBlock(block_info.m_Source,
+                                        block_info.m_Channel,
+                                        self.pl2_get_spike_data_block_timestamps(),
+                                        self.pl2_get_spike_data_block_units(),
+                                        self.pl2_get_spike_data_block_waveforms())
+                elif block_info.m_Type == PL2_BLOCK_TYPE_ANALOG:
+                    yield PL2AnalogBlock(block_info.m_Source,
+                                         block_info.m_Channel,
+                                         self.pl2_get_analog_data_block_timestamp(),
+                                         self.pl2_get_analog_data_block_values())
+                elif block_info.m_Type == PL2_BLOCK_TYPE_DIGITAL_EVENT:
+                    yield PL2DigitalBlock(block_info.m_Source,
+                                          block_info.m_Channel,
+                                          self.pl2_get_digital_data_block_timestamps(),
+                                          self.pl2_get_digital_data_block_values())
+                elif block_info.m_Type == PL2_BLOCK_TYPE_STARTSTOP_EVENT:
+                    yield PL2StartStopBlock(self.pl2_get_start_stop_data_block_timestamps(),
+                                            self.pl2_get_start_stop_data_block_values())
+
+            result = self.pl2_read_next_data_block()
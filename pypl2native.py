@@ -0,0 +1,1375 @@
+# pypl2native.py - Pure Python/NumPy reader for .pl2 files. Parses the
+# file, channel headers and data blocks directly instead of going through
+# PL2FileReader.dll (and wine/zugbruecke on non-windows systems).
+#
+# A .pl2 file is a sequence of PDPs (packets). Every PDP starts with a
+# 16 byte header:
+#   byte 0       - PDP type
+#   byte 1       - source id
+#   bytes 2-3    - length of the PDP data in 16 bit words
+#   bytes 4-5    - channel within the source
+#   bytes 6-7    - item count (samples for analog blocks, samples per
+#                  waveform for spike blocks, events for digital blocks)
+#   bytes 8-15   - type dependent (block timestamp, number of waveforms
+#                  or total number of items for summary PDPs)
+# The data following the header is padded to a multiple of 16 bytes.
+#
+# The start of the file holds the version, file info, file header and one
+# channel header PDP per channel. Per channel summary PDPs near the end of
+# the file list the file offset and item count of each data block of that
+# channel, so channel data can be read without scanning the whole file.
+
+import ctypes as _ctypes
+import pathlib
+import struct
+
+import numpy as np
+
+from pypl2lib import (PL2FileInfo, PL2AnalogChannelInfo, PL2SpikeChannelInfo,
+                      PL2DigitalChannelInfo, PL2BlockInfo, PyPL2FileReader, to_array,
+                      merge_fragments, _channel_name_key, _channel_indices,
+                      PL2_BLOCK_TYPE_SPIKE, PL2_BLOCK_TYPE_ANALOG, PL2_BLOCK_TYPE_DIGITAL_EVENT,
+                      PL2_BLOCK_TYPE_STARTSTOP_EVENT)
+
+# PDP types
+PDP_VERSION = 0xFE
+PDP_FILE_INFO = 0xD2
+PDP_FILE_HEADER = 0xD3
+PDP_ANALOG_CHANNEL_HEADER = 0xD4
+PDP_SPIKE_CHANNEL_HEADER = 0xD5
+PDP_DIGITAL_CHANNEL_HEADER = 0xD6
+PDP_ANALOG_SUMMARY = 0xDD
+PDP_SPIKE_SUMMARY = 0xDE
+PDP_DIGITAL_SUMMARY = 0xDF
+PDP_START_STOP_SUMMARY = 0xE0
+PDP_SPIKE_DATA = 0x31
+PDP_ANALOG_DATA = 0x42
+PDP_START_STOP_DATA = 0x59
+PDP_DIGITAL_DATA = 0x5A
+PDP_UNKNOWN_DATA = 0x72
+
+# data block PDPs visited by pl2_read_first/next_data_block. Like the .dll,
+# blocks of unknown type are visited but have no block info.
+_DATA_BLOCK_BLOCK_TYPES = {
+    PDP_SPIKE_DATA: PL2_BLOCK_TYPE_SPIKE,
+    PDP_ANALOG_DATA: PL2_BLOCK_TYPE_ANALOG,
+    PDP_DIGITAL_DATA: PL2_BLOCK_TYPE_DIGITAL_EVENT,
+    PDP_START_STOP_DATA: PL2_BLOCK_TYPE_STARTSTOP_EVENT,
+    PDP_UNKNOWN_DATA: None,
+}
+
+_PDP_HEADER = struct.Struct('<BBHHHQ')
+_PDP_HEADER_SIZE = _PDP_HEADER.size
+
+# offsets into the file info PDP data
+_FILE_INFO_FIRST_DATA_BLOCK = 0x08
+_FILE_INFO_FIRST_SUMMARY = 0x18
+_FILE_INFO_START_RECORDING_TIME = 0x20
+
+
+class PL2FormatError(Exception):
+    """
+    Raised when the .pl2 file does not have the expected layout.
+    """
+    pass
+
+
+def _pdp_data_size(length_in_words):
+    return ((length_in_words + 7) >> 3) << 4
+
+
+class _ChannelBlocks:
+    """
+    File offsets and item counts of all data blocks of a single channel,
+    as listed in the channel's summary PDP. The timestamps of analog blocks
+    are filled in from the block headers when first needed.
+    """
+
+    def __init__(self, offsets=None, counts=None, total=0):
+        self.offsets = np.zeros(0, dtype=np.uint64) if offsets is None else offsets
+        self.counts = np.zeros(0, dtype=np.uint16) if counts is None else counts
+        self.total = total
+        self.timestamps = None
+
+
+class PyPL2NativeFileReader(PyPL2FileReader):
+    # replaces the property that loads the .dll
+    pl2_dll = None
+
+    def __init__(self, pl2_dll_file_path=None, backend='native', memory_map=False, sidecar_index=False):
+        """
+        PyPL2NativeFileReader provides the PyPL2FileReader API without
+        PL2FileReader.dll. Channel infos are returned as the same ctypes
+        structures and channel data as the same numpy arrays as with the
+        dll backend.
+
+        Args:
+            pl2_dll_file_path - ignored, accepted for compatibility with
+                PyPL2FileReader
+            backend - ignored, always 'native'
+            memory_map - if True, the file is memory-mapped instead of read.
+                Channel data stored in a single data block is then returned
+                as read-only views of the mapped file, and the
+                pl2_get_*_channel_data_views methods return per-block views
+                without copying any data.
+            sidecar_index - if True, the file and channel infos and the
+                data block lists read when a file is opened are saved next
+                to it (file.pl2.idx) and loaded from there when the unchanged
+                file is opened again, so its headers and summaries are not
+                parsed again.
+
+        Returns:
+            None
+        """
+        self._file_handle = 0
+        self._file = None
+        self._data_block_buffer = None
+        self._map = None
+        self._position = 0
+        self._memory_map = memory_map
+        self._shared_memory = False
+        self._rpc = False
+        self._rpc_file_handle = 0
+        self._sidecar_index = sidecar_index
+        self._first_data_block = 0
+        self._data_block = None
+        self._next_data_block = 0
+        self._last_error = ''
+        self.pl2_file_info = None
+        self.pl2_dll_file_path = None
+        self._reset_channel_infos()
+
+    def _reset_channel_infos(self):
+        super()._reset_channel_infos()
+        self._analog_channel_infos = []
+        self._spike_channel_infos = []
+        self._digital_channel_infos = []
+        self._analog_blocks = []
+        self._spike_blocks = []
+        self._digital_blocks = []
+        self._start_stop_blocks = _ChannelBlocks()
+        self._data_block = None
+
+    def pl2_open_file(self, pl2_file):
+        """
+        Opens a PL2 file and reads its file and channel headers.
+
+        Args:
+            pl2_file - full path of the file
+
+        Returns:
+            None
+        """
+        self.pl2_close_file()
+        self.pl2_file_info = None
+
+        try:
+            self._file = open(pathlib.Path(pl2_file), 'rb')
+            if self._memory_map:
+                self._map = np.memmap(self._file, dtype=np.uint8, mode='r')
+        except OSError as e:
+            self.pl2_close_file()
+            self._set_error(f'unable to open file {pl2_file}: {e.strerror}')
+            return None
+        except ValueError as e:
+            self.pl2_close_file()
+            self._set_error(f'unable to map file {pl2_file}: {e}')
+            return None
+
+        try:
+            if not (self._sidecar_index and self._open_sidecar_index(pl2_file)):
+                self._read_headers()
+                if self._sidecar_index:
+                    self._save_sidecar_index(pl2_file)
+        except PL2FormatError as e:
+            self.pl2_close_file()
+            self._set_error(str(e))
+            return None
+
+        self._file_handle = 1
+
+    def pl2_close_file(self):
+        """
+        Closes handle to PL2 file.
+
+        Returns:
+            None
+        """
+        if self._file is not None:
+            self._file.close()
+        # views handed out earlier keep the mapping alive until they are released
+        self._map = None
+        self._file = None
+        self._file_handle = 0
+        self._reset_channel_infos()
+
+    def pl2_close_all_files(self):
+        """
+        Closes all files that have been opened by this reader
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+        self.pl2_close_file()
+
+    def pl2_get_last_error(self):
+        """
+        Retrieve description of the last error
+
+        Returns:
+            str - error message
+        """
+        return self._last_error
+
+    def _set_error(self, message):
+        self._last_error = message
+        self._print_error()
+
+    def _seek(self, offset):
+        if self._map is not None:
+            self._position = offset
+        else:
+            self._file.seek(offset)
+
+    def _tell(self):
+        if self._map is not None:
+            return self._position
+        return self._file.tell()
+
+    def _read_pdp(self, offset=None):
+        """
+        Reads the PDP at offset (or at the current file position).
+
+        Returns:
+            header - tuple of (type, source, length, channel, count, value)
+            data - buffer with the PDP data without padding. This is a view
+                of the mapped file if memory_map is enabled and a freshly
+                read, writable buffer otherwise
+        """
+        if offset is not None:
+            self._seek(offset)
+
+        if self._map is not None:
+            position = self._position
+            raw_header = self._map[position:position + _PDP_HEADER_SIZE]
+            if len(raw_header) < _PDP_HEADER_SIZE:
+                return None, None
+            header = _PDP_HEADER.unpack(raw_header)
+            data_start = position + _PDP_HEADER_SIZE
+            padded_size = _pdp_data_size(header[2])
+            if data_start + padded_size > len(self._map):
+                raise PL2FormatError(f'truncated pdp of type 0x{header[0]:02x}')
+            self._position = data_start + padded_size
+            return header, self._map[data_start:data_start + header[2] * 2]
+
+        raw_header = self._file.read(_PDP_HEADER_SIZE)
+        if len(raw_header) < _PDP_HEADER_SIZE:
+            return None, None
+        header = _PDP_HEADER.unpack(raw_header)
+        data = bytearray(_pdp_data_size(header[2]))
+        if self._file.readinto(data) < len(data):
+            raise PL2FormatError(f'truncated pdp of type 0x{header[0]:02x}')
+        return header, memoryview(data)[:header[2] * 2]
+
+    def _read_pdp_header(self, offset):
+        """
+        Reads only the header of the PDP at offset.
+        """
+        if self._map is not None:
+            raw_header = self._map[offset:offset + _PDP_HEADER_SIZE]
+        else:
+            self._file.seek(offset)
+            raw_header = self._file.read(_PDP_HEADER_SIZE)
+        if len(raw_header) < _PDP_HEADER_SIZE:
+            return None
+        return _PDP_HEADER.unpack(raw_header)
+
+    def _read_headers(self):
+        header, data = self._read_pdp(0)
+        if header is None or header[0] != PDP_VERSION:
+            raise PL2FormatError('not a .pl2 file: missing version pdp')
+
+        header, file_info_data = self._read_pdp()
+        if header is None or header[0] != PDP_FILE_INFO:
+            raise PL2FormatError('unable to read file info pdp')
+
+        header, file_header_data = self._read_pdp()
+        if header is None or header[0] != PDP_FILE_HEADER:
+            raise PL2FormatError('unable to read file header pdp')
+
+        file_info = _struct_from_bytes(PL2FileInfo, file_header_data)
+        (file_info.m_StartRecordingTime,
+         file_info.m_DurationOfRecording) = struct.unpack_from('<QQ', file_info_data,
+                                                               _FILE_INFO_START_RECORDING_TIME)
+
+        channel_headers = {
+            PDP_ANALOG_CHANNEL_HEADER: (PL2AnalogChannelInfo, self._analog_channel_infos),
+            PDP_SPIKE_CHANNEL_HEADER: (PL2SpikeChannelInfo, self._spike_channel_infos),
+            PDP_DIGITAL_CHANNEL_HEADER: (PL2DigitalChannelInfo, self._digital_channel_infos),
+        }
+        for _ in range(file_info.m_NumberOfChannelHeaders):
+            header, data = self._read_pdp()
+            if header is None or header[0] not in channel_headers:
+                raise PL2FormatError('unable to read channel header pdp')
+            info_type, infos = channel_headers[header[0]]
+            infos.append(_struct_from_bytes(info_type, data))
+
+        self._analog_blocks = [_ChannelBlocks() for _ in self._analog_channel_infos]
+        self._spike_blocks = [_ChannelBlocks() for _ in self._spike_channel_infos]
+        self._digital_blocks = [_ChannelBlocks() for _ in self._digital_channel_infos]
+
+        self._first_data_block, = struct.unpack_from('<Q', file_info_data, _FILE_INFO_FIRST_DATA_BLOCK)
+
+        first_summary, = struct.unpack_from('<Q', file_info_data, _FILE_INFO_FIRST_SUMMARY)
+        if first_summary:
+            self._read_summaries(first_summary)
+
+        for info, blocks in zip(self._analog_channel_infos, self._analog_blocks):
+            info.m_NumberOfValues = blocks.total
+            info.m_MaximumNumberOfFragments = len(blocks.offsets)
+        for info, blocks in zip(self._spike_channel_infos, self._spike_blocks):
+            info.m_NumberOfSpikes = blocks.total
+        for info, blocks in zip(self._digital_channel_infos, self._digital_blocks):
+            info.m_NumberOfEvents = blocks.total
+
+        self._analog_channel_indices_by_name, self._analog_channel_indices_by_source = _channel_indices(
+            self._analog_channel_infos)
+        self._spike_channel_indices_by_name, self._spike_channel_indices_by_source = _channel_indices(
+            self._spike_channel_infos)
+        self._digital_channel_indices_by_name, self._digital_channel_indices_by_source = _channel_indices(
+            self._digital_channel_infos)
+
+        self.pl2_file_info = file_info
+
+    def _index_arrays(self):
+        """
+        Adds the data block lists of all channels to the sidecar index.
+        """
+        arrays = super()._index_arrays()
+        arrays['first_data_block'] = np.array([self._first_data_block], dtype=np.uint64)
+        for name, channel_blocks in (('analog', self._analog_blocks), ('spike', self._spike_blocks),
+                                     ('digital', self._digital_blocks), ('start_stop', [self._start_stop_blocks])):
+            arrays[f'{name}_block_offsets'] = np.concatenate(
+                [np.zeros(0, dtype=np.uint64)] + [blocks.offsets for blocks in channel_blocks])
+            arrays[f'{name}_block_counts'] = np.concatenate(
+                [np.zeros(0, dtype=np.uint16)] + [blocks.counts for blocks in channel_blocks])
+            arrays[f'{name}_block_splits'] = np.cumsum(
+                [0] + [len(blocks.offsets) for blocks in channel_blocks], dtype=np.int64)
+            arrays[f'{name}_block_totals'] = np.array([blocks.total for blocks in channel_blocks], dtype=np.uint64)
+        return arrays
+
+    def _restore_index(self, index):
+        super()._restore_index(index)
+        self._first_data_block = int(index['first_data_block'][0])
+
+        def channel_blocks(name):
+            offsets = index[f'{name}_block_offsets'].astype(np.uint64)
+            counts = index[f'{name}_block_counts'].astype(np.uint16)
+            splits = index[f'{name}_block_splits']
+            return [_ChannelBlocks(offsets[start:stop], counts[start:stop], int(total))
+                    for start, stop, total in zip(splits[:-1], splits[1:], index[f'{name}_block_totals'])]
+
+        self._analog_blocks = channel_blocks('analog')
+        self._spike_blocks = channel_blocks('spike')
+        self._digital_blocks = channel_blocks('digital')
+        self._start_stop_blocks, = channel_blocks('start_stop')
+        if (len(self._analog_blocks), len(self._spike_blocks), len(self._digital_blocks)) != (
+                len(self._analog_channel_infos), len(self._spike_channel_infos), len(self._digital_channel_infos)):
+            raise ValueError('sidecar index does not match its channel infos')
+
+    def _read_summaries(self, offset):
+        summaries = {
+            PDP_ANALOG_SUMMARY: (self._analog_channel_infos, self._analog_blocks),
+            PDP_SPIKE_SUMMARY: (self._spike_channel_infos, self._spike_blocks),
+            PDP_DIGITAL_SUMMARY: (self._digital_channel_infos, self._digital_blocks),
+        }
+        lookup = {pdp_type: {(info.m_Source, info.m_Channel): i for i, info in enumerate(infos)}
+                  for pdp_type, (infos, _) in summaries.items()}
+
+        self._seek(offset)
+        while True:
+            header, data = self._read_pdp()
+            if header is None:
+                break
+            pdp_type, source, _, channel, _, total = header
+
+            # each summary holds one file offset (uint64), one timestamp
+            # (uint64) and one item count (uint16) per data block, stored
+            # column by column
+            n_blocks = len(data) // 18
+            blocks = _ChannelBlocks(np.frombuffer(data, dtype='<u8', count=n_blocks),
+                                    np.frombuffer(data, dtype='<u2', count=n_blocks,
+                                                  offset=16 * n_blocks),
+                                    total)
+
+            if pdp_type == PDP_START_STOP_SUMMARY:
+                self._start_stop_blocks = blocks
+            elif pdp_type in summaries:
+                index = lookup[pdp_type].get((source, channel))
+                if index is not None:
+                    summaries[pdp_type][1][index] = blocks
+
+    def _iter_channel_blocks(self, offsets, pdp_type, source=None, channel=None):
+        """
+        Reads the data blocks at offsets and yields their headers and data
+        """
+        for offset in offsets:
+            header, data = self._read_pdp(int(offset))
+            if header is None or header[0] != pdp_type:
+                raise PL2FormatError(f'invalid data block at file offset {offset}')
+            if source is not None and (header[1], header[3]) != (source, channel):
+                raise PL2FormatError(f'data block at file offset {offset} belongs to another channel')
+            yield header, data
+
+    def pl2_get_file_info(self):
+        """
+        Retrieve information about pl2 file.
+
+        Returns:
+            pl2_file_info - PL2FileInfo class instance
+        """
+        if self.pl2_file_info is None:
+            self._set_error('no file is open')
+            return None
+
+        return self.pl2_file_info
+
+    def _get_channel_index(self, infos, zero_based_channel_index):
+        if self._file is None:
+            self._set_error('no file is open')
+            return None
+        if not 0 <= zero_based_channel_index < len(infos):
+            self._set_error('invalid channel index')
+            return None
+        return zero_based_channel_index
+
+    def _get_channel_index_by_name(self, channel_indices_by_name, channel_name):
+        index = channel_indices_by_name.get(_channel_name_key(channel_name))
+        if index is None:
+            self._set_error('unable to find channel with specified name')
+        return index
+
+    def _get_channel_index_by_source(self, channel_indices_by_source, source_id, one_based_channel_index_in_source):
+        index = channel_indices_by_source.get((source_id, one_based_channel_index_in_source))
+        if index is None:
+            self._set_error('unable to find channel with specified source id and channel index')
+        return index
+
+    def _copy_channel_info(self, infos, index):
+        if index is None:
+            return None
+        return type(infos[index]).from_buffer_copy(infos[index])
+
+    def pl2_get_analog_channel_info(self, zero_based_channel_index):
+        """
+        Retrieve information about an analog channel
+
+        Args:
+            zero_based_channel_index - zero-based analog channel index
+
+        Returns:
+            pl2_analog_channel_info - PL2AnalogChannelInfo class instance
+        """
+        infos = self._analog_channel_infos
+        return self._copy_channel_info(infos, self._get_channel_index(infos, zero_based_channel_index))
+
+    def pl2_get_analog_channel_info_by_name(self, channel_name):
+        """
+        Retrieve information about an analog channel
+
+        Args:
+            channel_name - analog channel name
+
+        Returns:
+            pl2_analog_channel_info - PL2AnalogChannelInfo class instance
+        """
+        infos = self._analog_channel_infos
+        return self._copy_channel_info(infos, self._get_channel_index_by_name(
+            self._analog_channel_indices_by_name, channel_name))
+
+    def pl2_get_analog_channel_info_by_source(self, source_id, one_based_channel_index_in_source):
+        """
+        Retrieve information about an analog channel
+
+        Args:
+            source_id - numeric source ID
+            one_based_channel_index_in_source - one-based channel index within the source
+
+        Returns:
+            pl2_analog_channel_info - PL2AnalogChannelInfo class instance
+        """
+        infos = self._analog_channel_infos
+        return self._copy_channel_info(infos, self._get_channel_index_by_source(
+            self._analog_channel_indices_by_source, source_id, one_based_channel_index_in_source))
+
+    def _read_analog_channel_blocks(self, index):
+        info = self._analog_channel_infos[index]
+
+        block_timestamps = []
+        block_counts = []
+        block_values = []
+        for header, data in self._iter_channel_blocks(self._analog_blocks[index].offsets, PDP_ANALOG_DATA,
+                                                      info.m_Source, info.m_Channel):
+            block_timestamps.append(header[5])
+            block_counts.append(header[4])
+            block_values.append(np.frombuffer(data, dtype='<i2', count=header[4]))
+
+        return (np.array(block_timestamps, dtype=np.int64),
+                np.array(block_counts, dtype=np.uint64),
+                block_values)
+
+    def _get_analog_fragments(self, index, block_timestamps, block_counts):
+        # like the .dll, fragment arrays have one (zero padded) entry per data block
+        n_blocks = len(block_timestamps)
+        fragments = merge_fragments(block_timestamps, block_counts,
+                                     self._ticks_per_sample(self._analog_channel_infos[index]))
+        fragment_timestamps = np.zeros(n_blocks, dtype=np.int64)
+        fragment_counts = np.zeros(n_blocks, dtype=np.uint64)
+        fragment_timestamps[:len(fragments[0])] = fragments[0]
+        fragment_counts[:len(fragments[1])] = fragments[1]
+        return fragment_timestamps, fragment_counts
+
+    def _read_analog_channel_data(self, index):
+        if index is None:
+            return None
+
+        info = self._analog_channel_infos[index]
+        try:
+            block_timestamps, block_counts, block_values = self._read_analog_channel_blocks(index)
+        except PL2FormatError as e:
+            self._set_error(str(e))
+            return None
+
+        fragment_timestamps, fragment_counts = self._get_analog_fragments(index, block_timestamps, block_counts)
+        values = _join_blocks(block_values, (info.m_NumberOfValues,), np.int16)
+
+        return fragment_timestamps, fragment_counts, values
+
+    def _read_analog_channel_data_into(self, zero_based_channel_index, values, address=None):
+        index = self._get_channel_index(self._analog_channel_infos, zero_based_channel_index)
+        if index is None:
+            return None
+
+        try:
+            block_timestamps, block_counts, block_values = self._read_analog_channel_blocks(index)
+        except PL2FormatError as e:
+            self._set_error(str(e))
+            return None
+
+        _join_blocks(block_values, values.shape, np.int16, out=values)
+
+        return self._get_analog_fragments(index, block_timestamps, block_counts)
+
+    def pl2_get_analog_channel_data(self, zero_based_channel_index):
+        """
+        Retrieve analog channel data
+
+        Args:
+            zero_based_channel_index - zero based channel index
+
+        Returns:
+            fragment_timestamps - array the size of PL2AnalogChannelInfo.m_MaximumNumberOfFragments
+            fragment_counts - array the size of PL2AnalogChannelInfo.m_MaximumNumberOfFragments
+            values - array the size of PL2AnalogChannelInfo.m_NumberOfValues
+        """
+        return self._read_analog_channel_data(
+            self._get_channel_index(self._analog_channel_infos, zero_based_channel_index))
+
+    def pl2_get_analog_channel_data_by_name(self, channel_name):
+        """
+        Retrieve analog channel data
+
+        Args:
+            channel_name - analog channel name
+
+        Returns:
+            fragment_timestamps - array the size of PL2AnalogChannelInfo.m_MaximumNumberOfFragments
+            fragment_counts - array the size of PL2AnalogChannelInfo.m_MaximumNumberOfFragments
+            values - array the size of PL2AnalogChannelInfo.m_NumberOfValues
+        """
+        return self._read_analog_channel_data(
+            self._get_channel_index_by_name(self._analog_channel_indices_by_name, channel_name))
+
+    def pl2_get_analog_channel_data_by_source(self, source_id, one_based_channel_index_in_source):
+        """
+        Retrieve analog channel data
+
+        Args:
+            source_id - numeric source ID
+            one_based_channel_index_in_source - one-based channel index within the source
+
+        Returns:
+            fragment_timestamps - array the size of PL2AnalogChannelInfo.m_MaximumNumberOfFragments
+            fragment_counts - array the size of PL2AnalogChannelInfo.m_MaximumNumberOfFragments
+            values - array the size of PL2AnalogChannelInfo.m_NumberOfValues
+        """
+        return self._read_analog_channel_data(self._get_channel_index_by_source(
+            self._analog_channel_indices_by_source, source_id, one_based_channel_index_in_source))
+
+    def _ticks_per_sample(self, info):
+        return self.pl2_file_info.m_TimestampFrequency / info.m_SamplesPerSecond
+
+    def _get_analog_block_headers(self, index):
+        """
+        Timestamps and counts of all data blocks of an analog channel, read
+        from the block headers only.
+        """
+        blocks = self._analog_blocks[index]
+        if blocks.timestamps is None:
+            timestamps = np.zeros(len(blocks.offsets), dtype=np.int64)
+            for i, offset in enumerate(blocks.offsets):
+                header = self._read_pdp_header(int(offset))
+                if header is None or header[0] != PDP_ANALOG_DATA:
+                    raise PL2FormatError(f'invalid data block at file offset {offset}')
+                timestamps[i] = header[5]
+            blocks.timestamps = timestamps
+
+        return blocks.timestamps, blocks.counts.astype(np.uint64)
+
+    def _get_analog_channel_fragments(self, zero_based_channel_index):
+        try:
+            block_timestamps, block_counts = self._get_analog_block_headers(zero_based_channel_index)
+        except PL2FormatError as e:
+            self._set_error(str(e))
+            return None
+
+        info = self._analog_channel_infos[zero_based_channel_index]
+        return merge_fragments(block_timestamps, block_counts, self._ticks_per_sample(info))
+
+    def pl2_get_analog_channel_data_subset(self, zero_based_channel_index, zero_based_start_value_index,
+                                           num_subset_values):
+        """
+        Retrieve a range of analog channel values. Only the data blocks
+        holding the requested values are read.
+
+        Args:
+            zero_based_channel_index - zero based channel index
+            zero_based_start_value_index - zero based index of the first value
+            num_subset_values - number of values to read. The range is clipped
+                at the end of the channel.
+
+        Returns:
+            fragment_timestamps - array with the timestamp of the first returned value of each fragment
+            fragment_counts - array with the number of returned values of each fragment
+            values - array of at most num_subset_values values
+        """
+        index = self._get_channel_index(self._analog_channel_infos, zero_based_channel_index)
+        if index is None:
+            return None
+        if zero_based_start_value_index < 0:
+            self._set_error('invalid start value index')
+            return None
+
+        info = self._analog_channel_infos[index]
+        blocks = self._analog_blocks[index]
+        start = min(zero_based_start_value_index, info.m_NumberOfValues)
+        stop = max(start, min(start + num_subset_values, info.m_NumberOfValues))
+
+        try:
+            block_timestamps, block_counts = self._get_analog_block_headers(index)
+            block_starts = np.concatenate(([0], np.cumsum(block_counts, dtype=np.int64)))
+            first = np.searchsorted(block_starts, start, side='right') - 1
+            last = np.searchsorted(block_starts, stop, side='left') if stop > start else first
+
+            block_values = []
+            for i, (header, data) in enumerate(self._iter_channel_blocks(
+                    blocks.offsets[first:last], PDP_ANALOG_DATA, info.m_Source, info.m_Channel), first):
+                block_start = block_starts[i]
+                block_values.append(np.frombuffer(data, dtype='<i2', count=header[4])[
+                                    max(start - block_start, 0):stop - block_start])
+        except PL2FormatError as e:
+            self._set_error(str(e))
+            return None
+
+        ticks_per_sample = self._ticks_per_sample(info)
+        fragment_timestamps, fragment_counts = _subset_fragments(
+            *merge_fragments(block_timestamps, block_counts, ticks_per_sample), start, stop, ticks_per_sample)
+
+        return fragment_timestamps, fragment_counts, _join_blocks(block_values, (stop - start,), np.int16)
+
+    def pl2_get_analog_channel_data_views(self, zero_based_channel_index):
+        """
+        Retrieve analog channel data block by block. With memory_map enabled
+        no values are copied, each block is a read-only view of the file.
+
+        Args:
+            zero_based_channel_index - zero based channel index
+
+        Returns:
+            block_timestamps - array with the timestamp of each data block
+            block_counts - array with the number of values in each data block
+            values - list with one array of values per data block
+        """
+        index = self._get_channel_index(self._analog_channel_infos, zero_based_channel_index)
+        if index is None:
+            return None
+
+        try:
+            return self._read_analog_channel_blocks(index)
+        except PL2FormatError as e:
+            self._set_error(str(e))
+            return None
+
+    def pl2_get_spike_channel_info(self, zero_based_channel_index):
+        """
+        Retrieve information about a spike channel
+
+        Args:
+            zero_based_channel_index - zero-based spike channel index
+
+        Returns:
+            pl2_spike_channel_info - PL2SpikeChannelInfo class instance
+        """
+        infos = self._spike_channel_infos
+        return self._copy_channel_info(infos, self._get_channel_index(infos, zero_based_channel_index))
+
+    def pl2_get_spike_channel_info_by_name(self, channel_name):
+        """
+        Retrieve information about a spike channel
+
+        Args:
+            channel_name - spike channel name
+
+        Returns:
+            pl2_spike_channel_info - PL2SpikeChannelInfo class instance
+        """
+        infos = self._spike_channel_infos
+        return self._copy_channel_info(infos, self._get_channel_index_by_name(
+            self._spike_channel_indices_by_name, channel_name))
+
+    def pl2_get_spike_channel_info_by_source(self, source_id, one_based_channel_index_in_source):
+        """
+        Retrieve information about a spike channel
+
+        Args:
+            source_id - numeric source ID
+            one_based_channel_index_in_source - one-based channel index within the source
+
+        Returns:
+            pl2_spike_channel_info - PL2SpikeChannelInfo class instance
+        """
+        infos = self._spike_channel_infos
+        return self._copy_channel_info(infos, self._get_channel_index_by_source(
+            self._spike_channel_indices_by_source, source_id, one_based_channel_index_in_source))
+
+    def _read_spike_channel_blocks(self, index, first_block=0, stop_block=None):
+        info = self._spike_channel_infos[index]
+        samples_per_spike = info.m_SamplesPerSpike
+
+        block_timestamps = []
+        block_units = []
+        block_values = []
+        for header, data in self._iter_channel_blocks(self._spike_blocks[index].offsets[first_block:stop_block],
+                                                      PDP_SPIKE_DATA, info.m_Source, info.m_Channel):
+            # spike blocks keep the number of waveforms in the low word
+            # of the last header field and the waveform length in the count
+            n = header[5] & 0xFFFF
+            block_timestamps.append(np.frombuffer(data, dtype='<u8', count=n))
+            block_units.append(np.frombuffer(data, dtype='<u2', count=n, offset=8 * n))
+            if samples_per_spike:
+                if header[4] != samples_per_spike:
+                    raise PL2FormatError('waveform length of data block does not match channel header')
+                block_values.append(np.frombuffer(data, dtype='<i2', count=n * samples_per_spike,
+                                                  offset=10 * n).reshape(n, samples_per_spike))
+            else:
+                block_values.append(np.zeros((n, 0), dtype=np.int16))
+
+        return block_timestamps, block_units, block_values
+
+    def _read_spike_channel_data(self, index):
+        if index is None:
+            return None
+
+        info = self._spike_channel_infos[index]
+        try:
+            block_timestamps, block_units, block_values = self._read_spike_channel_blocks(index)
+        except PL2FormatError as e:
+            self._set_error(str(e))
+            return None
+
+        n_spikes = info.m_NumberOfSpikes
+        return (_join_blocks(block_timestamps, (n_spikes,), np.uint64),
+                _join_blocks(block_units, (n_spikes,), np.uint16),
+                _join_blocks(block_values, (n_spikes, info.m_SamplesPerSpike), np.int16))
+
+    def _get_spike_channel_data_selection(self, zero_based_channel_index, units=None, waveforms=True):
+        """
+        pl2_get_spike_channel_data restricted to the spikes of the given units,
+        optionally without waveforms. The selection is applied per data block,
+        so only the waveforms of selected spikes are copied, and none without
+        waveforms.
+        """
+        index = self._get_channel_index(self._spike_channel_infos, zero_based_channel_index)
+        if index is None:
+            return None
+
+        try:
+            block_timestamps, block_units, block_values = self._read_spike_channel_blocks(index)
+        except PL2FormatError as e:
+            self._set_error(str(e))
+            return None
+
+        if units is not None:
+            selected = [np.isin(block, units) for block in block_units]
+            block_timestamps = [block[s] for block, s in zip(block_timestamps, selected)]
+            block_units = [block[s] for block, s in zip(block_units, selected)]
+            if waveforms:
+                block_values = [block[s] for block, s in zip(block_values, selected)]
+
+        info = self._spike_channel_infos[index]
+        n_spikes = info.m_NumberOfSpikes if units is None else sum(len(block) for block in block_timestamps)
+        values = None
+        if waveforms:
+            values = _join_blocks(block_values, (n_spikes, info.m_SamplesPerSpike), np.int16)
+        return (_join_blocks(block_timestamps, (n_spikes,), np.uint64),
+                _join_blocks(block_units, (n_spikes,), np.uint16),
+                values)
+
+    def _get_spike_channel_data_chunks(self, zero_based_channel_index, chunk_size):
+        """
+        pl2_get_spike_channel_data in consecutive chunks of at most chunk_size
+        spikes. Each chunk only reads the data blocks it overlaps.
+        """
+        index = self._get_channel_index(self._spike_channel_infos, zero_based_channel_index)
+        if index is None:
+            return None
+
+        return self._iter_spike_channel_data_chunks(index, chunk_size)
+
+    def _iter_spike_channel_data_chunks(self, index, chunk_size):
+        info = self._spike_channel_infos[index]
+        block_stops = np.cumsum(self._spike_blocks[index].counts, dtype=np.int64)
+        for start in range(0, info.m_NumberOfSpikes, chunk_size):
+            stop = min(start + chunk_size, info.m_NumberOfSpikes)
+            first_block = int(np.searchsorted(block_stops, start, side='right'))
+            stop_block = int(np.searchsorted(block_stops, stop, side='left')) + 1
+            try:
+                blocks = self._read_spike_channel_blocks(index, first_block, stop_block)
+            except PL2FormatError as e:
+                self._set_error(str(e))
+                raise IOError(f"Error: Can't read spike channel {info.m_Name.decode('ascii')}: {e}") from None
+
+            offset = start - (int(block_stops[first_block - 1]) if first_block else 0)
+            n = stop - start
+            yield tuple(_join_blocks(block, (offset + n,) + block[0].shape[1:], dtype)[offset:]
+                        for block, dtype in zip(blocks, (np.uint64, np.uint16, np.int16)))
+
+    def pl2_get_spike_channel_data(self, zero_based_channel_index):
+        """
+        Retrieve spike channel data
+
+        Args:
+            zero_based_channel_index - zero based channel index
+
+        Returns:
+            spike_timestamps - array the size of PL2SpikeChannelInfo.m_NumberOfSpikes
+            units - array the size of PL2SpikeChannelInfo.m_NumberOfSpikes
+            values - array the size of (PL2SpikeChannelInfo.m_NumberOfSpikes * PL2SpikeChannelInfo.m_SamplesPerSpike)
+        """
+        return self._read_spike_channel_data(
+            self._get_channel_index(self._spike_channel_infos, zero_based_channel_index))
+
+    def pl2_get_spike_channel_data_by_name(self, channel_name):
+        """
+        Retrieve spike channel data
+
+        Args:
+            channel_name = channel name
+
+        Returns:
+            spike_timestamps - array the size of PL2SpikeChannelInfo.m_NumberOfSpikes
+            units - array the size of PL2SpikeChannelInfo.m_NumberOfSpikes
+            values - array the size of (PL2SpikeChannelInfo.m_NumberOfSpikes * PL2SpikeChannelInfo.m_SamplesPerSpike)
+        """
+        return self._read_spike_channel_data(
+            self._get_channel_index_by_name(self._spike_channel_indices_by_name, channel_name))
+
+    def pl2_get_spike_channel_data_by_source(self, source_id, one_based_channel_index_in_source):
+        """
+        Retrieve spike channel data
+
+        Args:
+            source_id - numeric source ID
+            one_based_channel_index_in_source - one-based channel index within the source
+
+        Returns:
+            spike_timestamps - array the size of PL2SpikeChannelInfo.m_NumberOfSpikes
+            units - array the size of PL2SpikeChannelInfo.m_NumberOfSpikes
+            values - array the size of (PL2SpikeChannelInfo.m_NumberOfSpikes * PL2SpikeChannelInfo.m_SamplesPerSpike)
+        """
+        return self._read_spike_channel_data(self._get_channel_index_by_source(
+            self._spike_channel_indices_by_source, source_id, one_based_channel_index_in_source))
+
+    def pl2_get_spike_channel_data_views(self, zero_based_channel_index):
+        """
+        Retrieve spike channel data block by block. With memory_map enabled
+        nothing is copied, each block is a read-only view of the file.
+
+        Args:
+            zero_based_channel_index - zero based channel index
+
+        Returns:
+            spike_timestamps - list with one array of timestamps per data block
+            units - list with one array of units per data block
+            values - list with one (spikes, PL2SpikeChannelInfo.m_SamplesPerSpike)
+                array of waveforms per data block
+        """
+        index = self._get_channel_index(self._spike_channel_infos, zero_based_channel_index)
+        if index is None:
+            return None
+
+        try:
+            return self._read_spike_channel_blocks(index)
+        except PL2FormatError as e:
+            self._set_error(str(e))
+            return None
+
+    def pl2_get_digital_channel_info(self, zero_based_channel_index):
+        """
+        Retrieve information about a digital event channel
+
+        Args:
+            zero_based_channel_index - zero-based digital event channel index
+
+        Returns:
+            pl2_digital_channel_info - PL2DigitalChannelInfo class instance
+        """
+        infos = self._digital_channel_infos
+        return self._copy_channel_info(infos, self._get_channel_index(infos, zero_based_channel_index))
+
+    def pl2_get_digital_channel_info_by_name(self, channel_name):
+        """
+        Retrieve information about a digital event channel
+
+        Args:
+            channel_name - digital event channel name
+
+        Returns:
+            pl2_digital_channel_info - PL2DigitalChannelInfo class instance
+        """
+        infos = self._digital_channel_infos
+        return self._copy_channel_info(infos, self._get_channel_index_by_name(
+            self._digital_channel_indices_by_name, channel_name))
+
+    def pl2_get_digital_channel_info_by_source(self, source_id, one_based_channel_index_in_source):
+        """
+        Retrieve information about a digital event channel
+
+        Args:
+            source_id - numeric source ID
+            one_based_channel_index_in_source - one-based channel index within the source
+
+        Returns:
+            pl2_digital_channel_info - PL2DigitalChannelInfo class instance
+        """
+        infos = self._digital_channel_infos
+        return self._copy_channel_info(infos, self._get_channel_index_by_source(
+            self._digital_channel_indices_by_source, source_id, one_based_channel_index_in_source))
+
+    def _read_event_blocks(self, blocks, pdp_type, source=None, channel=None):
+        block_timestamps = []
+        block_values = []
+        for header, data in self._iter_channel_blocks(blocks.offsets, pdp_type, source, channel):
+            n = header[4]
+            block_timestamps.append(np.frombuffer(data, dtype='<i8', count=n))
+            block_values.append(np.frombuffer(data, dtype='<u2', count=n, offset=8 * n))
+
+        return block_timestamps, block_values
+
+    def _read_digital_channel_blocks(self, index):
+        info = self._digital_channel_infos[index]
+        return self._read_event_blocks(self._digital_blocks[index], PDP_DIGITAL_DATA,
+                                       info.m_Source, info.m_Channel)
+
+    def _read_digital_channel_data(self, index):
+        if index is None:
+            return None
+
+        info = self._digital_channel_infos[index]
+        try:
+            block_timestamps, block_values = self._read_digital_channel_blocks(index)
+        except PL2FormatError as e:
+            self._set_error(str(e))
+            return None
+
+        n_events = info.m_NumberOfEvents
+        return (_join_blocks(block_timestamps, (n_events,), np.int64),
+                _join_blocks(block_values, (n_events,), np.uint16))
+
+    def pl2_get_digital_channel_data(self, zero_based_channel_index):
+        """
+        Retrieve digital even channel data
+
+        Args:
+            zero_based_channel_index - zero-based digital event channel index
+
+        Returns:
+            event_timestamps - array the size of PL2DigitalChannelInfo.m_NumberOfEvents
+            event_values - array the size of PL2DigitalChannelInfo.m_NumberOfEvents
+        """
+        return self._read_digital_channel_data(
+            self._get_channel_index(self._digital_channel_infos, zero_based_channel_index))
+
+    def pl2_get_digital_channel_data_by_name(self, channel_name):
+        """
+        Retrieve digital even channel data
+
+        Args:
+            channel_name - digital event channel name
+
+        Returns:
+            event_timestamps - array the size of PL2DigitalChannelInfo.m_NumberOfEvents
+            event_values - array the size of PL2DigitalChannelInfo.m_NumberOfEvents
+        """
+        return self._read_digital_channel_data(
+            self._get_channel_index_by_name(self._digital_channel_indices_by_name, channel_name))
+
+    def pl2_get_digital_channel_data_by_source(self, source_id, one_based_channel_index_in_source):
+        """
+        Retrieve digital even channel data
+
+        Args:
+            source_id - numeric source ID
+            one_based_channel_index_in_source - one-based channel index within the source
+
+        Returns:
+            event_timestamps - array the size of PL2DigitalChannelInfo.m_NumberOfEvents
+            event_values - array the size of PL2DigitalChannelInfo.m_NumberOfEvents
+        """
+        return self._read_digital_channel_data(self._get_channel_index_by_source(
+            self._digital_channel_indices_by_source, source_id, one_based_channel_index_in_source))
+
+    def pl2_get_digital_channel_data_views(self, zero_based_channel_index):
+        """
+        Retrieve digital event channel data block by block. With memory_map
+        enabled nothing is copied, each block is a read-only view of the file.
+
+        Args:
+            zero_based_channel_index - zero-based digital event channel index
+
+        Returns:
+            event_timestamps - list with one array of timestamps per data block
+            event_values - list with one array of values per data block
+        """
+        index = self._get_channel_index(self._digital_channel_infos, zero_based_channel_index)
+        if index is None:
+            return None
+
+        try:
+            return self._read_digital_channel_blocks(index)
+        except PL2FormatError as e:
+            self._set_error(str(e))
+            return None
+
+    def pl2_get_start_stop_channel_info(self, number_of_start_stop_events):
+        """
+        Retrieve information about start/stop channel
+
+        Args:
+            number_of_start_stop_events - ctypes.c_ulonglong class instance
+
+        Returns:
+            1 - Success
+            0 - Failure
+            The class instances passed to the function are filled with values
+        """
+        if self._file is None:
+            self._set_error('no file is open')
+            return 0
+
+        number_of_start_stop_events.value = self._start_stop_blocks.total
+        return 1
+
+    def pl2_get_start_stop_channel_data(self, num_events_returned, event_timestamps, event_values):
+        """
+        Retrieve start/stop channel data
+
+        Args:
+            num_events_returned - ctypes.c_ulonglong class instance
+            event_timestamps - ctypes.c_longlong class instance
+            event_values - point to ctypes.c_ushort class instance
+
+        Returns:
+            1 - Success
+            0 - Failure
+            The class instances passed to the function are filled with values
+        """
+        if self._file is None:
+            self._set_error('no file is open')
+            return 0
+
+        try:
+            block_timestamps, block_values = self._read_event_blocks(self._start_stop_blocks,
+                                                                     PDP_START_STOP_DATA)
+        except PL2FormatError as e:
+            self._set_error(str(e))
+            return 0
+
+        n_events = self._start_stop_blocks.total
+        timestamps = _join_blocks(block_timestamps, (n_events,), np.int64)
+        values = _join_blocks(block_values, (n_events,), np.uint16)
+
+        n = min(len(timestamps), len(event_timestamps))
+        to_array(event_timestamps)[:n] = timestamps[:n]
+        to_array(event_values)[:n] = values[:n]
+        num_events_returned.value = n
+        return 1
+
+    def pl2_get_start_stop_channel_events(self):
+        """
+        Retrieve the events of the start/stop channel
+
+        Returns:
+            event_timestamps - int64 array of the event timestamps in ticks
+            event_values - uint16 array of the event types, PL2_START, PL2_STOP,
+                           PL2_PAUSE or PL2_RESUME
+            None on failure
+        """
+        if self._file is None:
+            self._set_error('no file is open')
+            return None
+
+        try:
+            block_timestamps, block_values = self._read_event_blocks(self._start_stop_blocks,
+                                                                     PDP_START_STOP_DATA)
+        except PL2FormatError as e:
+            self._set_error(str(e))
+            return None
+
+        n_events = self._start_stop_blocks.total
+        return (_join_blocks(block_timestamps, (n_events,), np.int64),
+                _join_blocks(block_values, (n_events,), np.uint16))
+
+    def _read_data_block(self, offset):
+        self._data_block = None
+        if self._file is None:
+            self._set_error('no file is open')
+            return 0
+
+        self._seek(offset)
+        try:
+            while True:
+                header, data = self._read_pdp()
+                if header is None:
+                    return 0
+                if header[0] in _DATA_BLOCK_BLOCK_TYPES:
+                    break
+        except PL2FormatError as e:
+            self._set_error(str(e))
+            return 0
+
+        self._data_block = (header, data)
+        self._next_data_block = self._tell()
+        return 1
+
+    def _get_data_block(self, pdp_type):
+        if self._data_block is None or self._data_block[0][0] != pdp_type:
+            self._set_error('current data block is not of the requested type')
+            return None, None
+        return self._data_block
+
+    def pl2_read_first_data_block(self):
+        """
+        Moves to the first data block of the file.
+
+        Returns:
+            1 - Success
+            0 - Failure or no data blocks in the file
+        """
+        return self._read_data_block(self._first_data_block)
+
+    def pl2_read_next_data_block(self):
+        """
+        Moves to the next data block of the file.
+
+        Returns:
+            1 - Success
+            0 - Failure or end of file reached
+        """
+        if self._data_block is None:
+            return 0
+        return self._read_data_block(self._next_data_block)
+
+    def pl2_get_data_block_info(self):
+        """
+        Retrieve type, source, channel and number of items of the current data block
+
+        Returns:
+            pl2_block_info - PL2BlockInfo class instance
+        """
+        if self._data_block is None:
+            return None
+
+        header = self._data_block[0]
+        block_type = _DATA_BLOCK_BLOCK_TYPES[header[0]]
+        if block_type is None:
+            return None
+
+        pl2_block_info = PL2BlockInfo()
+        pl2_block_info.m_Type = block_type
+        if block_type == PL2_BLOCK_TYPE_SPIKE:
+            pl2_block_info.m_NumberOfItems = header[5] & 0xFFFF
+        else:
+            pl2_block_info.m_NumberOfItems = header[4]
+        if block_type != PL2_BLOCK_TYPE_STARTSTOP_EVENT:
+            pl2_block_info.m_Source = header[1]
+            pl2_block_info.m_Channel = header[3]
+
+        return pl2_block_info
+
+    def pl2_get_spike_data_block_timestamps(self):
+        """
+        Retrieve timestamps of the current spike data block
+
+        Returns:
+            spike_timestamps - array the size of PL2BlockInfo.m_NumberOfItems
+        """
+        header, data = self._get_data_block(PDP_SPIKE_DATA)
+        if header is None:
+            return None
+        return np.frombuffer(data, dtype='<u8', count=header[5] & 0xFFFF)
+
+    def pl2_get_spike_data_block_units(self):
+        """
+        Retrieve unit assignments of the current spike data block
+
+        Returns:
+            units - array the size of PL2BlockInfo.m_NumberOfItems
+        """
+        header, data = self._get_data_block(PDP_SPIKE_DATA)
+        if header is None:
+            return None
+        n = header[5] & 0xFFFF
+        return np.frombuffer(data, dtype='<u2', count=n, offset=8 * n)
+
+    def pl2_get_spike_data_block_waveforms(self):
+        """
+        Retrieve waveforms of the current spike data block
+
+        Returns:
+            values - array of shape (PL2BlockInfo.m_NumberOfItems, samples per spike)
+        """
+        header, data = self._get_data_block(PDP_SPIKE_DATA)
+        if header is None:
+            return None
+        n = header[5] & 0xFFFF
+        samples_per_spike = header[4]
+        return np.frombuffer(data, dtype='<i2', count=n * samples_per_spike,
+                             offset=10 * n).reshape(n, samples_per_spike)
+
+    def pl2_get_analog_data_block_timestamp(self):
+        """
+        Retrieve timestamp of the first value of the current analog data block
+
+        Returns:
+            timestamp - int
+        """
+        header, data = self._get_data_block(PDP_ANALOG_DATA)
+        if header is None:
+            return 0
+        return header[5]
+
+    def pl2_get_analog_data_block_values(self):
+        """
+        Retrieve values of the current analog data block
+
+        Returns:
+            values - array the size of PL2BlockInfo.m_NumberOfItems
+        """
+        header, data = self._get_data_block(PDP_ANALOG_DATA)
+        if header is None:
+            return None
+        return np.frombuffer(data, dtype='<i2', count=header[4])
+
+    def _get_event_data_block(self, pdp_type, values):
+        header, data = self._get_data_block(pdp_type)
+        if header is None:
+            return None
+        n = header[4]
+        if values:
+            return np.frombuffer(data, dtype='<u2', count=n, offset=8 * n)
+        return np.frombuffer(data, dtype='<i8', count=n)
+
+    def pl2_get_digital_data_block_timestamps(self):
+        """
+        Retrieve timestamps of the current digital event data block
+
+        Returns:
+            event_timestamps - array the size of PL2BlockInfo.m_NumberOfItems
+        """
+        return self._get_event_data_block(PDP_DIGITAL_DATA, values=False)
+
+    def pl2_get_digital_data_block_values(self):
+        """
+        Retrieve values of the current digital event data block
+
+        Returns:
+            event_values - array the size of PL2BlockInfo.m_NumberOfItems
+        """
+        return self._get_event_data_block(PDP_DIGITAL_DATA, values=True)
+
+    def pl2_get_start_stop_data_block_timestamps(self):
+        """
+        Retrieve timestamps of the current start/stop data block
+
+        Returns:
+            event_timestamps - array the size of PL2BlockInfo.m_NumberOfItems
+        """
+        return self._get_event_data_block(PDP_START_STOP_DATA, values=False)
+
+    def pl2_get_start_stop_data_block_values(self):
+        """
+        Retrieve values of the current start/stop data block
+
+        Returns:
+            event_values - array the size of PL2BlockInfo.m_NumberOfItems
+        """
+        return self._get_event_data_block(PDP_START_STOP_DATA, values=True)
+
+
+def _struct_from_bytes(struct_type, data):
+    """
+    Creates a ctypes structure from the leading bytes of a PDP's data. The
+    channel header PDPs share their layout with the PL2*Info structures.
+    """
+    size = _ctypes.sizeof(struct_type)
+    return struct_type.from_buffer_copy(bytes(data[:size]).ljust(size, b'\0'))
+
+
+def _join_blocks(blocks, shape, dtype, out=None):
+    """
+    Joins per data block arrays into a single array of the given shape. A
+    single block that already has the requested shape is returned as is,
+    so channels stored in one block are not copied. With out, the blocks
+    are copied into that array instead.
+    """
+    if out is None and len(blocks) == 1 and blocks[0].shape == shape:
+        return blocks[0]
+
+    joined = np.zeros(shape, dtype=dtype) if out is None else out
+    position = 0
+    for block in blocks:
+        n = min(len(block), shape[0] - position)
+        joined[position:position + n] = block[:n]
+        position += n
+    joined[position:] = 0
+
+    return joined
+
+
+def _subset_fragments(fragment_timestamps, fragment_counts, start, stop, ticks_per_sample):
+    """
+    Restricts fragments to the values start to stop (exclusive).
+    """
+    fragment_ends = np.cumsum(fragment_counts, dtype=np.int64)
+    fragment_starts = fragment_ends - fragment_counts.astype(np.int64)
+    overlap = (fragment_ends > start) & (fragment_starts < stop)
+
+    first_values = np.maximum(fragment_starts[overlap], start)
+    offsets = np.floor((first_values - fragment_starts[overlap]) * ticks_per_sample + 0.5).astype(np.int64)
+
+    return (fragment_timestamps[overlap] + offsets,
+            (np.minimum(fragment_ends[overlap], stop) - first_values).astype(np.uint64))
@@ -0,0 +1,110 @@
+# pypl2parallel.py - Reads the channels of one or many .pl2 files in
+# parallel.
+#
+# A PyPL2FileReader (and the zugbruecke/wine session behind it on
+# non-windows systems) can not be shared between workers, so every task
+# opens its own PL2File and reads a chunk of the channels of one file.
+# Process pools use the 'spawn' start method: each worker process imports
+# pypl2lib itself and so starts its own zugbruecke session instead of
+# inheriting the parent's through fork.
+
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import multiprocessing
+import os
+import pathlib
+
+from pypl2api import PL2File
+
+_KINDS = ('ad', 'spikes', 'events')
+
+
+def _read_channels(filename, kind, channels, backend):
+    with PL2File(filename, backend=backend) as f:
+        read = getattr(f, kind)
+        return [read(channel) for channel in channels]
+
+
+def _split(channels, n_chunks):
+    """
+    Splits channels into at most n_chunks consecutive, evenly sized chunks.
+    """
+    n_chunks = max(1, min(n_chunks, len(channels)))
+    size, remainder = divmod(len(channels), n_chunks)
+    chunks = []
+    start = 0
+    for i in range(n_chunks):
+        stop = start + size + (i < remainder)
+        chunks.append(channels[start:stop])
+        start = stop
+    return chunks
+
+
+def pl2_read_parallel(filenames, channels, kind='ad', max_workers=None, pool='process', backend='dll'):
+    """
+    Reads channels of one or many files in parallel. The channels of every
+    file are split into chunks that are read by a pool of workers, each
+    chunk with its own PL2File.
+
+    Usage:
+        >>>ads = pl2_read_parallel('data/file.pl2', range(128))
+        >>>spikes = pl2_read_parallel(['data/a.pl2', 'data/b.pl2'], ['SPK01', 'SPK02'],
+        >>>                           kind='spikes', max_workers=4)
+
+    Args:
+        filenames - full path of a file, or a sequence of paths
+        channels - sequence of zero-based channel indices and/or channel names,
+                   read from every file
+        kind - 'ad' (default), 'spikes' or 'events', selects pl2_ad, pl2_spikes
+               or pl2_events results
+        max_workers - number of workers, defaults to the number of CPUs
+        pool - 'process' (default) or 'thread'. With the .dll backend on
+               non-windows systems, only process pools run reads in parallel,
+               as threads share one zugbruecke session.
+        backend - 'dll' (default) reads the files through PL2FileReader.dll, 'native'
+                  parses them directly with NumPy
+
+    Returns:
+        For a single file, a list with one result named tuple per channel, in
+        the order of channels. For a sequence of files, one such list per file,
+        in the order of filenames.
+    """
+
+    if kind not in _KINDS:
+        raise ValueError(f"Unknown kind '{kind}', expected one of {', '.join(_KINDS)}")
+    if pool == 'process':
+        executor_type = ProcessPoolExecutor
+        executor_options = {'mp_context': multiprocessing.get_context('spawn')}
+    elif pool == 'thread':
+        executor_type = ThreadPoolExecutor
+        executor_options = {}
+    else:
+        raise ValueError(f"Unknown pool '{pool}', expected 'process' or 'thread'")
+
+    single_file = isinstance(filenames, (str, pathlib.Path))
+    if single_file:
+        filenames = [filenames]
+    filenames = list(filenames)
+    channels = list(channels)
+
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+
+    # enough chunks per file to keep all workers busy
+    n_chunks = -(-max_workers // len(filenames)) if filenames else 1
+    tasks = [(i, filename, chunk) for i, filename in enumerate(filenames)
+             for chunk in _split(channels, n_chunks)]
+
+    with executor_type(max_workers=max_workers, **executor_options) as executor:
+        # map returns the results in the order of the tasks
+        chunk_results = executor.map(_read_channels,
+                                     [filename for _, filename, _ in tasks],
+                                     [kind] * len(tasks),
+                                     [chunk for _, _, chunk in tasks],
+                                     [backend] * len(tasks))
+        results = [[] for _ in filenames]
+        for (i, _, _), chunk_result in zip(tasks, chunk_results):
+            results[i].extend(chunk_result)
+
+    if single_file:
+        return results[0]
+    return results
@@ -0,0 +1,152 @@
+# pypl2psth.py - Peri-event time histograms and rasters of spike times
+# aligned to event times.
+#
+# Spikes are aligned to all events at once with np.searchsorted on the
+# sorted spike times, instead of a loop over events: the bin edges of every
+# trial are looked up in one call, and the spikes in the window of every
+# trial are gathered with one fancy index. Times are in seconds, like
+# pl2_spikes and pl2_events return them.
+
+from collections import namedtuple
+
+import numpy as np
+
+# Named tuples returned by the functions below
+PSTH = namedtuple('PSTH', 'counts bin_edges')
+Raster = namedtuple('Raster', 'offsets trials counts')
+
+
+def _as_arrays(timestamps):
+    """
+    Returns a list of 1-D arrays and whether a single array was given.
+    """
+    if isinstance(timestamps, np.ndarray) and timestamps.ndim == 1 or len(timestamps) == 0 or \
+            np.ndim(timestamps[0]) == 0:
+        return [np.asarray(timestamps, dtype=np.float64)], True
+    return [np.asarray(t, dtype=np.float64).ravel() for t in timestamps], False
+
+
+def _sorted(spike_timestamps):
+    if len(spike_timestamps) > 1 and np.any(spike_timestamps[1:] < spike_timestamps[:-1]):
+        return np.sort(spike_timestamps)
+    return spike_timestamps
+
+
+def _bin_edges(window, bin_width):
+    start, stop = window
+    if stop <= start:
+        raise ValueError('window must be a (start, stop) tuple with start < stop')
+    if bin_width <= 0:
+        raise ValueError('bin_width must be positive')
+    n_bins = max(1, int(round((stop - start) / bin_width)))
+    return start + np.arange(n_bins + 1) * bin_width
+
+
+def _split_trials(values, event_arrays, single_events):
+    """
+    Splits arrays along the trial axis (axis -2) into one array per event type.
+    """
+    if single_events:
+        return values
+    boundaries = np.cumsum([len(events) for events in event_arrays])[:-1]
+    return np.split(values, boundaries, axis=-2)
+
+
+def psth(spike_timestamps, event_timestamps, window, bin_width):
+    """
+    Counts the spikes in bins around every event.
+
+    Usage:
+        >>>spikes = pl2_spikes('data/file.pl2', 'SPK01')
+        >>>events = pl2_events('data/file.pl2', 'Strobed')
+        >>>res = psth(spikes.timestamps, events.timestamps, (-0.5, 1.0), 0.01)
+        >>>rate = res.counts.mean(axis=0) / 0.01
+
+    Several units and several event types are counted in one call:
+        >>>units = [spikes.timestamps[spikes.units == u] for u in (1, 2)]
+        >>>res = psth(units, [events.timestamps[events.values == v] for v in (1, 2, 3)],
+        >>>           (-0.5, 1.0), 0.01)
+        >>>res.counts[2][1]   # counts of event type 3 (trials, bins) of unit 2
+
+    Args:
+        spike_timestamps - spike times in seconds, or a sequence of spike time
+                           arrays, e.g. one per unit
+        event_timestamps - event times in seconds, or a sequence of event time
+                           arrays, e.g. one per event type
+        window - (start, stop) tuple, times in seconds relative to the events
+        bin_width - bin width in seconds. The window is divided into
+                    round((stop - start) / bin_width) bins.
+
+    Returns:
+        PSTH named tuple
+            counts - int64 array of spike counts with shape (events, bins).
+                     For a sequence of spike arrays, a (units, events, bins)
+                     array. For a sequence of event arrays, a list with one
+                     such array per event type.
+            bin_edges - bin edges in seconds relative to the events, one more
+                        than the number of bins. Bins include their left edge.
+    """
+
+    spike_arrays, single_spikes = _as_arrays(spike_timestamps)
+    event_arrays, single_events = _as_arrays(event_timestamps)
+    bin_edges = _bin_edges(window, bin_width)
+
+    # bin edges of all trials of all event types, (events, bins + 1)
+    edges = np.concatenate(event_arrays)[:, np.newaxis] + bin_edges
+    counts = np.empty((len(spike_arrays), edges.shape[0], len(bin_edges) - 1), dtype=np.int64)
+    for i, spikes in enumerate(spike_arrays):
+        counts[i] = np.diff(np.searchsorted(_sorted(spikes), edges), axis=1)
+
+    if single_spikes:
+        counts = counts[0]
+    return PSTH(_split_trials(counts, event_arrays, single_events), bin_edges)
+
+
+def raster(spike_timestamps, event_timestamps, window):
+    """
+    Returns the spike times around every event, relative to the event.
+
+    Usage:
+        >>>res = raster(spikes.timestamps, events.timestamps, (-0.5, 1.0))
+        >>>plt.plot(res.offsets, res.trials, '|')
+
+    Args:
+        spike_timestamps - spike times in seconds, or a sequence of spike time
+                           arrays, e.g. one per unit
+        event_timestamps - event times in seconds, or a sequence of event time
+                           arrays, e.g. one per event type
+        window - (start, stop) tuple, times in seconds relative to the events.
+                 Spikes at start are included, spikes at stop are not.
+
+    Returns:
+        Raster named tuple
+            offsets - spike times relative to their event, ordered by trial
+                      and then by time
+            trials - zero-based trial (event) index of every offset
+            counts - number of spikes in each trial, offsets of trial i are
+                     offsets[counts[:i].sum():counts[:i + 1].sum()]
+        For a sequence of spike arrays, a list with one Raster per unit. For a
+        sequence of event arrays, each Raster is replaced by a list with one
+        Raster per event type, with trials counted within the event type.
+    """
+
+    spike_arrays, single_spikes = _as_arrays(spike_timestamps)
+    event_arrays, single_events = _as_arrays(event_timestamps)
+    start, stop = window
+    if stop <= start:
+        raise ValueError('window must be a (start, stop) tuple with start < stop')
+
+    results = []
+    for spikes in spike_arrays:
+        spikes = _sorted(spikes)
+        unit_results = []
+        for events in event_arrays:
+            first = np.searchsorted(spikes, events + start)
+            counts = np.searchsorted(spikes, events + stop) - first
+            trials = np.repeat(np.arange(len(events)), counts)
+            # index of every spike in the window of every trial
+            indices = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts - first, counts)
+            unit_results.append(Raster(spikes[indices] - events[trials], trials, counts))
+        results.append(unit_results[0] if single_events else unit_results)
+
+    return results[0] if single_spikes else results
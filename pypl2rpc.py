@@ -0,0 +1,198 @@
+# pypl2rpc.py - Runs batches of PL2FileReader.dll calls in a helper process
+# in wine, one round trip per batch.
+#
+# Through zugbruecke every .dll call is a round trip to its wine process,
+# e.g. one per channel info when a file is opened. The helper started here
+# is a Windows Python run by wenv, which zugbruecke is built on. It loads
+# PL2FileReader.dll with plain ctypes, receives a list of calls in one
+# message, makes them and sends all results back in one message.
+#
+# The helper only uses the standard library, so nothing but wenv's Python
+# is needed in wine. Calls are (function name, arguments) tuples, with every
+# argument described by a tuple:
+#   ('int', value) - passed by value
+#   ('bytes', value) - null-terminated string
+#   ('ref_int', value), ('ref_ulonglong', value) - passed by reference, the
+#       value after the call is an output
+#   ('buffer', nbytes) - output buffer of nbytes bytes
+# The result of a call is (return value, outputs, error), with the outputs
+# in argument order as ints or bytearrays, and the text of PL2_GetLastError
+# as error if the call returned 0.
+
+import atexit
+import ctypes
+import multiprocessing.connection
+import os
+import pathlib
+import subprocess
+import sys
+import threading
+import time
+
+# command running a Python in wine
+RPC_COMMAND = ('wenv', 'python')
+# seconds to wait for a new helper to connect, starting wine may take a while
+RPC_START_TIMEOUT = 60.0
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def _call(dll, function_name, args):
+    values = []
+    outputs = []
+    for arg in args:
+        kind = arg[0]
+        if kind == 'int':
+            values.append(ctypes.c_int(arg[1]))
+        elif kind == 'bytes':
+            values.append(ctypes.c_char_p(arg[1]))
+        elif kind == 'ref_int':
+            outputs.append(ctypes.c_int(arg[1]))
+            values.append(ctypes.byref(outputs[-1]))
+        elif kind == 'ref_ulonglong':
+            outputs.append(ctypes.c_ulonglong(arg[1]))
+            values.append(ctypes.byref(outputs[-1]))
+        elif kind == 'buffer':
+            outputs.append(ctypes.create_string_buffer(arg[1]))
+            values.append(outputs[-1])
+        else:
+            raise ValueError(f"Unknown argument kind '{kind}'")
+
+    result = getattr(dll, function_name)(*values)
+
+    error = None
+    if not result:
+        message = ctypes.create_string_buffer(256)
+        dll.PL2_GetLastError(message, ctypes.c_int(256))
+        error = str(message.value)
+    # bytearrays unpickle as writable buffers, so the caller's arrays can use them directly
+    return result, [bytearray(o) if isinstance(o, ctypes.Array) else o.value for o in outputs], error
+
+
+def _serve(address, authkey, dll_path):
+    """
+    Main loop of the helper process.
+    """
+    dll = ctypes.CDLL(dll_path)
+    with multiprocessing.connection.Client(address, authkey=authkey) as connection:
+        while True:
+            try:
+                calls = connection.recv()
+            except EOFError:
+                break
+            if calls is None:
+                break
+            try:
+                results = [_call(dll, function_name, args) for function_name, args in calls]
+            except Exception as e:
+                connection.send(('error', f'{type(e).__name__}: {e}'))
+            else:
+                connection.send(('ok', results))
+
+
+def _wine_path(path):
+    # wine maps the unix root directory to drive Z:
+    return 'Z:' + str(path).replace('/', '\\')
+
+
+class RPCSession:
+    def __init__(self, dll_path, command=None):
+        """
+        Starts a helper process in wine that loads the .dll at dll_path and
+        runs batches of its functions, see run().
+
+        Args:
+            dll_path - path of PL2FileReader.dll
+            command - command running a Windows Python, defaults to RPC_COMMAND
+        """
+
+        self._lock = threading.Lock()
+        self._command = tuple(command or RPC_COMMAND)
+        authkey = os.urandom(16)
+        with multiprocessing.connection.Listener(('127.0.0.1', 0), authkey=authkey) as listener:
+            host, port = listener.address
+            self._process = subprocess.Popen([*self._command, str(pathlib.Path(__file__).absolute()), host, str(port),
+                                              authkey.hex(), _wine_path(dll_path)])
+            self._connection = self._accept(listener)
+
+    def _accept(self, listener):
+        """
+        Waits for the helper to connect, or fails if it exits first or does
+        not connect within RPC_START_TIMEOUT seconds.
+        """
+        connections = []
+        thread = threading.Thread(target=lambda: connections.append(listener.accept()), daemon=True)
+        thread.start()
+        deadline = time.monotonic() + RPC_START_TIMEOUT
+        while thread.is_alive() and self._process.poll() is None and time.monotonic() < deadline:
+            thread.join(0.1)
+        if not connections:
+            self._process.kill()
+            raise IOError(f'Error: The PL2FileReader.dll helper process in wine did not start '
+                          f'(command {" ".join(self._command)})')
+        return connections[0]
+
+    def run(self, calls):
+        """
+        Runs a batch of .dll calls in one round trip.
+
+        Args:
+            calls - sequence of (function name, arguments) tuples, see the
+                    description at the top of pypl2rpc.py
+
+        Returns:
+            list of (return value, outputs, error) tuples, one per call
+        """
+        with self._lock:
+            try:
+                self._connection.send(list(calls))
+                status, results = self._connection.recv()
+            except (EOFError, OSError):
+                raise IOError('Error: The PL2FileReader.dll helper process ended')
+        if status != 'ok':
+            raise IOError(f'Error: PL2FileReader.dll helper process failed: {results}')
+        return results
+
+    def close(self):
+        """
+        Stops the helper process.
+        """
+        with self._lock:
+            if self._process.poll() is None:
+                try:
+                    self._connection.send(None)
+                except OSError:
+                    self._process.kill()
+                self._process.wait()
+            self._connection.close()
+
+
+def get_rpc_session(dll_path):
+    """
+    Returns the helper process of the .dll at dll_path, started on first use
+    and then shared by the whole process. A new one is started if it ended.
+    """
+    key = str(dll_path)
+    with _sessions_lock:
+        if key not in _sessions or _sessions[key]._process.poll() is not None:
+            _sessions[key] = RPCSession(dll_path)
+        return _sessions[key]
+
+
+def close_rpc_sessions():
+    """
+    Stops all helper processes. Registered to run at interpreter exit.
+    """
+    with _sessions_lock:
+        sessions = list(_sessions.values())
+        _sessions.clear()
+    for session in sessions:
+        session.close()
+
+
+atexit.register(close_rpc_sessions)
+
+
+if __name__ == '__main__':
+    _serve((sys.argv[1], int(sys.argv[2])), bytes.fromhex(sys.argv[3]), sys.argv[4])
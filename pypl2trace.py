@@ -0,0 +1,342 @@
+# pypl2trace.py - Opt-in timing of the PL2FileReader.dll calls and of the
+# steps of the PL2File reads.
+#
+# While tracing is enabled, every .dll function call made by a
+# PyPL2FileReader and every traced step of pypl2api is recorded with its
+# name, channel, number of bytes transferred, wall clock time and CPU time
+# of the calling thread. Records are added up per name in a process wide
+# registry (trace_stats()), collected by active profile() blocks, and
+# written to a JSON lines trace file if one was given. load_trace() adds up
+# trace files again, e.g. those written by all workers of a cluster job.
+#
+# The bytes of a .dll call are the sizes of the arrays and structures passed
+# to it, which zugbruecke copies to and from the wine process. Under
+# zugbruecke the CPU time of a .dll call is mostly spent serializing these
+# buffers, the rest of its wall clock time is spent in the wine process.
+#
+# Tracing is off by default and then costs a flag check per call. Setting
+# the PYPL2_TRACE environment variable to a trace file name enables tracing
+# on import, also in worker processes.
+
+from collections import namedtuple
+import contextlib
+import ctypes as _ctypes
+import json
+import os
+import re
+import socket
+import threading
+import time
+
+# One traced call or step
+TraceRecord = namedtuple('TraceRecord', 'kind name channel nbytes wall_s cpu_s')
+# Records of one name added up
+TraceStats = namedtuple('TraceStats', 'kind calls nbytes wall_s cpu_s')
+
+# .dll functions whose second argument is the channel index or name
+_CHANNEL_FUNCTION = re.compile(r'PL2_Get(Analog|Spike|Digital)Channel')
+
+_lock = threading.Lock()
+_enabled = False
+_explicitly_enabled = False
+_trace_file = None
+_stats = {}
+_profiles = []
+
+
+def _update_enabled():
+    global _enabled
+    _enabled = _explicitly_enabled or bool(_profiles)
+
+
+def enable_tracing(trace_file=None):
+    """
+    Enables tracing in this process.
+
+    Args:
+        trace_file - optional path of a JSON lines file the records are appended
+                     to. {pid} and {host} in the path are replaced with the
+                     process id and host name, so that the processes of a
+                     cluster job can write files of their own.
+    """
+    global _explicitly_enabled, _trace_file
+    with _lock:
+        if _trace_file is not None:
+            _trace_file.close()
+            _trace_file = None
+        if trace_file is not None:
+            path = os.fspath(trace_file).format(pid=os.getpid(), host=socket.gethostname())
+            _trace_file = open(path, 'a', buffering=1)
+        _explicitly_enabled = True
+        _update_enabled()
+
+
+def disable_tracing():
+    """
+    Disables tracing enabled with enable_tracing() and closes the trace file.
+    Active profile() blocks keep recording.
+    """
+    global _explicitly_enabled, _trace_file
+    with _lock:
+        if _trace_file is not None:
+            _trace_file.close()
+            _trace_file = None
+        _explicitly_enabled = False
+        _update_enabled()
+
+
+def tracing_enabled():
+    return _enabled
+
+
+def _add(stats, record):
+    entry = stats.get(record.name)
+    if entry is None:
+        stats[record.name] = TraceStats(record.kind, 1, record.nbytes, record.wall_s, record.cpu_s)
+    else:
+        stats[record.name] = TraceStats(record.kind, entry.calls + 1, entry.nbytes + record.nbytes,
+                                        entry.wall_s + record.wall_s, entry.cpu_s + record.cpu_s)
+
+
+def record(kind, name, channel=None, nbytes=0, wall_s=0.0, cpu_s=0.0):
+    """
+    Records a traced call. Does nothing while tracing is disabled.
+
+    Args:
+        kind - 'dll' for .dll calls, 'api' for steps of pypl2api, 'rpc' for
+               batches run by the helper process of pypl2rpc.py
+        name - name of the .dll function or step
+        channel - channel index, name or (source, channel), if any
+        nbytes - number of bytes transferred or produced
+        wall_s - wall clock time in seconds
+        cpu_s - CPU time of the calling thread in seconds
+    """
+    if not _enabled:
+        return
+    trace_record = TraceRecord(kind, name, channel, nbytes, wall_s, cpu_s)
+    with _lock:
+        _add(_stats, trace_record)
+        for profiler in _profiles:
+            profiler.records.append(trace_record)
+        if _trace_file is not None:
+            _trace_file.write(json.dumps({'time': time.time(), 'host': socket.gethostname(), 'pid': os.getpid(),
+                                          'thread': threading.get_ident(), **trace_record._asdict()}) + '\n')
+
+
+def trace_stats():
+    """
+    Returns the records of this process added up per name, as a dict
+    mapping names to TraceStats named tuples (kind calls nbytes wall_s cpu_s).
+    """
+    with _lock:
+        return dict(_stats)
+
+
+def reset_trace_stats():
+    """
+    Clears the records added up by trace_stats().
+    """
+    with _lock:
+        _stats.clear()
+
+
+def format_stats(stats):
+    """
+    Formats a dict of TraceStats as a table, slowest first.
+    """
+    lines = [f'{"name":<40} {"kind":>4} {"calls":>8} {"MB":>10} {"wall s":>10} {"cpu s":>10}']
+    for name, s in sorted(stats.items(), key=lambda item: -item[1].wall_s):
+        lines.append(f'{name:<40} {s.kind:>4} {s.calls:>8} {s.nbytes / 1e6:>10.2f} {s.wall_s:>10.4f} {s.cpu_s:>10.4f}')
+    return '\n'.join(lines)
+
+
+def load_trace(paths):
+    """
+    Adds up the records of JSON lines trace files per name.
+
+    Usage:
+        >>>stats = load_trace(glob.glob('traces/*.jsonl'))
+        >>>print(format_stats(stats))
+
+    Args:
+        paths - trace file or sequence of trace files
+
+    Returns:
+        dict mapping names to TraceStats named tuples
+    """
+    if isinstance(paths, (str, os.PathLike)):
+        paths = [paths]
+    stats = {}
+    for path in paths:
+        with open(path) as f:
+            for line in f:
+                try:
+                    fields = json.loads(line)
+                except ValueError:
+                    # a line cut short by a process that was killed
+                    continue
+                _add(stats, TraceRecord(*(fields[field] for field in TraceRecord._fields)))
+    return stats
+
+
+class Profile:
+    """
+    Records collected by a profile() block.
+    """
+
+    def __init__(self):
+        self.records = []
+
+    def stats(self):
+        """
+        Returns the records added up per name, see trace_stats().
+        """
+        stats = {}
+        for trace_record in self.records:
+            _add(stats, trace_record)
+        return stats
+
+    def report(self):
+        """
+        Returns the added up records as a table, slowest first.
+        """
+        return format_stats(self.stats())
+
+
+@contextlib.contextmanager
+def profile():
+    """
+    Context manager that traces the reads of its block, in all threads of
+    the process:
+
+        >>>with profile() as p:
+        >>>    res = pl2_spikes('data/file.pl2', 0)
+        >>>print(p.report())
+
+    Yields:
+        Profile with the records of the block
+    """
+    profiler = Profile()
+    with _lock:
+        _profiles.append(profiler)
+        _update_enabled()
+    try:
+        yield profiler
+    finally:
+        with _lock:
+            _profiles.remove(profiler)
+            _update_enabled()
+
+
+class span:
+    """
+    Context manager that records the time its block takes, as a step of
+    kind 'api' by default. nbytes can be set within the block:
+
+        >>>with span('PL2File.ad', channel) as s:
+        >>>    ...
+        >>>    s.nbytes = values.nbytes
+    """
+
+    __slots__ = ('name', 'channel', 'kind', 'nbytes', '_wall', '_cpu')
+
+    def __init__(self, name, channel=None, kind='api'):
+        self.name = name
+        self.channel = channel
+        self.kind = kind
+        self.nbytes = 0
+        self._wall = None
+
+    def __enter__(self):
+        if _enabled:
+            self._wall = time.perf_counter()
+            self._cpu = time.thread_time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self._wall is not None:
+            record(self.kind, self.name, _json_channel(self.channel), self.nbytes, time.perf_counter() - self._wall,
+                   time.thread_time() - self._cpu)
+
+
+def _json_channel(channel):
+    if isinstance(channel, bytes):
+        return channel.decode('ascii', 'replace')
+    if isinstance(channel, int) or channel is None:
+        return channel
+    if isinstance(channel, (list, tuple)):
+        return [_json_channel(c) for c in channel]
+    value = getattr(channel, 'value', None)
+    if isinstance(value, int):
+        return value
+    return str(channel)
+
+
+def _call_channel(name, args):
+    if not _CHANNEL_FUNCTION.match(name) or len(args) < 2:
+        return None
+    if name.endswith('BySource') and len(args) > 2:
+        return [_json_channel(args[1]), _json_channel(args[2])]
+    return _json_channel(args[1])
+
+
+def _call_nbytes(args):
+    nbytes = 0
+    for arg in args:
+        # ctypes.byref() arguments keep the referenced object in _obj
+        arg = getattr(arg, '_obj', arg)
+        if isinstance(arg, (_ctypes.Array, _ctypes.Structure)):
+            nbytes += _ctypes.sizeof(arg)
+        elif isinstance(arg, bytes):
+            nbytes += len(arg)
+    return nbytes
+
+
+class _TracedFunction:
+    __slots__ = ('_name', '_function')
+
+    def __init__(self, name, function):
+        object.__setattr__(self, '_name', name)
+        object.__setattr__(self, '_function', function)
+
+    def __getattr__(self, attribute):
+        return getattr(self._function, attribute)
+
+    def __setattr__(self, attribute, value):
+        # argtypes, restype and memsync go to the .dll function
+        setattr(self._function, attribute, value)
+
+    def __call__(self, *args):
+        if not _enabled:
+            return self._function(*args)
+        wall = time.perf_counter()
+        cpu = time.thread_time()
+        try:
+            return self._function(*args)
+        finally:
+            record('dll', self._name, _call_channel(self._name, args), _call_nbytes(args),
+                   time.perf_counter() - wall, time.thread_time() - cpu)
+
+
+class TracedDLL:
+    """
+    Wraps a .dll loaded with ctypes or zugbruecke so that calls of its
+    functions are recorded while tracing is enabled. Setting argtypes,
+    restype or memsync of a function sets them on the wrapped function.
+    """
+
+    def __init__(self, dll):
+        self._dll = dll
+        self._functions = {}
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        function = self._functions.get(name)
+        if function is None:
+            function = self._functions[name] = _TracedFunction(name, getattr(self._dll, name))
+        return function
+
+
+if os.environ.get('PYPL2_TRACE'):
+    enable_tracing(os.environ['PYPL2_TRACE'])
@@ -1,6 +1,8 @@
+import asyncio
 import difflib
 import os.path
 import pathlib
+import struct
 import subprocess
 import sys
 
@@ -17,8 +19,20 @@ if not sys.platform.startswith('win'):
 else:
     import ctypes
 
-from pypl2api import pl2_ad, pl2_spikes, pl2_events, pl2_info
-from pypl2lib import (PyPL2FileReader)
+from pypl2api import (PL2File, PL2FilePool, ScaledArray, TimeIndex, pl2_ad, pl2_ad_multi, pl2_spikes, pl2_events,
+                      pl2_info)
+from pypl2api import Epochs, pl2_start_stop, pl2_epochs
+from pypl2parallel import pl2_read_parallel
+from pypl2export import pl2_export_hdf5, pl2_export_parquet
+from pypl2psth import psth, raster
+from pypl2async import AsyncPL2File, pl2_ad_async
+from pypl2batch import pl2_batch
+from pypl2bench import write_synthetic_pl2, run_benchmarks, run_startup_benchmark
+from pypl2trace import enable_tracing, disable_tracing, load_trace, profile
+import pypl2bench
+import pypl2lib
+from pypl2lib import (PyPL2FileReader, PL2AnalogBlock, PL2SpikeBlock, PL2DigitalBlock,
+                      PL2_BLOCK_TYPE_ANALOG, PL2_START, PL2_STOP, PL2_PAUSE, PL2_RESUME)
 
 
 def dump_loaded_example_data(output_filename):
@@ -268,3 +282,1008 @@ def test_compare_FileReader_analog_data(reader):
         np.testing.assert_array_equal(values['index'], values['name'])
         np.testing.assert_array_equal(values['index'], values['name'])
 
+
+@pytest.fixture()
+def native_reader():
+    filename = pathlib.Path(__file__).parent / 'data' / '4chDemoPL2.pl2'
+    reader = PyPL2FileReader(backend='native')
+    reader.pl2_open_file(filename)
+
+    return reader
+
+
+def test_compare_native_FileReader_file_info(reader, native_reader):
+    assert bytes(reader.pl2_file_info) == bytes(native_reader.pl2_file_info)
+
+
+def test_compare_native_FileReader_channel_infos(reader, native_reader):
+    file_info = reader.pl2_file_info
+
+    for i in range(file_info.m_TotalNumberOfSpikeChannels):
+        assert_object_fields_are_equal(reader.pl2_get_spike_channel_info(i),
+                                       native_reader.pl2_get_spike_channel_info(i))
+
+    for i in range(file_info.m_TotalNumberOfAnalogChannels):
+        assert_object_fields_are_equal(reader.pl2_get_analog_channel_info(i),
+                                       native_reader.pl2_get_analog_channel_info(i))
+
+    for i in range(file_info.m_NumberOfDigitalChannels):
+        assert_object_fields_are_equal(reader.pl2_get_digital_channel_info(i),
+                                       native_reader.pl2_get_digital_channel_info(i))
+
+
+def test_compare_native_FileReader_data(reader, native_reader):
+    file_info = reader.pl2_file_info
+
+    for i in range(file_info.m_TotalNumberOfSpikeChannels):
+        for dll_array, native_array in zip(reader.pl2_get_spike_channel_data(i),
+                                           native_reader.pl2_get_spike_channel_data(i)):
+            np.testing.assert_array_equal(dll_array, native_array)
+
+    for i in range(file_info.m_TotalNumberOfAnalogChannels):
+        for dll_array, native_array in zip(reader.pl2_get_analog_channel_data(i),
+                                           native_reader.pl2_get_analog_channel_data(i)):
+            np.testing.assert_array_equal(dll_array, native_array)
+
+    for i in range(file_info.m_NumberOfDigitalChannels):
+        for dll_array, native_array in zip(reader.pl2_get_digital_channel_data(i),
+                                           native_reader.pl2_get_digital_channel_data(i)):
+            np.testing.assert_array_equal(dll_array, native_array)
+
+
+def known_layout_pdp(pdp_type, source, data=b'', channel=0, count=0, value=0):
+    """
+    Returns a PDP: the 16 byte header and the data padded to 16 bytes.
+    """
+    header = struct.pack('<BBHHHQ', pdp_type, source, len(data) // 2, channel, count, value)
+    return header + data.ljust((len(data) + 15) // 16 * 16, b'\0')
+
+
+def test_native_FileReader_known_layout(tmp_path):
+    # a .pl2 file with one analog and one spike channel, with all fields
+    # written at the byte offsets PL2FileReader.dll reads them from
+    file_info = bytearray(0xb0)
+    file_header = bytearray(0x3a0)
+    file_header[0x000:0x007] = b'comment'
+    file_header[0x100:0x108] = b'OmniPlex'
+    struct.pack_into('<d7I', file_header, 0x178, 40000.0, 2, 1, 1, 1, 1, 0, 1)
+    analog_header = bytearray(0x1f0)
+    analog_header[0x00:0x04] = b'WB01'
+    struct.pack_into('<4I', analog_header, 0x40, 3, 1, 1, 1)
+    analog_header[0x50:0x52] = b'mV'
+    struct.pack_into('<ddIHH', analog_header, 0x60, 1000.0, 0.25, 1, 1, 1)
+    spike_header = bytearray(0xa10)
+    spike_header[0x00:0x05] = b'SPK01'
+    struct.pack_into('<4I', spike_header, 0x40, 6, 1, 1, 1)
+    struct.pack_into('<ddIiI', spike_header, 0x60, 40000.0, 0.5, 4, -30, 1)
+
+    version = known_layout_pdp(0xfe, 0, channel=1)[:10] + b'PLEXON'
+    channel_headers = (known_layout_pdp(0xd3, 0, bytes(file_header))
+                       + known_layout_pdp(0xd4, 3, bytes(analog_header), 1)
+                       + known_layout_pdp(0xd5, 6, bytes(spike_header), 1))
+    first_data_block = len(version) + 16 + len(file_info) + len(channel_headers)
+    analog_block = known_layout_pdp(0x42, 3, struct.pack('<3h', 1, -2, 3), 1, 3, 500)
+    spike_block = known_layout_pdp(0x31, 6, struct.pack('<2Q2H8h', 600, 700, 0, 1, *range(8)), 1, 4, 2)
+    first_summary = first_data_block + len(analog_block) + len(spike_block)
+    summaries = (known_layout_pdp(0xdd, 3, struct.pack('<QQH', first_data_block, 500, 3), 1, 0, 3)
+                 + known_layout_pdp(0xde, 6, struct.pack('<QQH', first_summary - len(spike_block), 600, 2), 1, 0, 2))
+    struct.pack_into('<QQQQQ', file_info, 0x08, first_data_block, 0, first_summary, 100, 900)
+
+    filename = tmp_path / 'known_layout.pl2'
+    filename.write_bytes(version + known_layout_pdp(0xd2, 0, bytes(file_info)) + channel_headers
+                         + analog_block + spike_block + summaries)
+    reader = PyPL2FileReader(backend='native')
+    reader.pl2_open_file(filename)
+
+    file_info = reader.pl2_file_info
+    assert file_info.m_CreatorComment == b'comment'
+    assert file_info.m_CreatorSoftwareName == b'OmniPlex'
+    assert file_info.m_TimestampFrequency == 40000.0
+    assert file_info.m_NumberOfChannelHeaders == 2
+    assert file_info.m_TotalNumberOfSpikeChannels == 1
+    assert file_info.m_TotalNumberOfAnalogChannels == 1
+    assert file_info.m_NumberOfDigitalChannels == 0
+    assert file_info.m_MinimumTrodality == 1
+    assert file_info.m_StartRecordingTime == 100
+    assert file_info.m_DurationOfRecording == 900
+
+    analog_info = reader.pl2_get_analog_channel_info(0)
+    assert (analog_info.m_Name, analog_info.m_Source, analog_info.m_Channel) == (b'WB01', 3, 1)
+    assert analog_info.m_Units == b'mV'
+    assert (analog_info.m_SamplesPerSecond, analog_info.m_CoeffToConvertToUnits) == (1000.0, 0.25)
+    assert analog_info.m_SourceTrodality == 1
+    assert (analog_info.m_OneBasedTrode, analog_info.m_OneBasedChannelInTrode) == (1, 1)
+    assert (analog_info.m_NumberOfValues, analog_info.m_MaximumNumberOfFragments) == (3, 1)
+
+    spike_info = reader.pl2_get_spike_channel_info(0)
+    assert (spike_info.m_Name, spike_info.m_Source, spike_info.m_Channel) == (b'SPK01', 6, 1)
+    assert (spike_info.m_SamplesPerSecond, spike_info.m_CoeffToConvertToUnits) == (40000.0, 0.5)
+    assert (spike_info.m_SamplesPerSpike, spike_info.m_Threshold, spike_info.m_PreThresholdSamples) == (4, -30, 1)
+    assert spike_info.m_NumberOfSpikes == 2
+
+    fragment_timestamps, fragment_counts, values = reader.pl2_get_analog_channel_data(0)
+    assert list(fragment_timestamps) == [500] and list(fragment_counts) == [3]
+    assert list(values) == [1, -2, 3]
+
+    spike_timestamps, units, waveforms = reader.pl2_get_spike_channel_data(0)
+    assert list(spike_timestamps) == [600, 700] and list(units) == [0, 1]
+    assert waveforms.tolist() == [[0, 1, 2, 3], [4, 5, 6, 7]]
+
+    reader.pl2_close_file()
+
+
+def test_compare_native_api():
+    filename = pathlib.Path(__file__).parent / 'data' / '4chDemoPL2.pl2'
+
+    assert pl2_info(filename) == pl2_info(filename, backend='native')
+
+    for dll_field, native_field in zip(pl2_ad(filename, 0), pl2_ad(filename, 0, backend='native')):
+        np.testing.assert_array_equal(dll_field, native_field)
+
+    for dll_field, native_field in zip(pl2_spikes(filename, 0), pl2_spikes(filename, 0, backend='native')):
+        np.testing.assert_array_equal(dll_field, native_field)
+
+    for dll_field, native_field in zip(pl2_events(filename, 'Strobed'),
+                                       pl2_events(filename, 'Strobed', backend='native')):
+        np.testing.assert_array_equal(dll_field, native_field)
+
+
+def test_compare_native_FileReader_memory_map(native_reader):
+    filename = pathlib.Path(__file__).parent / 'data' / '4chDemoPL2.pl2'
+    mapped_reader = PyPL2FileReader(backend='native', memory_map=True)
+    mapped_reader.pl2_open_file(filename)
+    file_info = native_reader.pl2_file_info
+
+    for i in range(file_info.m_TotalNumberOfAnalogChannels):
+        for array, mapped_array in zip(native_reader.pl2_get_analog_channel_data(i),
+                                       mapped_reader.pl2_get_analog_channel_data(i)):
+            np.testing.assert_array_equal(array, mapped_array)
+
+        block_timestamps, block_counts, block_values = mapped_reader.pl2_get_analog_channel_data_views(i)
+        assert all(not values.flags.writeable for values in block_values)
+        np.testing.assert_array_equal(np.concatenate(block_values) if block_values else [],
+                                      native_reader.pl2_get_analog_channel_data(i)[2])
+
+    for i in range(file_info.m_TotalNumberOfSpikeChannels):
+        for array, mapped_array in zip(native_reader.pl2_get_spike_channel_data(i),
+                                       mapped_reader.pl2_get_spike_channel_data(i)):
+            np.testing.assert_array_equal(array, mapped_array)
+
+    for i in range(file_info.m_NumberOfDigitalChannels):
+        for array, mapped_array in zip(native_reader.pl2_get_digital_channel_data(i),
+                                       mapped_reader.pl2_get_digital_channel_data(i)):
+            np.testing.assert_array_equal(array, mapped_array)
+
+    mapped_reader.pl2_close_file()
+
+
+def test_native_FileReader_iter_data_blocks(native_reader):
+    file_info = native_reader.pl2_file_info
+    blocks = list(native_reader.iter_data_blocks())
+
+    for i in range(file_info.m_TotalNumberOfAnalogChannels):
+        channel_info = native_reader.pl2_get_analog_channel_info(i)
+        values = [b.values for b in blocks if isinstance(b, PL2AnalogBlock)
+                  and (b.source, b.channel) == (channel_info.m_Source, channel_info.m_Channel)]
+        if values:
+            np.testing.assert_array_equal(np.concatenate(values),
+                                          native_reader.pl2_get_analog_channel_data(i)[2])
+
+    for i in range(file_info.m_TotalNumberOfSpikeChannels):
+        channel_info = native_reader.pl2_get_spike_channel_info(i)
+        timestamps = [b.timestamps for b in blocks if isinstance(b, PL2SpikeBlock)
+                      and (b.source, b.channel) == (channel_info.m_Source, channel_info.m_Channel)]
+        if timestamps:
+            np.testing.assert_array_equal(np.concatenate(timestamps),
+                                          native_reader.pl2_get_spike_channel_data(i)[0])
+
+    for i in range(file_info.m_NumberOfDigitalChannels):
+        channel_info = native_reader.pl2_get_digital_channel_info(i)
+        timestamps = [b.timestamps for b in blocks if isinstance(b, PL2DigitalBlock)
+                      and (b.source, b.channel) == (channel_info.m_Source, channel_info.m_Channel)]
+        if timestamps:
+            np.testing.assert_array_equal(np.concatenate(timestamps),
+                                          native_reader.pl2_get_digital_channel_data(i)[0])
+
+    analog_blocks = list(native_reader.iter_data_blocks(block_types={PL2_BLOCK_TYPE_ANALOG}))
+    assert len(analog_blocks) == sum(isinstance(b, PL2AnalogBlock) for b in blocks)
+
+
+def test_compare_native_FileReader_iter_data_blocks(reader, native_reader):
+    blocks = list(reader.iter_data_blocks())
+    native_blocks = list(native_reader.iter_data_blocks())
+    assert len(blocks) == len(native_blocks)
+
+    for block, native_block in zip(blocks, native_blocks):
+        assert type(block) is type(native_block)
+        for field, native_field in zip(block, native_block):
+            np.testing.assert_array_equal(field, native_field)
+
+
+def test_WineCopyBuffer(monkeypatch):
+    calls = []
+
+    class Kernel32:
+        def __getattr__(self, name):
+            return lambda *args: calls.append(name) or 1
+
+    monkeypatch.setattr(pypl2lib, '_get_kernel32', lambda: Kernel32())
+    buffer = pypl2lib._WineCopyBuffer()
+
+    # arrays that fit are copied through the same mapping in one call each
+    assert buffer.copy(1, ctypes.c_ulonglong, 10).shape == (10,)
+    assert buffer.copy(1, ctypes.c_short, 40).dtype == np.int16
+    assert calls.count('CreateFileMappingA') == 1 and calls.count('RtlMoveMemory') == 2
+
+    # a larger array replaces the mapping
+    assert buffer.copy(1, ctypes.c_short, 100).shape == (100,)
+    assert calls.count('CreateFileMappingA') == 2 and calls.count('UnmapViewOfFile') == 1
+    buffer.close()
+    assert calls.count('UnmapViewOfFile') == 2
+
+
+@pytest.mark.parametrize('backend', ['dll', 'native'])
+def test_FileReader_analog_data_subset(backend):
+    filename = pathlib.Path(__file__).parent / 'data' / '4chDemoPL2.pl2'
+    reader = PyPL2FileReader(backend=backend)
+    reader.pl2_open_file(filename)
+
+    for i in range(reader.pl2_file_info.m_TotalNumberOfAnalogChannels):
+        fragment_timestamps, fragment_counts, values = reader.pl2_get_analog_channel_data(i)
+        n_values = len(values)
+
+        for start, n in ((0, 10), (n_values // 3, n_values // 3), (n_values - 5, 10)):
+            res = reader.pl2_get_analog_channel_data_subset(i, start, n)
+            subset_timestamps, subset_counts, subset_values = res
+            np.testing.assert_array_equal(subset_values, values[start:start + n])
+            assert subset_counts.sum() == len(subset_values)
+
+        # the whole recording and a window around the first fragment start
+        frequency = reader.pl2_file_info.m_TimestampFrequency
+        res = reader.pl2_get_analog_channel_data_subset_by_time(i)
+        np.testing.assert_array_equal(res[2], values)
+
+        first_timestamp = fragment_timestamps[0] / frequency
+        res = reader.pl2_get_analog_channel_data_subset_by_time(i, first_timestamp, first_timestamp + 0.5)
+        assert res[0][0] == fragment_timestamps[0]
+        np.testing.assert_array_equal(res[2], values[:len(res[2])])
+
+    reader.pl2_close_file()
+
+
+def test_compare_FileReader_analog_fragments(reader, native_reader):
+    # time range reads of the .dll backend don't read the whole channel for its fragments
+    with profile() as p:
+        for i in range(reader.pl2_file_info.m_TotalNumberOfAnalogChannels):
+            for array, native_array in zip(reader._get_analog_channel_fragments(i),
+                                           native_reader._get_analog_channel_fragments(i)):
+                np.testing.assert_array_equal(array, native_array)
+            reader.pl2_get_analog_channel_data_decimated(i, 10, start=0.5, stop=1.0)
+    assert 'PL2_GetAnalogChannelData' not in p.stats()
+
+
+def test_compare_pl2_ad_start_stop():
+    filename = pathlib.Path(__file__).parent / 'data' / '4chDemoPL2.pl2'
+
+    ad = pl2_ad(filename, 0)
+    start = ad.timestamps[0]
+    ad_window = pl2_ad(filename, 0, start=start, stop=start + 1.0)
+
+    assert ad_window.n == min(ad.n, int(round(ad.adfrequency)))
+    np.testing.assert_array_equal(ad_window.ad, ad.ad[:ad_window.n])
+    for dll_field, native_field in zip(ad_window, pl2_ad(filename, 0, start=start, stop=start + 1.0,
+                                                         backend='native')):
+        np.testing.assert_array_equal(dll_field, native_field)
+
+
+@pytest.mark.parametrize('backend', ['dll', 'native'])
+def test_PL2File(backend):
+    filename = pathlib.Path(__file__).parent / 'data' / '4chDemoPL2.pl2'
+
+    with PL2File(filename, backend=backend) as f:
+        info = f.info()
+        assert info == pl2_info(filename, backend=backend)
+
+        for ad in info.ad:
+            for field, expected in zip(f.ad(ad.name), pl2_ad(filename, ad.name, backend=backend)):
+                np.testing.assert_array_equal(field, expected)
+        for spikes in info.spikes:
+            for field, expected in zip(f.spikes(spikes.name), pl2_spikes(filename, spikes.name, backend=backend)):
+                np.testing.assert_array_equal(field, expected)
+        for event in info.events:
+            for field, expected in zip(f.events(event.name), pl2_events(filename, event.name, backend=backend)):
+                np.testing.assert_array_equal(field, expected)
+
+    assert f.reader is None
+    assert f.file_info.m_TotalNumberOfAnalogChannels == len(f.analog_channel_infos)
+
+
+def test_PL2File_read_errors(monkeypatch):
+    filename = pathlib.Path(__file__).parent / 'data' / '4chDemoPL2.pl2'
+
+    with PL2File(filename, backend='native') as f:
+        # reads the reader reports as failed raise instead of unpacking None
+        for method in ('pl2_get_analog_channel_data', 'pl2_get_analog_channel_data_subset_by_time',
+                       'pl2_get_analog_channels_data', '_get_spike_channel_data_selection',
+                       'pl2_get_digital_channel_data'):
+            monkeypatch.setattr(f.reader, method, lambda *args, **kwargs: None)
+        with pytest.raises(IOError):
+            f.ad(0)
+        with pytest.raises(IOError):
+            f.ad(0, start=0.0, stop=1.0)
+        with pytest.raises(IOError):
+            f.ad_multi([0])
+        with pytest.raises(IOError):
+            f.spikes(0)
+        with pytest.raises(IOError):
+            f.spikes(0, waveforms=False)
+        with pytest.raises(IOError):
+            f.events(0)
+
+
+@pytest.mark.parametrize('backend', ['dll', 'native'])
+def test_pl2_ad_multi(backend):
+    filename = pathlib.Path(__file__).parent / 'data' / '4chDemoPL2.pl2'
+
+    with PL2File(filename, backend=backend) as f:
+        indices = [i for i, info in enumerate(f.analog_channel_infos)
+                   if info.m_Name.startswith(b'WB') and info.m_NumberOfValues]
+        source = f.analog_channel_infos[indices[0]].m_Source
+        one_based_channels = [f.analog_channel_infos[i].m_Channel for i in indices]
+        names = [f.analog_channel_infos[i].m_Name.decode('ascii') for i in indices]
+
+    res = pl2_ad_multi(filename, indices, backend=backend, dtype=np.float32)
+    assert res.ad.shape == (len(indices), res.n)
+    assert res.ad.dtype == np.float32
+    for row, index in zip(res.ad, indices):
+        ad = pl2_ad(filename, index, backend=backend)
+        assert res.adfrequency == ad.adfrequency
+        np.testing.assert_array_equal(res.timestamps, ad.timestamps)
+        np.testing.assert_allclose(row, ad.ad, rtol=1e-6)
+
+    np.testing.assert_array_equal(pl2_ad_multi(filename, names, backend=backend).ad, res.ad)
+    np.testing.assert_array_equal(pl2_ad_multi(filename, (source, one_based_channels), backend=backend).ad, res.ad)
+
+    reader = PyPL2FileReader(backend=backend)
+    reader.pl2_open_file(filename)
+    _, _, raw = reader.pl2_get_analog_channels_data(indices)
+    assert raw.dtype == np.int16
+    for row, index in zip(raw, indices):
+        np.testing.assert_array_equal(row, reader.pl2_get_analog_channel_data(index)[2])
+    reader.pl2_close_file()
+
+
+def test_FileReader_analog_channel_indices(native_reader):
+    infos = native_reader._analog_channel_infos
+    assert native_reader._get_analog_channel_indices([1, infos[1].m_Name, (infos[0].m_Source, infos[0].m_Channel)]) \
+        == [1, 1, 0]
+    assert native_reader._get_analog_channel_indices((infos[1].m_Source, [infos[1].m_Channel])) == [1]
+
+    # indices are kept when channels share a name
+    infos[1].m_Name = infos[0].m_Name
+    assert native_reader._get_analog_channel_indices([1, 0]) == [1, 0]
+
+    assert native_reader._get_analog_channel_indices([0, 'no such channel']) is None
+    assert native_reader._get_analog_channel_indices([len(infos)]) is None
+
+    filename = pathlib.Path(__file__).parent / 'data' / '4chDemoPL2.pl2'
+    with PL2File(filename, backend='native') as f:
+        with pytest.raises(KeyError):
+            f.ad_multi([0, 'no such channel'])
+
+
+@pytest.mark.parametrize('pool', ['thread', 'process'])
+@pytest.mark.parametrize('backend', ['dll', 'native'])
+def test_pl2_read_parallel(pool, backend):
+    filename = pathlib.Path(__file__).parent / 'data' / '4chDemoPL2.pl2'
+    info = pl2_info(filename, backend=backend)
+
+    channels = [ad.name for ad in info.ad]
+    res = pl2_read_parallel(filename, channels, max_workers=3, pool=pool, backend=backend)
+    assert len(res) == len(channels)
+    for ad, channel in zip(res, channels):
+        for field, expected in zip(ad, pl2_ad(filename, channel, backend=backend)):
+            np.testing.assert_array_equal(field, expected)
+
+    channels = [spikes.name for spikes in info.spikes]
+    res = pl2_read_parallel([filename, filename], channels, kind='spikes', max_workers=3, pool=pool,
+                            backend=backend)
+    assert len(res) == 2
+    for file_res in res:
+        for spikes, channel in zip(file_res, channels):
+            for field, expected in zip(spikes, pl2_spikes(filename, channel, backend=backend)):
+                np.testing.assert_array_equal(field, expected)
+
+
+def compare_shared_memory_data():
+    filename = pathlib.Path(__file__).parent / 'data' / '4chDemoPL2.pl2'
+    shared_reader = PyPL2FileReader(shared_memory=True)
+    shared_reader.pl2_open_file(filename)
+    native_reader = PyPL2FileReader(backend='native')
+    native_reader.pl2_open_file(filename)
+    file_info = native_reader.pl2_file_info
+
+    for i in range(file_info.m_TotalNumberOfAnalogChannels):
+        for shared, expected in zip(shared_reader.pl2_get_analog_channel_data(i),
+                                    native_reader.pl2_get_analog_channel_data(i)):
+            np.testing.assert_array_equal(shared, expected)
+    for i in range(file_info.m_TotalNumberOfSpikeChannels):
+        for shared, expected in zip(shared_reader.pl2_get_spike_channel_data(i),
+                                    native_reader.pl2_get_spike_channel_data(i)):
+            np.testing.assert_array_equal(shared, expected)
+    for i in range(file_info.m_NumberOfDigitalChannels):
+        for shared, expected in zip(shared_reader.pl2_get_digital_channel_data(i),
+                                    native_reader.pl2_get_digital_channel_data(i)):
+            np.testing.assert_array_equal(shared, expected)
+
+    shared_reader.pl2_close_file()
+    native_reader.pl2_close_file()
+
+
+def test_FileReader_shared_memory():
+    # zugbruecke keeps the argument definitions of a .dll function once it
+    # was called, so the shared memory transport is tested in a new process
+    cmd = 'from test_pypl2 import compare_shared_memory_data; compare_shared_memory_data()'
+    proc = subprocess.run([sys.executable, '-c', cmd], cwd=pathlib.Path(__file__).parent)
+    assert proc.returncode == 0
+
+
+def test_WineSharedMemory_errors(monkeypatch):
+    class Kernel32:
+        def __init__(self, mapping):
+            self.mapping = mapping
+            self.closed = []
+
+        def CreateFileA(self, *args):
+            return 5
+
+        def CreateFileMappingA(self, *args):
+            return self.mapping
+
+        def MapViewOfFile(self, *args):
+            return 0
+
+        def UnmapViewOfFile(self, address):
+            self.closed.append(address)
+
+        def CloseHandle(self, handle):
+            self.closed.append(handle)
+
+    # the handles opened in wine before a failed call are closed again
+    for mapping, closed in ((0, [5]), (6, [6, 5])):
+        kernel32 = Kernel32(mapping)
+        monkeypatch.setattr(pypl2lib, '_get_kernel32', lambda: kernel32)
+        with pytest.raises(IOError):
+            pypl2lib._WineSharedMemory(10, np.int16)
+        assert kernel32.closed == closed
+
+
+def test_pl2_ad_spikes_dtype():
+    filename = pathlib.Path(__file__).parent / 'data' / '4chDemoPL2.pl2'
+
+    ad = pl2_ad(filename, 0)
+    ad64 = pl2_ad(filename, 0, dtype=np.float64)
+    ad32 = pl2_ad(filename, 0, dtype=np.float32)
+    assert isinstance(ad.ad, ScaledArray)
+    assert ad.ad.raw.dtype == np.int16
+    assert ad64.ad.dtype == np.float64 and ad32.ad.dtype == np.float32
+    np.testing.assert_array_equal(ad.ad, ad64.ad)
+    np.testing.assert_array_equal(ad.ad[100:200], ad64.ad[100:200])
+    np.testing.assert_array_equal(ad.ad * 1000, ad64.ad * 1000)
+    np.testing.assert_allclose(ad32.ad, ad64.ad, rtol=1e-6)
+
+    spikes = pl2_spikes(filename, 0)
+    spikes64 = pl2_spikes(filename, 0, dtype=np.float64)
+    assert isinstance(spikes.waveforms, ScaledArray)
+    assert spikes.n == spikes64.n
+    np.testing.assert_array_equal(spikes.waveforms, spikes64.waveforms)
+    np.testing.assert_array_equal(spikes.waveforms[10], spikes64.waveforms[10])
+
+
+def test_ScaledArray():
+    raw = np.arange(-6, 6, dtype=np.int16)
+    scaled = ScaledArray(raw, 0.5)
+    values = raw * 0.5
+
+    reshaped = scaled.reshape(3, 4)
+    assert isinstance(reshaped, ScaledArray) and reshaped.raw.base is raw
+    np.testing.assert_array_equal(reshaped, values.reshape(3, 4))
+    np.testing.assert_array_equal(reshaped.T, values.reshape(3, 4).T)
+    np.testing.assert_array_equal(reshaped.ravel(), values)
+    np.testing.assert_array_equal(reshaped.mean(axis=0), values.reshape(3, 4).mean(axis=0))
+    assert reshaped.std() == values.std() and reshaped.sum() == values.sum()
+    assert (scaled.min(), scaled.max(), scaled.argmax()) == (-3.0, 2.5, 11)
+    assert scaled.tolist() == values.tolist()
+    assert np.asarray(scaled).flags.c_contiguous
+
+    # per row coefficients are converted before rearranging
+    rows = ScaledArray(raw.reshape(3, 4), np.array([[1.0], [2.0], [3.0]]))
+    np.testing.assert_array_equal(rows.reshape(4, 3), (raw.reshape(3, 4) * [[1.0], [2.0], [3.0]]).reshape(4, 3))
+
+
+@pytest.mark.parametrize('backend', ['dll', 'native'])
+def test_FileReader_sidecar_index(backend, tmp_path):
+    filename = tmp_path / '4chDemoPL2.pl2'
+    filename.write_bytes((pathlib.Path(__file__).parent / 'data' / '4chDemoPL2.pl2').read_bytes())
+
+    expected = pl2_info(filename, backend=backend)
+    for _ in range(2):
+        # the first open writes the index, the second one reads it
+        with PL2File(filename, backend=backend, sidecar_index=True) as f:
+            assert (tmp_path / '4chDemoPL2.pl2.idx').exists()
+            assert f.info() == expected
+            for ad in expected.ad:
+                for field, expected_field in zip(f.ad(ad.name), pl2_ad(filename, ad.name, backend=backend)):
+                    np.testing.assert_array_equal(field, expected_field)
+            for spikes in expected.spikes:
+                for field, expected_field in zip(f.spikes(spikes.name),
+                                                 pl2_spikes(filename, spikes.name, backend=backend)):
+                    np.testing.assert_array_equal(field, expected_field)
+
+
+@pytest.mark.parametrize('backend', ['dll', 'native'])
+def test_FileReader_spike_data_chunks(backend):
+    filename = pathlib.Path(__file__).parent / 'data' / '4chDemoPL2.pl2'
+    reader = PyPL2FileReader(backend=backend)
+    reader.pl2_open_file(filename)
+
+    for i in range(reader.pl2_file_info.m_TotalNumberOfSpikeChannels):
+        expected = reader.pl2_get_spike_channel_data(i)
+        for chunk_size in (1, 3, 7, len(expected[0]) + 1):
+            chunks = list(reader._get_spike_channel_data_chunks(i, chunk_size))
+            assert all(len(chunk[0]) <= chunk_size for chunk in chunks)
+            for field, expected_field in zip(zip(*chunks), expected):
+                np.testing.assert_array_equal(np.concatenate(field), expected_field)
+
+    assert reader._get_spike_channel_data_chunks(reader.pl2_file_info.m_TotalNumberOfSpikeChannels, 3) is None
+    reader.pl2_close_file()
+
+
+@pytest.mark.parametrize('backend', ['dll', 'native'])
+def test_pl2_export_hdf5(backend, tmp_path):
+    h5py = pytest.importorskip('h5py')
+    filename = pathlib.Path(__file__).parent / 'data' / '4chDemoPL2.pl2'
+    output_filename = tmp_path / '4chDemoPL2.h5'
+
+    # a small chunk size, so analog channels are exported in many chunks
+    pl2_export_hdf5(filename, output_filename, chunk_size=1000, max_workers=2, backend=backend)
+
+    reader = PyPL2FileReader(backend=backend)
+    reader.pl2_open_file(filename)
+    with h5py.File(output_filename, 'r') as output:
+        for ad in pl2_info(filename, backend=backend).ad:
+            group = output['analog'][ad.name]
+            fragment_timestamps, fragment_counts, values = reader.pl2_get_analog_channel_data_by_name(ad.name)
+            np.testing.assert_array_equal(group['values'], values)
+            np.testing.assert_array_equal(group['fragment_timestamps'], fragment_timestamps)
+            np.testing.assert_array_equal(group['fragment_counts'], fragment_counts)
+        for spikes in pl2_info(filename, backend=backend).spikes:
+            group = output['spikes'][spikes.name]
+            for name, expected in zip(('timestamps', 'units', 'waveforms'),
+                                      reader.pl2_get_spike_channel_data_by_name(spikes.name)):
+                np.testing.assert_array_equal(group[name], expected)
+        for event in pl2_info(filename, backend=backend).events:
+            group = output['events'][event.name]
+            for name, expected in zip(('timestamps', 'values'),
+                                      reader.pl2_get_digital_channel_data_by_name(event.name)):
+                np.testing.assert_array_equal(group[name], expected)
+    reader.pl2_close_file()
+
+
+@pytest.mark.parametrize('backend', ['dll', 'native'])
+def test_pl2_export_parquet(backend, tmp_path):
+    pq = pytest.importorskip('pyarrow.parquet')
+    filename = pathlib.Path(__file__).parent / 'data' / '4chDemoPL2.pl2'
+    spikes_filename = tmp_path / 'spikes.parquet'
+    events_filename = tmp_path / 'events.parquet'
+
+    pl2_export_parquet(filename, spikes_filename, events_filename, waveforms=True, backend=backend)
+
+    info = pl2_info(filename, backend=backend)
+    reader = PyPL2FileReader(backend=backend)
+    reader.pl2_open_file(filename)
+    timestamp_frequency = reader.pl2_file_info.m_TimestampFrequency
+
+    spikes = pq.read_table(spikes_filename).to_pydict()
+    channels = np.array(spikes['channel'])
+    assert pq.ParquetFile(spikes_filename).metadata.num_row_groups == len(info.spikes)
+    for channel in info.spikes:
+        mask = channels == channel.name
+        timestamps, units, waveforms = reader.pl2_get_spike_channel_data_by_name(channel.name)
+        np.testing.assert_array_equal(np.array(spikes['timestamp_ticks'])[mask], timestamps)
+        np.testing.assert_allclose(np.array(spikes['timestamp_s'])[mask], timestamps / timestamp_frequency)
+        np.testing.assert_array_equal(np.array(spikes['unit'])[mask], units)
+        np.testing.assert_array_equal(np.array(spikes['waveform'])[mask], waveforms)
+
+    events = pq.read_table(events_filename).to_pydict()
+    channels = np.array(events['channel'])
+    for channel in info.events:
+        mask = channels == channel.name
+        timestamps, values = reader.pl2_get_digital_channel_data_by_name(channel.name)
+        np.testing.assert_array_equal(np.array(events['timestamp_ticks'])[mask], timestamps)
+        np.testing.assert_allclose(np.array(events['timestamp_s'])[mask], timestamps / timestamp_frequency)
+        np.testing.assert_array_equal(np.array(events['value'])[mask], values)
+    reader.pl2_close_file()
+
+
+def test_TimeIndex():
+    # three fragments with gaps, 2 samples per second
+    index = TimeIndex([1.0, 5.0, 7.5], [4, 3, 2], 2.0)
+    times = np.concatenate([start + np.arange(count) / 2.0 for start, count in ((1.0, 4), (5.0, 3), (7.5, 2))])
+    assert len(index) == 9
+    np.testing.assert_array_equal(index, times)
+    np.testing.assert_array_equal(index[2:7:2], times[2:7:2])
+    assert index[-1] == times[-1]
+    np.testing.assert_array_equal(index.fragment([0, 3, 4, 8]), [0, 0, 1, 2])
+    np.testing.assert_array_equal(index.time_to_sample(times), np.arange(9))
+    # times before, between and after the fragments
+    np.testing.assert_array_equal(index.time_to_sample([0.0, 2.6, 4.9, 6.2, 20.0]), [0, 4, 4, 7, 9])
+    assert index.slice(2.0, 5.6) == slice(2, 6)
+    with pytest.raises(IndexError):
+        index[9]
+
+    filename = pathlib.Path(__file__).parent / 'data' / '4chDemoPL2.pl2'
+    ad = pl2_ad(filename, 0)
+    index = TimeIndex.from_ad(ad)
+    assert len(index) == ad.n
+    expected = np.concatenate([start + np.arange(count) / ad.adfrequency
+                               for start, count in zip(ad.timestamps, ad.fragmentcounts)])
+    np.testing.assert_allclose(index[:], expected)
+
+
+def test_psth_raster():
+    rng = np.random.default_rng(0)
+    spike_timestamps = np.sort(rng.uniform(0, 100, 5000))
+    event_timestamps = np.sort(rng.uniform(1, 99, 200))
+    window = (-0.5, 1.0)
+
+    res = psth(spike_timestamps, event_timestamps, window, 0.1)
+    assert res.counts.shape == (200, 15)
+    assert len(res.bin_edges) == 16
+    for i, event_timestamp in enumerate(event_timestamps):
+        expected, _ = np.histogram(spike_timestamps - event_timestamp, res.bin_edges)
+        np.testing.assert_array_equal(res.counts[i], expected)
+
+    rast = raster(spike_timestamps, event_timestamps, window)
+    np.testing.assert_array_equal(rast.counts, res.counts.sum(axis=1))
+    for i, event_timestamp in enumerate(event_timestamps):
+        in_window = (spike_timestamps >= event_timestamp - 0.5) & (spike_timestamps < event_timestamp + 1.0)
+        np.testing.assert_allclose(rast.offsets[rast.trials == i], spike_timestamps[in_window] - event_timestamp)
+
+    # several units and event types in one call
+    units = [spike_timestamps[::2], spike_timestamps[1::2]]
+    event_types = [event_timestamps[:50], event_timestamps[50:]]
+    res = psth(units, event_types, window, 0.1)
+    assert [counts.shape for counts in res.counts] == [(2, 50, 15), (2, 150, 15)]
+    np.testing.assert_array_equal(res.counts[1][0], psth(units[0], event_types[1], window, 0.1).counts)
+    rasts = raster(units, event_types, window)
+    np.testing.assert_array_equal(rasts[1][0].offsets, raster(units[1], event_types[0], window).offsets)
+
+
+@pytest.mark.parametrize('backend', ['dll', 'native'])
+def test_pl2_spikes_unit_waveforms(backend):
+    filename = pathlib.Path(__file__).parent / 'data' / '4chDemoPL2.pl2'
+
+    spikes = pl2_spikes(filename, 0, backend=backend)
+    units = np.asarray(spikes.units)
+    for unit in ([0], 1, [1, 2]):
+        selected = np.isin(units, unit)
+        res = pl2_spikes(filename, 0, unit=unit, backend=backend)
+        np.testing.assert_array_equal(res.timestamps, spikes.timestamps[selected])
+        np.testing.assert_array_equal(res.units, units[selected])
+        np.testing.assert_array_equal(res.waveforms, np.asarray(spikes.waveforms)[selected])
+
+        # n is the number of waveform values, with or without waveforms
+        res = pl2_spikes(filename, 0, unit=unit, backend=backend, waveforms=False)
+        assert res.n == selected.sum() * spikes.waveforms.shape[1] == np.size(np.asarray(spikes.waveforms)[selected])
+        assert res.waveforms is None
+        np.testing.assert_array_equal(res.timestamps, spikes.timestamps[selected])
+        np.testing.assert_array_equal(res.units, units[selected])
+
+
+@pytest.mark.parametrize('backend', ['dll', 'native'])
+def test_AsyncPL2File(backend):
+    filename = pathlib.Path(__file__).parent / 'data' / '4chDemoPL2.pl2'
+    expected = pl2_info(filename, backend=backend)
+
+    async def read():
+        async with AsyncPL2File(filename, backend=backend, max_concurrency=2) as f:
+            assert f.file_info.m_TotalNumberOfAnalogChannels == len(f.analog_channel_infos)
+            ads = await asyncio.gather(*(f.ad(ad.name) for ad in expected.ad))
+            spikes = await asyncio.gather(*(f.spikes(spikes.name) for spikes in expected.spikes))
+            events = await asyncio.gather(*(f.events(event.name) for event in expected.events))
+        # module level functions
+        ads_async = await asyncio.gather(*(pl2_ad_async(filename, ad.name, backend=backend) for ad in expected.ad))
+        return ads, spikes, events, ads_async
+
+    ads, spikes, events, ads_async = asyncio.run(read())
+    for ad, ad_async, ad_info in zip(ads, ads_async, expected.ad):
+        for field, field_async, expected_field in zip(ad, ad_async, pl2_ad(filename, ad_info.name, backend=backend)):
+            np.testing.assert_array_equal(field, expected_field)
+            np.testing.assert_array_equal(field_async, expected_field)
+    for res, spike_info in zip(spikes, expected.spikes):
+        for field, expected_field in zip(res, pl2_spikes(filename, spike_info.name, backend=backend)):
+            np.testing.assert_array_equal(field, expected_field)
+    for res, event_info in zip(events, expected.events):
+        for field, expected_field in zip(res, pl2_events(filename, event_info.name, backend=backend)):
+            np.testing.assert_array_equal(field, expected_field)
+
+
+@pytest.mark.parametrize('backend', ['dll', 'native'])
+def test_PL2FilePool(backend, tmp_path):
+    data = (pathlib.Path(__file__).parent / 'data' / '4chDemoPL2.pl2').read_bytes()
+    filenames = []
+    for i in range(4):
+        filenames.append(tmp_path / f'file{i}.pl2')
+        filenames[-1].write_bytes(data)
+    expected = pl2_ad(filenames[0], 0, backend=backend)
+
+    with PL2FilePool(max_open=2, backend=backend) as pool:
+        # files in use stay open, closing one must not affect the others
+        with pool.open(filenames[0]) as f0, pool.open(filenames[1]) as f1, pool.open(filenames[2]) as f2:
+            assert len(pool) == 3
+            f1.close()
+            for f in (f0, f2):
+                np.testing.assert_array_equal(f.ad(0).ad, expected.ad)
+        assert len(pool) == 2
+
+        for filename in filenames:
+            with pool.open(filename) as f:
+                np.testing.assert_array_equal(f.ad(0).ad, expected.ad)
+        # the least recently used files were closed
+        assert [filename in pool for filename in filenames] == [False, False, True, True]
+        assert pool.acquire(filenames[3]) is f
+        pool.release(filenames[3])
+        with pytest.raises(ValueError):
+            pool.release(filenames[3])
+
+
+def batch_number_of_values(f, channel):
+    # module level, so pl2_batch worker processes can unpickle it
+    return f.ad(channel).n
+
+
+@pytest.mark.parametrize('backend', ['dll', 'native'])
+def test_pl2_batch(backend, tmp_path):
+    data = (pathlib.Path(__file__).parent / 'data' / '4chDemoPL2.pl2').read_bytes()
+    (tmp_path / 'sub').mkdir()
+    filenames = [tmp_path / 'a.pl2', tmp_path / 'sub' / 'b.pl2']
+    for filename in filenames:
+        filename.write_bytes(data)
+    manifest = tmp_path / 'manifest.jsonl'
+    expected = {(os.path.realpath(filename), ad.name): ad.n for filename in filenames
+                for ad in pl2_info(filename, backend=backend).ad}
+
+    res = pl2_batch(tmp_path, batch_number_of_values, manifest, per_channel='ad', max_workers=2,
+                    backend=backend)
+    assert res.results == expected
+    assert res.failed == {}
+
+    # everything is recorded as done, a rerun has nothing to do
+    res = pl2_batch(tmp_path, batch_number_of_values, manifest, per_channel='ad', max_workers=2,
+                    backend=backend)
+    assert res.results == {} and res.failed == {}
+
+    # changed files are processed again
+    filenames[1].write_bytes(data + bytes(16))
+    res = pl2_batch(tmp_path, batch_number_of_values, manifest, per_channel='ad', max_workers=2,
+                    backend=backend)
+    assert set(res.results) == {key for key in expected if key[0] == os.path.realpath(filenames[1])}
+
+
+def test_write_synthetic_pl2(tmp_path):
+    filename = tmp_path / 'synthetic.pl2'
+    write_synthetic_pl2(filename, analog_channels=3, sample_rate=1000.0, duration=6.0, spike_channels=2,
+                        spike_rate=50.0, samples_per_spike=16, event_channels=2, event_rate=5.0, fragments=3,
+                        gap=2.0, block_size=500)
+
+    info = pl2_info(filename, backend='native')
+    assert [ad.name for ad in info.ad] == ['WB01', 'WB02', 'WB03']
+    assert all(ad.n == 6000 for ad in info.ad)
+    ad = pl2_ad(filename, 'WB01', backend='native')
+    assert ad.adfrequency == 1000.0
+    np.testing.assert_array_equal(ad.fragmentcounts, [2000, 2000, 2000])
+    # fragments of 2 s, separated by pauses of 2 s
+    np.testing.assert_allclose(np.diff(ad.timestamps), [4.0, 4.0])
+
+    fragment_ends = ad.timestamps + ad.fragmentcounts / ad.adfrequency
+    for spike_info in info.spikes:
+        spikes = pl2_spikes(filename, spike_info.name, backend='native')
+        assert spikes.waveforms.shape == (len(spikes.timestamps), 16)
+        assert tuple(np.bincount(spikes.units, minlength=4)) == spike_info.units[:4]
+        assert np.all(np.diff(spikes.timestamps) >= 0)
+        in_fragment = (spikes.timestamps[:, np.newaxis] >= ad.timestamps) & \
+                      (spikes.timestamps[:, np.newaxis] < fragment_ends)
+        assert in_fragment.any(axis=1).all()
+    for event_info in info.events:
+        assert pl2_events(filename, event_info.name, backend='native').n == event_info.n
+
+    rows = run_benchmarks(filename, backends=['native'], operations=['pl2_info', 'pl2_ad'], repeat=2)
+    assert [(row['backend'], row['operation'], row['calls']) for row in rows] == [('native', 'pl2_info', 2),
+                                                                                ('native', 'pl2_ad', 6)]
+    assert rows[1]['mb_per_s'] > 0
+    assert rows[1]['p50_ms'] <= rows[1]['p90_ms'] <= rows[1]['p99_ms']
+
+    # the .dll backend is not benchmarked on synthetic files
+    with pytest.raises(SystemExit):
+        pypl2bench.main(['--backends', 'dll', '--duration', '1'])
+
+
+@pytest.mark.parametrize('backend', ['dll', 'native'])
+def test_trace(backend, tmp_path):
+    filename = pathlib.Path(__file__).parent / 'data' / '4chDemoPL2.pl2'
+    with profile() as p:
+        spikes = pl2_spikes(filename, 0, backend=backend)
+        pl2_ad(filename, 0, backend=backend)
+    stats = p.stats()
+    assert stats['PL2File.spikes'].calls == 1
+    assert stats['PL2File.spikes'].nbytes >= spikes.waveforms.raw.nbytes
+    assert stats['PL2File.spikes'].wall_s >= stats['PL2File.spikes/convert'].wall_s
+    assert stats['PL2File.ad'].kind == 'api'
+    if backend == 'dll':
+        assert stats['PL2_GetSpikeChannelData'].kind == 'dll'
+        assert stats['PL2_GetSpikeChannelData'].nbytes >= spikes.waveforms.raw.nbytes
+        assert any(r.name == 'PL2_GetSpikeChannelData' and r.channel == 0 for r in p.records)
+    assert 'PL2File.spikes' in p.report()
+
+    # nothing is recorded outside of profile() blocks
+    pl2_events(filename, 0, backend=backend)
+    assert 'PL2File.events' not in p.stats()
+
+    trace_file = tmp_path / 'trace-{pid}.jsonl'
+    enable_tracing(trace_file)
+    try:
+        pl2_ad(filename, 0, backend=backend)
+    finally:
+        disable_tracing()
+    stats = load_trace(list(tmp_path.glob('trace-*.jsonl')))
+    assert stats['PL2File.ad'].calls == 1
+
+
+def test_lazy_dll_loading():
+    # importing pypl2 and creating a reader neither starts wine nor loads the .dll
+    code = ('import pypl2lib; reader = pypl2lib.PyPL2FileReader(); '
+            'print(pypl2lib._session is None and reader._pl2_dll is None)')
+    res = subprocess.run([sys.executable, '-c', code], cwd=pathlib.Path(__file__).parent, capture_output=True,
+                         text=True)
+    assert res.stdout.strip() == 'True', res.stderr
+
+    # all readers of a process share the .dll loaded through zugbruecke
+    if not sys.platform.startswith('win'):
+        assert PyPL2FileReader().pl2_dll._dll is PyPL2FileReader().pl2_dll._dll
+
+    rows = run_startup_benchmark(modules=['pypl2api'], repeat=2)
+    assert [(row['operation'], row['calls']) for row in rows] == [('import pypl2api', 2)]
+    assert 0 < rows[0]['p50_ms'] <= rows[0]['p99_ms']
+
+
+@pytest.mark.parametrize('backend, reader_options', [('dll', {}), ('dll', {'rpc': True}), ('native', {})])
+def test_FileReader_call_batch(backend, reader_options):
+    filename = pathlib.Path(__file__).parent / 'data' / '4chDemoPL2.pl2'
+    reader = PyPL2FileReader(backend=backend)
+    reader.pl2_open_file(filename)
+    # with rpc=True the channel infos are read in one batch by the helper process
+    batched_reader = PyPL2FileReader(backend=backend, **reader_options)
+    batched_reader.pl2_open_file(filename)
+    assert bytes(batched_reader.pl2_file_info) == bytes(reader.pl2_file_info)
+
+    file_info = reader.pl2_file_info
+    n_channels = {'analog': file_info.m_TotalNumberOfAnalogChannels,
+                  'spike': file_info.m_TotalNumberOfSpikeChannels,
+                  'digital': file_info.m_NumberOfDigitalChannels}
+    batch = batched_reader.pl2_call_batch()
+    expected = []
+    for channel_type, n in n_channels.items():
+        for i in range(n):
+            getattr(batch, f'pl2_get_{channel_type}_channel_info')(i)
+            getattr(batch, f'pl2_get_{channel_type}_channel_data')(i)
+            expected.append(getattr(reader, f'pl2_get_{channel_type}_channel_info')(i))
+            expected.append(getattr(reader, f'pl2_get_{channel_type}_channel_data')(i))
+    assert len(batch) == len(expected)
+    results = batch.run()
+    assert not len(batch)
+
+    for res, expected_res in zip(results, expected):
+        if isinstance(expected_res, tuple):
+            for field, expected_field in zip(res, expected_res):
+                np.testing.assert_array_equal(field, expected_field)
+        else:
+            assert bytes(res) == bytes(expected_res)
+    batched_reader.pl2_close_file()
+    reader.pl2_close_file()
+
+
+def test_epochs(tmp_path):
+    filename = tmp_path / 'synthetic.pl2'
+    write_synthetic_pl2(filename, analog_channels=2, sample_rate=1000.0, duration=6.0, spike_channels=1,
+                        spike_rate=50.0, samples_per_spike=16, event_channels=1, event_rate=5.0, fragments=3,
+                        gap=2.0, block_size=500)
+
+    res = pl2_start_stop(filename, backend='native')
+    assert res.n == 6
+    np.testing.assert_array_equal(res.values, [PL2_START, PL2_PAUSE, PL2_RESUME, PL2_PAUSE, PL2_RESUME, PL2_STOP])
+    epochs = pl2_epochs(filename, backend='native')
+    ad = pl2_ad(filename, 'WB01', backend='native')
+    assert list(epochs) == list(zip(ad.timestamps, ad.timestamps + ad.fragmentcounts / ad.adfrequency))
+
+    # a start after a stop, repeated pauses and an epoch still open at the end
+    epochs = Epochs.from_events([0.0, 1.0, 2.0, 3.0, 4.0, 5.0],
+                                [PL2_STOP, PL2_START, PL2_PAUSE, PL2_PAUSE, PL2_RESUME, PL2_START], end=9.0)
+    assert list(epochs) == [(1.0, 2.0), (4.0, 9.0)]
+    assert epochs.duration == 6.0
+    np.testing.assert_array_equal(epochs.index([0.5, 1.0, 2.0, 4.5, 9.0]), [-1, 0, -1, 1, -1])
+    # overlapping intervals are merged
+    assert list(Epochs([3.0, 1.0, 2.0], [4.0, 2.5, 2.7])) == [(1.0, 2.7), (3.0, 4.0)]
+
+    # epochs that cut the fragments of the continuous channels
+    epochs = Epochs([1.0, 5.2], [1.5, 9.0])
+    restricted = epochs.restrict(ad)
+    np.testing.assert_allclose(restricted.timestamps, [1.0, 5.2, 8.5])
+    np.testing.assert_array_equal(restricted.fragmentcounts, [500, 1300, 500])
+    mask = epochs.sample_mask(ad)
+    np.testing.assert_array_equal(restricted.ad.raw, ad.ad.raw[mask])
+    assert epochs.sample_slices(ad) == [slice(500, 1000), slice(2700, 4500)]
+    np.testing.assert_array_equal(np.flatnonzero(mask), np.r_[500:1000, 2700:4500])
+    multi = epochs.restrict(pl2_ad_multi(filename, ['WB01', 'WB02'], backend='native'))
+    np.testing.assert_array_equal(multi.ad.raw[0], restricted.ad.raw)
+
+    spikes = pl2_spikes(filename, 0, backend='native')
+    restricted = epochs.restrict(spikes)
+    keep = ((spikes.timestamps >= 1.0) & (spikes.timestamps < 1.5)) | \
+           ((spikes.timestamps >= 5.2) & (spikes.timestamps < 9.0))
+    np.testing.assert_array_equal(restricted.timestamps, spikes.timestamps[keep])
+    np.testing.assert_array_equal(restricted.waveforms.raw, spikes.waveforms.raw[keep])
+    assert restricted.n == restricted.waveforms.size
+    assert epochs.restrict(pl2_spikes(filename, 0, backend='native', waveforms=False)).n == restricted.n
+    assert [len(spikes.timestamps[s]) for s in epochs.slices(spikes.timestamps)] == [
+        np.count_nonzero(keep & (spikes.timestamps < 1.5)), np.count_nonzero(keep & (spikes.timestamps >= 5.2))]
+    events = pl2_events(filename, 0, backend='native')
+    restricted = epochs.restrict(events)
+    np.testing.assert_array_equal(restricted.values, events.values[epochs.mask(events.timestamps)])
+    assert restricted.n == len(restricted.timestamps)
+
+
+def test_pl2_ad_decimate(tmp_path, monkeypatch):
+    filename = tmp_path / 'synthetic.pl2'
+    write_synthetic_pl2(filename, analog_channels=1, sample_rate=40000.0, duration=3.0, spike_channels=0,
+                        event_channels=0, fragments=3, gap=1.0, block_size=4000)
+    ad = pl2_ad(filename, 0, backend='native')
+
+    # each fragment filtered at once, with its ends extended
+    taps = pypl2lib._lowpass_taps(40)
+    half = len(taps) // 2
+    fragment_starts = np.cumsum(ad.fragmentcounts) - ad.fragmentcounts
+    expected = np.concatenate([
+        np.convolve(np.pad(ad.ad.raw[start:start + count].astype(np.float64), half, mode='edge'), taps,
+                    'valid')[::40] for start, count in zip(fragment_starts, ad.fragmentcounts)])
+
+    res = pl2_ad(filename, 0, backend='native', target_rate=1000.0)
+    assert res.adfrequency == 1000.0
+    np.testing.assert_array_equal(res.timestamps, ad.timestamps)
+    np.testing.assert_array_equal(res.fragmentcounts, ad.fragmentcounts // 40)
+    np.testing.assert_allclose(res.ad.raw, expected, atol=1e-9)
+    np.testing.assert_allclose(res.ad, expected * res.ad.coeff, atol=1e-15)
+
+    # chunks that end within blocks and fragments give the same values
+    monkeypatch.setattr(pypl2lib, 'DECIMATION_CHUNK_SIZE', 3001)
+    chunked = pl2_ad(filename, 0, backend='native', decimate=40, dtype=np.float32)
+    assert chunked.ad.dtype == np.float32
+    np.testing.assert_array_equal(chunked.fragmentcounts, res.fragmentcounts)
+    np.testing.assert_allclose(chunked.ad, np.asarray(res.ad), rtol=1e-5)
+
+    # a part of the channel, and a sine below and above the new Nyquist frequency
+    part = pl2_ad(filename, 0, backend='native', decimate=3, start=1.0, stop=3.5)
+    np.testing.assert_allclose(part.timestamps, [1.0, 2.1])
+    np.testing.assert_array_equal(part.fragmentcounts, [-(-4000 // 3), -(-40000 // 3)])
+    t = np.arange(40000) / 40000.0
+    for frequency, amplitude in ((100.0, 1.0), (2000.0, 0.0)):
+        decimator = pypl2lib._Decimator(40, taps)
+        filtered = np.concatenate((decimator.process(np.sin(2 * np.pi * frequency * t)), decimator.finish()))
+        assert len(filtered) == 1000
+        np.testing.assert_allclose(filtered[100:-100], amplitude * np.sin(2 * np.pi * frequency * t[::40][100:-100]),
+                                   atol=1e-2)
+
+    with pytest.raises(ValueError):
+        pl2_ad(filename, 0, backend='native', target_rate=3000.0)
+    with pytest.raises(ValueError):
+        pl2_ad(filename, 0, backend='native', decimate=4, target_rate=10000.0)